@@ -0,0 +1,201 @@
+import asyncio, re, time
+from RegexMessageTracker import RegexMessageTracker
+from DeviceLogger import DeviceLogger
+from ConfigurationLoader import ConfigLoader
+from DeviceOutput import DeviceOutput
+from LineAssembler import LineAssembler, DEFAULT_PROMPT_REGEX
+from Stats import Stats
+from BringUp import collect_credentials
+
+PROMPT_REGEX = re.compile(r"[>#]\s*$")
+
+class AsyncSSHSession:
+    """
+    Interactive shell on a device over asyncssh, with just enough of netmiko's behaviour
+    (prompt detection, enable, send_command) for the monitoring lifecycle.
+    """
+
+    def __init__(self, device, command_timeout=30):
+        self.device = device
+        self.command_timeout = command_timeout
+        self.conn = None
+        self.process = None
+
+    async def connect(self):
+        # asyncssh is only needed when the asyncio engine talks to real devices
+        import asyncssh
+        self.conn = await asyncssh.connect(
+            self.device['ip'], port=self.device.get('port', 22),
+            username=self.device['username'], password=self.device['password'],
+            known_hosts=None)
+        self.process = await self.conn.create_process(term_type='vt100')
+        await self._read_until(PROMPT_REGEX)
+        await self.send_command('terminal length 0')
+
+    async def _read_until(self, pattern):
+        output = ""
+        while not pattern.search(output):
+            chunk = await asyncio.wait_for(self.process.stdout.read(65536), self.command_timeout)
+            if not chunk:
+                raise ConnectionError(f"Connection to {self.device['ip']} closed")
+            output += chunk
+        return output
+
+    async def enable(self):
+        self.process.stdin.write("enable\n")
+        output = await self._read_until(re.compile(r"[Pp]assword:\s*$|#\s*$"))
+        if not output.rstrip().endswith('#'):
+            self.process.stdin.write(f"{self.device['secret']}\n")
+            await self._read_until(re.compile(r"#\s*$"))
+
+    async def send_command(self, command):
+        self.process.stdin.write(f"{command}\n")
+        return await self._read_until(PROMPT_REGEX)
+
+    async def read(self, timeout):
+        """ Returns the next output from the device, or an empty string after timeout seconds. """
+        try:
+            chunk = await asyncio.wait_for(self.process.stdout.read(65536), timeout)
+        except asyncio.TimeoutError:
+            return ""
+        if not chunk and self.process.stdout.at_eof():
+            raise ConnectionError(f"Connection to {self.device['ip']} closed")
+        return chunk
+
+    async def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            await self.conn.wait_closed()
+
+class SimulatedSession:
+    """
+    Local stand-in for a device: answers every command with an empty output and streams
+    the lines of a capture file as terminal monitor output at a fixed rate.
+    Used to exercise the engine and measure its cost per device without real hardware.
+    """
+
+    def __init__(self, device, lines, lines_per_second=10):
+        self.device = device
+        self.lines = lines
+        self.interval = 1 / lines_per_second
+        self.position = 0
+        self.next_line_time = None
+
+    async def connect(self):
+        await asyncio.sleep(0)
+        self.next_line_time = time.monotonic()
+
+    async def enable(self):
+        await asyncio.sleep(0)
+
+    async def send_command(self, command):
+        await asyncio.sleep(0)
+        return ""
+
+    async def read(self, timeout):
+        delay = self.next_line_time - time.monotonic()
+        if delay > timeout:
+            await asyncio.sleep(timeout)
+            return ""
+        if delay > 0:
+            await asyncio.sleep(delay)
+        # Hand back every line that has come due, the way a real channel batches output
+        output = []
+        now = time.monotonic()
+        while self.next_line_time <= now:
+            output.append(self.lines[self.position % len(self.lines)])
+            self.position += 1
+            self.next_line_time += self.interval
+        return "\n".join(output) + "\n"
+
+    async def close(self):
+        await asyncio.sleep(0)
+
+class AsyncDeviceMonitor(DeviceOutput):
+
+    def __init__(self, device, shutdown_event, session_factory=None):
+        """
+        Runs the same connect / terminal monitor / debug_list / stream / undebug lifecycle as
+        DeviceMonitor.connect_and_monitor, but as a coroutine so one event loop can watch hundreds of devices.
+
+        :param device: Device dictionary from the configuration
+        :param shutdown_event: threading.Event set by the SIGINT handler
+        :param session_factory: Callable returning a session for the device, AsyncSSHSession by default
+        """
+        self.device = device
+        self.ip = device['ip']
+        self.shutdown_event = shutdown_event
+        config_loader = ConfigLoader()
+        config = config_loader.get_configuration()
+        self.debug_list = config['debug_list']
+        self.output_dir = config['output_dir']
+        self.console_level = config.get('console_level', None)
+        self.log_format = config['log_format']
+        self.read_max_latency = config.get('read_max_latency', 0.1)
+        self.session_factory = session_factory or AsyncSSHSession
+        self.device_logger = DeviceLogger.get_logger(self.ip, self.output_dir, console_level=self.console_level, format = self.log_format)
+        self.line_assembler = LineAssembler(config.get('prompt_regex', DEFAULT_PROMPT_REGEX))
+        self.tracker = RegexMessageTracker(self.ip, self.output_dir)
+        # None unless instrumentation is enabled, so the hot path only pays for one comparison
+        self.stats = Stats.for_device(self.ip)
+
+    async def connect_and_monitor(self):
+        ip = self.ip
+        session = self.session_factory(self.device)
+        try:
+            await session.connect()
+            await session.enable()
+            output = await session.send_command('u all')
+            self.device_logger.warning(f"Connected to {ip} - Set undebug all as safety:{output}")
+            output = await session.send_command('terminal monitor')
+            self.device_logger.warning(f"{ip}:Terminal Monitor Set:{output}")
+            if self.debug_list:
+                for command in self.debug_list:
+                    output = await session.send_command(command)
+                    self.device_logger.warning(f"Debug set on {ip} - Command: {command}, Output: {output}")
+            else:
+                self.device_logger.warning(f"No debug commands configured for {ip}")
+            while not self.shutdown_event.is_set():
+                output = await session.read(self.read_max_latency)
+                self.process_output(output)
+                # Emit window summaries that are due even when no matching line arrives
+                self.tick()
+            # The session is still open, so undebug all goes out on it rather than on a new connection
+            try:
+                output = await session.send_command('u all')
+                self.process_output(output)
+                self.device_logger.warning(f"Undebug all sent to {ip}")
+            except Exception as e:
+                self.device_logger.warning(f"Error sending undebug all to {ip}: {e}")
+        except Exception as e:
+            self.device_logger.warning(f"Error with device {ip}: {e}")
+        finally:
+            await session.close()
+            if self.tracker:
+                self.flush_output()
+                self.tracker.finish()
+
+async def monitor_devices(devices, shutdown_event, session_factory=None):
+    """ Monitor every device concurrently on the running event loop. """
+    monitors = [AsyncDeviceMonitor(device, shutdown_event, session_factory) for device in devices]
+    await asyncio.gather(*(monitor.connect_and_monitor() for monitor in monitors))
+
+def session_factory_from_config(config):
+    """
+    Returns the session factory selected by the 'transport' setting: 'asyncssh' (default) or 'simulated',
+    which replays 'simulated_capture' at 'simulated_lines_per_second' for every device.
+    """
+    if config.get('transport', 'asyncssh') != 'simulated':
+        return AsyncSSHSession
+    with open(config.get('simulated_capture', 'debug.log'), 'r', errors='replace') as file:
+        lines = [line.rstrip('\n') for line in file if line.strip()]
+    lines_per_second = config.get('simulated_lines_per_second', 10)
+    return lambda device: SimulatedSession(device, lines, lines_per_second)
+
+def run(devices, shutdown_event, session_factory=None):
+    """ Entry point for the asyncio engine used by monitor_terminal_4. """
+    if session_factory is None:
+        session_factory = session_factory_from_config(ConfigLoader().get_configuration())
+    if session_factory is AsyncSSHSession:
+        collect_credentials(devices)
+    asyncio.run(monitor_devices(devices, shutdown_event, session_factory))
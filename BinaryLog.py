@@ -0,0 +1,148 @@
+import logging, struct
+from collections import namedtuple
+from LogHandlers import BufferedFileHandler
+
+# Start of every binary device log
+MAGIC = b"DMLOG1\n"
+# Every entry is a little endian u32 length of what follows, then a u8 entry type
+LENGTH = struct.Struct("<I")
+ENTRY_STRING = 0  # u8 table, u16 id, utf-8 text: names the device or pattern key id used by later records
+ENTRY_RECORD = 1  # RECORD_HEADER followed by the raw line bytes
+# created (f64 epoch seconds, as logging stamps records), levelno, kind, device id, key id, count
+RECORD_HEADER = struct.Struct("<dBBHHI")
+STRING_HEADER = struct.Struct("<BH")
+TABLE_DEVICE = 0
+TABLE_KEY = 1
+# Key id of records without a pattern key, so ids of both tables stop one short of it
+NO_KEY = 0xFFFF
+
+# What a record holds, and how it is turned back into the text log message
+RECORD_MESSAGE = 0  # line is the whole message
+RECORD_LINE = 1     # a device line: From~<device>:<line>
+RECORD_PATTERN = 2  # a pattern match with its count: From~<device>:Pattern [<key>]: <line> (Count: <count>)
+
+BinaryRecord = namedtuple("BinaryRecord", "created levelno kind device key count line")
+
+def text_message(kind, device, key, count, line):
+    """ The message the text log has for a record, exactly as RegexMessageTracker formats it. """
+    if kind == RECORD_LINE:
+        return f"From~{device}:{line}"
+    if kind == RECORD_PATTERN:
+        return f"From~{device}:Pattern [{key}]: {line} (Count: {count})"
+    return line
+
+class BinaryFileHandler(BufferedFileHandler):
+
+    def __init__(self, filename, flush_interval=0, buffer_size=65536):
+        """
+        Writes records as length prefixed binary entries instead of formatted text: no Formatter, no
+        strftime, just the record time, level, device and pattern key ids, count and raw line bytes.
+        Records carrying record_fields (kind, device, key, count, line) in their extra are stored as
+        those fields; any other record is stored as its message. Device names and pattern keys are
+        written once as string entries and referred to by id.
+        """
+        self.strings = ({}, {})
+        super().__init__(filename, flush_interval, buffer_size, mode='ab')
+
+    def _open(self):
+        stream = open(self.baseFilename, self.mode, buffering=self.buffer_size)
+        if stream.tell() == 0:
+            stream.write(MAGIC)
+        return stream
+
+    def string_id(self, table, text):
+        ids = self.strings[table]
+        string_id = ids.get(text)
+        if string_id is None:
+            if len(ids) >= NO_KEY:
+                raise ValueError(f"more than {NO_KEY} distinct names in string table {table}, {text!r} cannot be given an id")
+            string_id = ids[text] = len(ids)
+            encoded = text.encode('utf-8', 'replace')
+            self.stream.write(LENGTH.pack(1 + STRING_HEADER.size + len(encoded)) + bytes((ENTRY_STRING,)) + STRING_HEADER.pack(table, string_id) + encoded)
+        return string_id
+
+    def emit(self, record):
+        try:
+            if self.stream is None:
+                self.stream = self._open()
+            fields = getattr(record, 'record_fields', None)
+            if fields is None:
+                kind, device, key, count, line = RECORD_MESSAGE, record.name, None, 0, record.getMessage()
+            else:
+                kind, device, key, count, line = fields
+            encoded = line.encode('utf-8', 'replace')
+            device_id = self.string_id(TABLE_DEVICE, device)
+            key_id = NO_KEY if key is None else self.string_id(TABLE_KEY, key)
+            self.stream.write(LENGTH.pack(1 + RECORD_HEADER.size + len(encoded)) + bytes((ENTRY_RECORD,))
+                              + RECORD_HEADER.pack(record.created, record.levelno, kind, device_id, key_id, count) + encoded)
+            self.flush()
+        except RecursionError:
+            raise
+        except Exception:
+            self.handleError(record)
+
+def _entries(view, position, names, decode, consumed=None):
+    """
+    Decodes the complete entries of view from position on and yields their records. String entries
+    only update names. A truncated last entry is left alone; consumed[0], when given, is kept at the
+    position after the last complete entry.
+    """
+    unpack_length, unpack_record, unpack_string = LENGTH.unpack_from, RECORD_HEADER.unpack_from, STRING_HEADER.unpack_from
+    line_start = 1 + RECORD_HEADER.size
+    string_start = 1 + STRING_HEADER.size
+    devices, keys = names[TABLE_DEVICE], names[TABLE_KEY]
+    end = len(view)
+    while position + LENGTH.size <= end:
+        start = position + LENGTH.size
+        next_position = start + unpack_length(view, position)[0]
+        if next_position > end:
+            return
+        position = next_position
+        if consumed is not None:
+            consumed[0] = position
+        if view[start] == ENTRY_RECORD:
+            created, levelno, kind, device_id, key_id, count = unpack_record(view, start + 1)
+            line = view[start + line_start:position]
+            yield BinaryRecord(created, levelno, kind, devices.get(device_id), keys.get(key_id), count,
+                               str(line, 'utf-8', 'replace') if decode else line)
+        elif view[start] == ENTRY_STRING:
+            table, string_id = unpack_string(view, start + 1)
+            names[table][string_id] = str(view[start + string_start:position], 'utf-8', 'replace')
+
+def iter_records(buffer, decode=True):
+    """
+    Decodes the records of a whole binary log held in buffer (bytes or an mmap). With decode=False
+    the line of each record is a memoryview into buffer, so nothing is copied until it is used.
+    A truncated last entry (the file is still being written) ends the iteration.
+    """
+    view = memoryview(buffer)
+    if bytes(view[:len(MAGIC)]) != MAGIC:
+        raise ValueError("Not a binary device log")
+    return _entries(view, len(MAGIC), ({}, {}), decode)
+
+def read_records(file, chunk_size=1048576):
+    """
+    Streams the records of a binary log from a file object opened in binary mode, chunk_size bytes
+    at a time, so logs bigger than memory (or a pipe) can be decoded. Lines are decoded str.
+    """
+    if file.read(len(MAGIC)) != MAGIC:
+        raise ValueError("Not a binary device log")
+    names = ({}, {})
+    pending = b""
+    while True:
+        chunk = file.read(chunk_size)
+        if not chunk:
+            return
+        buffer = pending + chunk if pending else chunk
+        # Entries are parsed in place; only an entry cut in two by the chunk boundary is copied
+        consumed = [0]
+        yield from _entries(memoryview(buffer), 0, names, True, consumed)
+        pending = buffer[consumed[0]:]
+
+def to_text(record, formatter):
+    """ The text log line of a decoded record, formatted with formatter (the log_format one). """
+    log_record = logging.LogRecord(record.device or "", record.levelno, "", 0,
+                                   text_message(record.kind, record.device, record.key, record.count, record.line), None, None)
+    log_record.created = record.created
+    log_record.msecs = int((record.created - int(record.created)) * 1000) + 0.0
+    return formatter.format(log_record)
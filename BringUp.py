@@ -0,0 +1,86 @@
+import threading, time
+from contextlib import contextmanager
+from getpass import getpass
+
+def collect_credentials(devices):
+    """
+    Asks for every missing password before any device is started, since getpass blocks on the terminal.
+    Devices with the same 'group' share one password and enable password, asked for once per group;
+    devices without a group are asked for one by one.
+    """
+    shared = {}
+    for device in devices:
+        group = device.get('group')
+        for field, prompt in (('password', "password"), ('secret', "enable password")):
+            if device.get(field):
+                continue
+            if group is None:
+                device[field] = getpass(f"Enter {prompt} for {device['ip']}: ")
+                continue
+            if (group, field) not in shared:
+                shared[(group, field)] = getpass(f"Enter {prompt} for device group {group}: ")
+            device[field] = shared[(group, field)]
+
+class BringUpScheduler:
+    # Seconds a device waits for a connection slot before checking for shutdown again
+    SLOT_WAIT = 0.5
+
+    def __init__(self, device_count, max_connecting=20, logger=None):
+        """
+        Limits how many devices connect and run their setup commands at the same time, and
+        times how long each device takes from the start of the run until it is monitoring.
+
+        :param device_count: Number of devices being brought up, to know when the last one is done
+        :param max_connecting: Devices allowed to be connecting at once
+        :param logger: Logger for the total time to monitoring (e.g. the workstation logger), or None
+        """
+        self.slots = threading.BoundedSemaphore(max_connecting)
+        self.logger = logger
+        self.started = time.monotonic()
+        self.pending = device_count
+        self.monitoring = 0
+        self.failed = 0
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def connection_slot(self, shutdown_event=None):
+        """
+        Holds one of the connection slots while the device connects and is set up. Yields True once
+        a slot is held, or False (holding none) when shutdown_event is set first, so a device that
+        is still waiting does not connect and turn its debugs on during shutdown.
+        """
+        acquired = False
+        while not (shutdown_event is not None and shutdown_event.is_set()):
+            if self.slots.acquire(timeout=self.SLOT_WAIT):
+                acquired = True
+                break
+        if acquired and shutdown_event is not None and shutdown_event.is_set():
+            self.slots.release()
+            acquired = False
+        if not acquired:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            self.slots.release()
+
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def device_monitoring(self):
+        self._device_done(failed=False)
+
+    def device_failed(self):
+        self._device_done(failed=True)
+
+    def _device_done(self, failed):
+        with self.lock:
+            if failed:
+                self.failed += 1
+            else:
+                self.monitoring += 1
+            self.pending -= 1
+            last = self.pending == 0
+        if last and self.logger is not None:
+            self.logger.warning(f"Bring up finished in {self.elapsed():.2f}s: {self.monitoring} devices monitoring, {self.failed} failed")
@@ -0,0 +1,71 @@
+import select, time
+
+def channel_closed(channel):
+    """
+    Returns True once the device side has closed a channel (a paramiko Channel, or anything with the
+    same closed / eof_received / transport attributes). read_channel() just returns "" at that point.
+    """
+    if getattr(channel, 'closed', False) or getattr(channel, 'eof_received', False):
+        return True
+    transport = getattr(channel, 'transport', None)
+    return transport is not None and not transport.is_active()
+
+class ChannelReader:
+    # How often a channel without a usable file descriptor is checked with recv_ready()
+    POLL_INTERVAL = 0.01
+
+    def __init__(self, channel, read_function, shutdown_event, max_latency=0.1):
+        """
+        Blocks on a channel until output is available instead of sleeping between reads.
+
+        :param channel: The underlying channel, e.g. net_connect.remote_conn (a paramiko Channel).
+                        Anything with fileno() or recv_ready() works, including a socket from socket.socketpair()
+        :param read_function: Callable that drains the available output, e.g. net_connect.read_channel
+        :param shutdown_event: Event that ends the wait as soon as it is seen
+        :param max_latency: Longest time in seconds read() waits for output before returning an empty string
+        """
+        self.channel = channel
+        self.read_function = read_function
+        self.shutdown_event = shutdown_event
+        self.max_latency = max_latency
+        try:
+            self.channel.fileno()
+            self.selectable = True
+        except (AttributeError, OSError, ValueError):
+            self.selectable = False
+
+    def wait_readable(self, timeout):
+        """
+        Waits up to timeout seconds for the channel to have output ready.
+
+        :return: True if output is ready to be read
+        """
+        if self.selectable:
+            readable, _, _ = select.select([self.channel], [], [], timeout)
+            return bool(readable)
+        deadline = time.monotonic() + timeout
+        while True:
+            if self.channel.recv_ready():
+                return True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            time.sleep(min(self.POLL_INTERVAL, remaining))
+
+    def read(self):
+        """
+        Returns the output that arrives within max_latency seconds, as soon as it arrives, or an
+        empty string when none did (or shutdown_event is set), so the caller's loop still gets to
+        run its periodic work (window summaries, pattern reloads) while the device is quiet.
+        Raises ConnectionError when the channel has been closed (a closed channel always selects
+        as readable).
+        """
+        if self.shutdown_event.is_set():
+            return ""
+        if self.wait_readable(self.max_latency):
+            output = self.read_function()
+            if output:
+                return output
+            if channel_closed(self.channel):
+                raise ConnectionError("Channel closed by the device")
+        return ""
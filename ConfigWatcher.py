@@ -0,0 +1,71 @@
+import os, threading, time
+from ConfigurationLoader import ConfigLoader
+from RegexMessageTracker import RegexMessageTracker
+
+class ConfigWatcher:
+
+    def __init__(self, interval, shutdown_event, logger=None):
+        """
+        Polls the config file's modification time every interval seconds and, when regex_patterns or
+        alert_strings changed, recompiles them once and swaps them into every tracker. The SSH sessions
+        are not touched. Polling the mtime keeps this portable (no inotify needed) and costs one stat()
+        per interval.
+
+        :param logger: Logger for the reload results and latency (e.g. the workstation logger), or None
+        """
+        self.interval = interval
+        self.shutdown_event = shutdown_event
+        self.logger = logger
+        self.config_loader = ConfigLoader()
+        self.last_stat = self.stat()
+
+    def stat(self):
+        try:
+            status = os.stat(self.config_loader.filepath)
+        except OSError:
+            return None
+        return status.st_mtime_ns, status.st_size
+
+    def start(self):
+        threading.Thread(target=self.run, name="config-watcher", daemon=True).start()
+
+    def log(self, message):
+        if self.logger is not None:
+            self.logger.warning(message)
+
+    def run(self):
+        while not self.shutdown_event.wait(self.interval):
+            current = self.stat()
+            if current is None or current == self.last_stat:
+                continue
+            self.last_stat = current
+            self.check()
+
+    def check(self):
+        """
+        Reads the config file again and hands changed patterns to the trackers. The new file only
+        replaces the loaded configuration once its patterns have compiled.
+        """
+        start = time.perf_counter()
+        previous = self.config_loader.get_configuration()
+        try:
+            loaded = self.config_loader.load_config()
+            config = loaded.get('configuration', {})
+        except Exception as e:
+            # Most likely the file was caught half written; the next change will be picked up
+            self.log(f"Config reload failed, keeping the current patterns: {e}")
+            return
+        if config.get('regex_patterns') == previous.get('regex_patterns') and config.get('alert_strings') == previous.get('alert_strings'):
+            self.config_loader.config = loaded
+            self.log("Config file changed, patterns and alert strings unchanged")
+            return
+        try:
+            trackers = RegexMessageTracker.reload_all(config['regex_patterns'], config['alert_strings'], config.get('pattern_cache_dir'),
+                                                      config.get('pattern_prefilter', False))
+        except Exception as e:
+            self.log(f"Config reload failed, keeping the current patterns: {e}")
+            return
+        # Monitors started from now on (restarts) read the new file; running ones keep their other settings
+        self.config_loader.config = loaded
+        self.log(f"Config reloaded in {(time.perf_counter() - start) * 1000:.1f}ms: {len(config['regex_patterns'])} patterns, "
+                 f"{len(config['alert_strings'])} alert strings, handed to {trackers} trackers")
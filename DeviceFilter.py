@@ -0,0 +1,80 @@
+import re
+
+# netmiko device types whose IOS takes logging discriminators (IOS 12.4(11)T, IOS XE and later)
+DISCRIMINATOR_DEVICE_TYPES = ('cisco_ios', 'cisco_ios_ssh', 'cisco_ios_telnet', 'cisco_xe')
+DISCRIMINATOR_NAME = "DEVMON"
+# Longest msg-body regex put on the device; literals are cut to shorter prefixes until the regex fits
+MAX_REGEX_LENGTH = 240
+PREFIX_LENGTHS = (None, 24, 12, 6)
+CLI_ERROR = re.compile(r"^\s*% ?(Invalid|Incomplete|Ambiguous|Unknown)", re.MULTILINE)
+
+def ios_literal(text):
+    """
+    Regex for a literal on the device: every character other than a letter or digit becomes '.',
+    so nothing needs escaping for IOS (where even '_' is special) and the regex is also valid Python.
+    It matches at least every line containing text.
+    """
+    return re.sub(r"[^A-Za-z0-9]", ".", text)
+
+def filter_literals(matcher, extra_strings=()):
+    """
+    Returns (literals, None) such that every line the tracker matches, alerts on or publishes (the
+    extra_strings, e.g. roam events) contains one of them, or (None, reason) when there is none,
+    e.g. a pattern has no required literal. Literals containing a shorter one are left out.
+    """
+    if matcher.unanchored:
+        return None, f"patterns {', '.join(matcher.unanchored)} have no literal every match contains"
+    literals = set(matcher.anchors.values()) | set(matcher.alert_strings) | set(extra_strings)
+    if not literals or "" in literals:
+        return None, "no patterns or alert strings to filter on"
+    return _without_containing(literals), None
+
+def _without_containing(literals):
+    """ The literals that contain none of the others (a line with the longer one has the shorter one too). """
+    kept = []
+    for literal in sorted(set(literals), key=len):
+        if not any(shorter in literal for shorter in kept):
+            kept.append(literal)
+    return kept
+
+def filter_regex(matcher, extra_strings=(), max_length=MAX_REGEX_LENGTH):
+    """
+    Returns (regex, None) with the msg-body regex for a logging discriminator that lets through every
+    line the tracker would match, alert on or publish, or (None, reason) when there is none that fits
+    in max_length. A prefix of a literal is still in every line the literal is in, so when the regex
+    is too long the literals are cut to their first 24, 12, then 6 characters.
+    """
+    literals, reason = filter_literals(matcher, extra_strings)
+    if literals is None:
+        return None, reason
+    for prefix_length in PREFIX_LENGTHS:
+        # Dots stand for any character, so a line matching a regex literal also matches any part of it
+        regex = "|".join(sorted(_without_containing(ios_literal(literal[:prefix_length]) for literal in literals)))
+        if len(regex) <= max_length:
+            return regex, None
+    return None, f"{len(literals)} literals do not fit in a {max_length} character discriminator"
+
+def discriminator_commands(regex, name=DISCRIMINATOR_NAME):
+    """ Configuration commands that make terminal monitor output only lines whose message body matches regex. """
+    return [f"logging discriminator {name} msg-body includes {regex}",
+            f"logging monitor discriminator {name}"]
+
+def monitor_logging_lines(running_config, name=DISCRIMINATOR_NAME):
+    """
+    The 'logging monitor' lines in the output of show running-config | include ^logging monitor,
+    other than ours: the device's own terminal monitor settings, put back when the filter comes off.
+    """
+    return [line.strip() for line in running_config.splitlines()
+            if line.strip().startswith("logging monitor") and name not in line]
+
+def removal_commands(restore=(), name=DISCRIMINATOR_NAME):
+    """
+    Configuration commands that take the discriminator off again, then put back the device's own
+    logging monitor lines saved before it was put on (see monitor_logging_lines), so its monitor
+    level is left as it was.
+    """
+    return [f"no logging monitor discriminator {name}", *restore, f"no logging discriminator {name}"]
+
+def cli_error(output):
+    """ True when the device rejected one of the commands whose output this is. """
+    return CLI_ERROR.search(output or "") is not None
@@ -1,26 +1,114 @@
 import logging
 import os
+import queue
 from datetime import datetime
 from threading import Lock
+from logging.handlers import QueueHandler
+from LogIndex import LogIndexWriter
+from BinaryLog import BinaryFileHandler
+from LogHandlers import BufferedFileHandler, InProcessQueueHandler, RoutingHandler, BatchingQueueListener, RotatingDeviceFileHandler, SegmentCompressor
 
 class DeviceLogger:
     _loggers = {}
     _lock = Lock()
+    # Set by start_queue: every logger then hands its records to one writer thread
+    _queue = None
+    _router = None
+    _listener = None
+    _flush_interval = 1.0
+    _buffer_size = 65536
+    # Set by configure_rotation: device log files are then rotated into compressed segments
+    _rotation = None
+    # Set by set_console_queue: console output goes to this (multiprocessing) queue instead of stderr
+    _console_queue = None
+    # Set by configure (log_index): seconds per block of the sidecar index written next to each device log
+    _index_interval = None
+    # Set by configure (log_record_format): 'binary' writes device logs as length prefixed records
+    _record_format = 'text'
 
     @staticmethod
-    def get_logger(ip_address, output_dir="./logs", console_level=None, format = None):
+    def configure(config, shutdown_event=None):
+        """
+        Applies the logging settings of config.json (rotation and the queued writer) to loggers created from now on.
+        """
+        # Rotate device logs by size (log_max_bytes) and/or time (log_rotate_interval seconds)
+        DeviceLogger.configure_rotation(config.get('log_max_bytes', 0), config.get('log_rotate_interval', 0), config.get('log_compression', 'gzip'))
+        # Sidecar index of times, pattern keys and alert strings for log_search.py
+        DeviceLogger._index_interval = config.get('log_index_interval', 1.0) if config.get('log_index', False) else None
+        DeviceLogger._record_format = config.get('log_record_format', 'text')
+        if config.get('log_queue', False):
+            # All device loggers write through one batching writer thread
+            DeviceLogger.start_queue(config.get('log_flush_interval', 1.0), config.get('log_buffer_size', 65536), shutdown_event)
+
+    @staticmethod
+    def set_console_queue(console_queue):
+        """
+        Sends the console output of loggers created from now on to console_queue as formatted records,
+        so a worker process can hand its alerts to the supervisor that owns the terminal.
+        """
+        DeviceLogger._console_queue = console_queue
+
+    @staticmethod
+    def configure_rotation(max_bytes=0, rotate_interval=0, compression='gzip'):
+        """
+        Rotates the files of loggers created from now on once they reach max_bytes and/or every
+        rotate_interval seconds. Rotated segments are compressed ('gzip', 'zstd' or None for no
+        compression) on a background thread and listed with their time range in an index file.
+        """
+        with DeviceLogger._lock:
+            if not max_bytes and not rotate_interval:
+                DeviceLogger._rotation = None
+                return
+            compressor = SegmentCompressor(compression) if compression else None
+            DeviceLogger._rotation = (max_bytes, rotate_interval, compressor)
+
+    @staticmethod
+    def start_queue(flush_interval=1.0, buffer_size=65536, shutdown_event=None):
+        """
+        Switches to queued logging: loggers created from now on put their records on a queue and a
+        single QueueListener thread formats and writes them, batching file writes into buffer_size
+        bytes flushed every flush_interval seconds. Once shutdown_event is set every record is flushed
+        as soon as it is written. Call stop_queue() at exit to drain the queue and close the files.
+        """
+        with DeviceLogger._lock:
+            if DeviceLogger._listener is not None:
+                return
+            DeviceLogger._flush_interval = flush_interval
+            DeviceLogger._buffer_size = buffer_size
+            DeviceLogger._queue = queue.SimpleQueue()
+            DeviceLogger._router = RoutingHandler()
+            DeviceLogger._listener = BatchingQueueListener(DeviceLogger._queue, DeviceLogger._router, flush_interval, shutdown_event)
+            DeviceLogger._listener.start()
+
+    @staticmethod
+    def stop_queue():
+        """
+        Writes out every queued record, then flushes and closes the files of queued loggers.
+        """
+        with DeviceLogger._lock:
+            listener, router = DeviceLogger._listener, DeviceLogger._router
+            if listener is None:
+                return
+            listener.stop()
+            router.force_flush()
+            router.close()
+            DeviceLogger._listener = None
+
+    @staticmethod
+    def get_logger(ip_address, output_dir="./logs", console_level=None, format = None, binary = True):
         """
         Returns a logger for the given IP address. If the logger does not already exist,
         it creates a new one with the specified settings, including an optional console logger.
         This method ensures that there is only one logger per device IP in a thread-safe manner.
+        binary=False keeps the file in text even when log_record_format is "binary" (e.g. the workstation log).
         """
         with DeviceLogger._lock:
             if ip_address not in DeviceLogger._loggers:
-                DeviceLogger._setup_device_logger(ip_address, output_dir, console_level, format)
+                DeviceLogger._setup_device_logger(ip_address, output_dir, console_level, format, binary)
         return DeviceLogger._loggers[ip_address]
 
     @staticmethod
-    def _setup_device_logger(ip_address, output_dir, console_level, format):
+    def _setup_device_logger(ip_address, output_dir, console_level, format, binary=True):
         """
         Set up a logger for each device with a unique file including a timestamp,
         and optionally, a console handler based on the console_level.
@@ -32,20 +120,53 @@ class DeviceLogger:
         logger.setLevel(logging.DEBUG)
         logger.propagate = False
 
-        # File handler setup
-        file_handler = logging.FileHandler(filename)
+        # File handler setup; indexed files are written as utf-8, the encoding the index offsets are counted in
+        indexed = DeviceLogger._index_interval is not None
+        encoding = 'utf-8' if indexed else None
+        if DeviceLogger._record_format == 'binary' and binary:
+            # Length prefixed records instead of formatted lines, read back with log_convert.py
+            flush_interval = DeviceLogger._flush_interval if DeviceLogger._listener is not None else 0
+            file_handler = BinaryFileHandler(f"{output_dir}/device_monitor_debug_{ip_address}_{timestamp}.bin", flush_interval, DeviceLogger._buffer_size)
+            indexed = False
+        elif DeviceLogger._rotation is not None:
+            max_bytes, rotate_interval, compressor = DeviceLogger._rotation
+            if DeviceLogger._listener is not None:
+                file_handler = RotatingDeviceFileHandler(filename, max_bytes, rotate_interval, compressor, DeviceLogger._flush_interval, DeviceLogger._buffer_size, encoding=encoding)
+            else:
+                file_handler = RotatingDeviceFileHandler(filename, max_bytes, rotate_interval, compressor, encoding=encoding)
+        elif DeviceLogger._listener is not None:
+            file_handler = BufferedFileHandler(filename, DeviceLogger._flush_interval, DeviceLogger._buffer_size, encoding=encoding)
+        elif indexed:
+            # Unbuffered like a plain FileHandler, but able to index what it writes
+            file_handler = BufferedFileHandler(filename, 0, encoding=encoding)
+        else:
+            file_handler = logging.FileHandler(filename)
+        if indexed:
+            file_handler.log_index = LogIndexWriter(file_handler.baseFilename, DeviceLogger._index_interval)
         if format is not None:
             formatter = logging.Formatter(format)
         else:
             formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
         file_handler.setFormatter(formatter)
-        logger.addHandler(file_handler)
+        handlers = [file_handler]
 
         # Optional console handler setup
         if console_level is not None:
-            console_handler = logging.StreamHandler()
+            if DeviceLogger._console_queue is not None:
+                console_handler = QueueHandler(DeviceLogger._console_queue)
+            else:
+                console_handler = logging.StreamHandler()
             console_handler.setLevel(console_level)
             console_handler.setFormatter(formatter)
-            logger.addHandler(console_handler)
+            handlers.append(console_handler)
+
+        if DeviceLogger._listener is not None:
+            # Formatting and writing happen on the listener thread, not on the device thread
+            for handler in handlers:
+                DeviceLogger._router.add_route(logger.name, handler)
+            logger.addHandler(InProcessQueueHandler(DeviceLogger._queue))
+        else:
+            for handler in handlers:
+                logger.addHandler(handler)
 
         DeviceLogger._loggers[ip_address] = logger
@@ -1,16 +1,56 @@
-import logging, time
+import logging, random, re, threading, time
+from contextlib import nullcontext
 from getpass import getpass
 from netmiko import ConnectHandler
 from datetime import datetime
 from RegexMessageTracker import RegexMessageTracker  # Assume the tracker class is imported
 from DeviceLogger import DeviceLogger
 from ConfigurationLoader import ConfigLoader
-class DeviceMonitor:
+from DeviceOutput import DeviceOutput
+from LineAssembler import LineAssembler, DEFAULT_PROMPT_REGEX
+from ChannelReader import ChannelReader, channel_closed
+from ReadPipeline import BoundedChunkQueue
+from Stats import Stats
+from DeviceFilter import DISCRIMINATOR_DEVICE_TYPES, filter_regex, discriminator_commands, removal_commands, monitor_logging_lines, cli_error
+class DeviceMonitor(DeviceOutput):
+    # Shortest time in seconds between two warnings about reads dropped by the pipeline
+    DROP_REPORT_INTERVAL = 10
+    # Shared by every device once shutdown starts, see shutdown_deadline() and send_undebug_reconnect()
+    _shutdown_lock = threading.Lock()
+    _shutdown_deadline = None
+    _reconnect_slots = None
+    cleanup_results = {'live session': 0, 'reconnected': 0, 'failed': 0}
 
-    def __init__(self, device, shutdown_event):
+    @staticmethod
+    def shutdown_deadline(timeout, max_connections):
+        """
+        Returns the time (time.monotonic()) by which every device has to be cleaned up. The deadline
+        is fixed by the first device that sees the shutdown, timeout seconds from then.
+        """
+        with DeviceMonitor._shutdown_lock:
+            if DeviceMonitor._shutdown_deadline is None:
+                DeviceMonitor._shutdown_deadline = time.monotonic() + timeout
+                DeviceMonitor._reconnect_slots = threading.BoundedSemaphore(max_connections)
+            return DeviceMonitor._shutdown_deadline
+
+    @staticmethod
+    def record_cleanup(result):
+        with DeviceMonitor._shutdown_lock:
+            DeviceMonitor.cleanup_results[result] += 1
+
+    # Device settings that are ours rather than netmiko's and are not passed to ConnectHandler
+    MONITOR_DEVICE_KEYS = ('group',)
+
+    def __init__(self, device, shutdown_event, bring_up=None, states=None):
+        """
+        :param bring_up: BringUpScheduler limiting how many devices connect at once, or None for no limit
+        :param states: DeviceStates table the device reports streaming / reconnecting to, or None
+        """
         self.device = device
         self.ip = device['ip']
         self.shutdown_event = shutdown_event
+        self.bring_up = bring_up
+        self.states = states
         config_loader = ConfigLoader()
         config = config_loader.get_configuration()
         self.debug_list = config['debug_list']
@@ -19,8 +59,49 @@ class DeviceMonitor:
         self.debug_netmiko = config['debug_netmiko']
         self.console_level = config.get('console_level', None)
         self.log_format = config['log_format']
+        # 'select' blocks on the channel until output arrives, 'poll' reads once a second
+        self.reader_mode = config.get('reader_mode', 'poll')
+        self.read_max_latency = config.get('read_max_latency', 0.1)
+        # With pipeline the reader thread only drains the channel into a bounded queue and a second thread processes it
+        self.pipeline = config.get('pipeline', False)
+        self.pipeline_queue_size = config.get('pipeline_queue_size', 1000)
+        self.pipeline_policy = config.get('pipeline_policy', 'block')
+        self.pipeline_sample_every = config.get('pipeline_sample_every', 10)
+        # Set by the processing thread when it fails, so the reader ends the session
+        self.pipeline_error = None
+        # undebug all goes out on the live session; only broken sessions reconnect, at most shutdown_connections at a time
+        self.shutdown_timeout = config.get('shutdown_timeout', 30)
+        self.shutdown_connections = config.get('shutdown_connections', 10)
+        # 'pipelined' writes u all, terminal monitor and the debug_list in one go, 'sequential' sends them one by one
+        self.setup_commands = config.get('setup_commands', 'pipelined')
+        self.setup_timeout = config.get('setup_timeout', 30)
+        # With device_filter the device is told (logging discriminator) to send only lines a pattern, alert string
+        # or roam event could match; devices that cannot do it are filtered on the workstation as before
+        self.device_filter = config.get('device_filter', False)
+        self.device_filter_applied = False
+        # The matcher the discriminator was built from, and the device's own logging monitor lines to put back
+        self.filter_matcher = None
+        self.filter_restore = None
+        # Output read from the device, in characters (the same as bytes for the ASCII debug output)
+        self.bytes_received = 0
+        # A dropped connection is retried with jittered exponential backoff (reconnect_max_attempts 0 retries forever)
+        self.reconnect = config.get('reconnect', True)
+        self.reconnect_base_delay = config.get('reconnect_base_delay', 1)
+        self.reconnect_max_delay = config.get('reconnect_max_delay', 60)
+        self.reconnect_max_attempts = config.get('reconnect_max_attempts', 0)
+        self.brought_up = False
+        # True from the moment debugs are sent until undebug all has been tried, so a device that is down
+        # (in reconnect backoff) at shutdown still gets its debugs turned off
+        self.debug_enabled = False
+        self.streaming = False
+        self.streamed_since_failure = False
+        self.gap_started = None
         # Convert console_level string to actual logging level
         console_level = getattr(logging, self.console_level) if self.console_level else None
+        self.line_assembler = LineAssembler(config.get('prompt_regex', DEFAULT_PROMPT_REGEX))
+        self.tracker = None
+        # None unless instrumentation is enabled, so the hot path only pays for one comparison
+        self.stats = Stats.for_device(self.ip)
         # Initialize RegexMessageTracker only if logging via Netmiko is not set
         if not self.log_netmiko and not self.debug_netmiko:
             self.device_logger = DeviceLogger.get_logger(self.ip, self.output_dir, console_level=self.console_level, format = self.log_format)
@@ -32,11 +113,132 @@ class DeviceMonitor:
             self.device_logger = None
 
     def setup_device_connection(self):
+        device = {key: value for key, value in self.device.items() if key not in self.MONITOR_DEVICE_KEYS}
         if self.log_netmiko:
             timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
             session_log_file = f"{self.output_dir}/netmiko_session_{self.ip}_{timestamp}.log"
-            return ConnectHandler(**self.device, session_log=session_log_file)
-        return ConnectHandler(**self.device)
+            return ConnectHandler(**device, session_log=session_log_file)
+        return ConnectHandler(**device)
+
+    @staticmethod
+    def prompt_pattern(net_connect):
+        """
+        Regex for the device prompt. send_command() has to be given it explicitly once terminal monitor
+        is on, otherwise it takes the last line of debug output for the prompt and times out.
+        """
+        return re.escape(net_connect.base_prompt) + r"[>#]"
+
+    def send_setup_commands(self, net_connect, commands):
+        """
+        Runs the setup commands and returns (list of (command, output), output that followed the last prompt).
+
+        In 'pipelined' mode every command is written to the channel at once and the outputs are split
+        on the prompts that come back, so setup costs one round trip instead of one per command.
+        """
+        if self.setup_commands == 'sequential':
+            return [(command, net_connect.send_command(command, expect_string=self.prompt_pattern(net_connect))) for command in commands], ""
+        prompt = re.compile(self.prompt_pattern(net_connect))
+        net_connect.write_channel("".join(command + net_connect.RETURN for command in commands))
+        output = ""
+        deadline = time.monotonic() + self.setup_timeout
+        # enable() has already read the prompt that was on screen, so each command ends with exactly one prompt
+        while len(prompt.findall(output)) < len(commands):
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"No prompt after the setup commands within {self.setup_timeout}s")
+            chunk = net_connect.read_channel()
+            if chunk:
+                output += chunk
+            else:
+                time.sleep(0.05)
+        parts = prompt.split(output, maxsplit=len(commands))
+        results = []
+        for command, part in zip(commands, parts):
+            part = part.strip()
+            # Drop the echo of the command so the output reads like send_command's
+            if part.startswith(command):
+                part = part[len(command):].lstrip()
+            results.append((command, part))
+        return results, parts[-1]
+
+    def set_up_monitoring(self, net_connect):
+        """ Enables, then sends u all, terminal monitor and the debug_list commands. """
+        ip = self.ip
+        net_connect.enable()
+        if self.device_filter and self.tracker:
+            # Before terminal monitor, so the configuration commands are not mixed with debug output
+            self.apply_device_filter(net_connect)
+        self.debug_enabled = True
+        results, trailing = self.send_setup_commands(net_connect, ['u all', 'terminal monitor'] + list(self.debug_list or []))
+        for command, output in results:
+            if command == 'u all':
+                self.device_logger.warning(f"Connected to {ip} - Set undebug all as safety:{output}")
+            elif command == 'terminal monitor':
+                self.device_logger.warning(f"{ip}:Terminal Monitor Set:{output}")
+            else:
+                self.device_logger.warning(f"Debug set on {ip} - Command: {command}, Output: {output}")
+        if not self.debug_list:
+            self.device_logger.warning(f"No debug commands configured for {ip}")
+        # Debug output that arrived right after the last command is the start of the monitored stream
+        self.process_output(trailing)
+
+    def apply_device_filter(self, net_connect):
+        """
+        Puts a logging discriminator on terminal monitor output that lets through only the lines
+        containing an alert string, roam event or the required literal of a pattern, so the rest is
+        never sent, decoded or matched. Falls back to filtering on the workstation alone when the
+        device type has no discriminators, the patterns cannot be turned into one, or the device
+        rejects the commands.
+        """
+        ip = self.ip
+        self.device_filter_applied = False
+        device_type = self.device.get('device_type')
+        if device_type not in DISCRIMINATOR_DEVICE_TYPES:
+            self.device_logger.warning(f"No device filter for {ip}: {device_type} has no logging discriminator, filtering locally")
+            return
+        regex, reason = filter_regex(self.tracker.matcher, self.tracker.roam_events or ())
+        if regex is None:
+            self.device_logger.warning(f"No device filter for {ip}: {reason}, filtering locally")
+            return
+        if self.filter_restore is None:
+            # Read once, before the first filter goes on, so a reconnect does not save our own settings
+            self.filter_restore = monitor_logging_lines(net_connect.send_command('show running-config | include ^logging monitor',
+                                                                                 expect_string=self.prompt_pattern(net_connect)))
+        output = net_connect.send_config_set(discriminator_commands(regex))
+        if cli_error(output):
+            self.device_logger.warning(f"Device filter rejected by {ip}, filtering locally:{output}")
+            net_connect.send_config_set(removal_commands(self.filter_restore))
+            return
+        self.device_filter_applied = True
+        self.filter_matcher = self.tracker.matcher
+        self.device_logger.warning(f"Device filter set on {ip}: msg-body includes {regex}")
+
+    def check_device_filter(self, net_connect):
+        """
+        Rebuilds the discriminator once a config reload has switched the tracker to new patterns,
+        so the device does not keep holding back lines the new patterns match. The session is
+        streaming debug output, so the commands are written without waiting for their prompts; a
+        rejection shows up in the device log as a % line. When the new patterns cannot be filtered
+        on the device, the discriminator is taken off and filtering is local again.
+        """
+        if not self.device_filter_applied or self.tracker.matcher is self.filter_matcher:
+            return
+        ip = self.ip
+        self.filter_matcher = self.tracker.matcher
+        regex, reason = filter_regex(self.filter_matcher, self.tracker.roam_events or ())
+        commands = discriminator_commands(regex) if regex is not None else removal_commands(self.filter_restore)
+        net_connect.write_channel("".join(command + net_connect.RETURN for command in ['configure terminal'] + commands + ['end']))
+        if regex is not None:
+            self.device_logger.warning(f"Device filter on {ip} rebuilt for the reloaded patterns: msg-body includes {regex}")
+        else:
+            self.device_filter_applied = False
+            self.device_logger.warning(f"Device filter removed from {ip} for the reloaded patterns: {reason}, filtering locally")
+
+    def remove_device_filter(self, net_connect):
+        """ Takes the logging discriminator off the device again at shutdown. """
+        if self.device_filter_applied:
+            net_connect.send_config_set(removal_commands(self.filter_restore))
+            self.device_filter_applied = False
+            self.device_logger.warning(f"Device filter removed from {self.ip}")
 
     def setup_netmiko_debug_logging(self):
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
@@ -49,62 +251,319 @@ class DeviceMonitor:
         netmiko_logger.addHandler(file_handler)
         netmiko_logger.propagate = False
 
-    def process_output(self, output):
-        if output and self.tracker:
-            lines = output.split('\n')
-            for line in lines:
-                if line.strip():
-                    self.tracker.process_line(line)
+    def read_output(self, net_connect, reader):
+        """ Reads the next output from the channel, the way reader_mode asks for. """
+        if self.stats is not None:
+            read_start = time.perf_counter_ns()
+        if reader:
+            output = reader.read()
+        else:
+            output = net_connect.read_channel()
+            if not output and channel_closed(net_connect.remote_conn):
+                raise ConnectionError("Channel closed by the device")
+        if output:
+            self.bytes_received += len(output)
+        if self.stats is not None:
+            self.stats.record('read_ns', time.perf_counter_ns() - read_start)
+            self.stats.count('reads')
+            self.stats.count('bytes', len(output) if output else 0)
+        return output
+
+    def wait_for_next_read(self, net_connect, reader):
+        if not reader:
+            time.sleep(1)
+        # Manually flush the session log to ensure it's up-to-date
+        if hasattr(net_connect, 'session_log') and self.log_netmiko:
+            net_connect.session_log.flush()
+
+    def monitor_pipelined(self, net_connect, reader):
+        """
+        Reads the channel on this thread into a bounded queue while a processing thread runs the
+        tracker and logging, so slow regex or disk work never stops the channel from being drained.
+        Returns once shutdown_event is set and everything queued has been processed.
+        """
+        chunk_queue = BoundedChunkQueue(self.pipeline_queue_size, self.pipeline_policy, self.pipeline_sample_every)
+        self.pipeline_error = None
+        processor = threading.Thread(target=self.process_queue, args=(chunk_queue,), name=f"process-{self.ip}")
+        processor.start()
+        try:
+            while not self.shutdown_event.is_set():
+                if self.pipeline_error is not None:
+                    # Ends the session; it reconnects like after a dropped connection
+                    raise RuntimeError(f"Processing stopped: {str(self.pipeline_error) or type(self.pipeline_error).__name__}")
+                output = self.read_output(net_connect, reader)
+                if output:
+                    chunk_queue.put(output)
+                self.check_device_filter(net_connect)
+                self.wait_for_next_read(net_connect, reader)
+        finally:
+            chunk_queue.close()
+            processor.join()
+        if self.device_logger:
+            self.device_logger.warning(
+                f"Pipeline for {self.ip} ({self.pipeline_policy}): {chunk_queue.dropped_chunks} reads "
+                f"({chunk_queue.dropped_bytes} bytes) dropped, queue high water {chunk_queue.high_water}/{chunk_queue.max_chunks}, "
+                f"reader blocked {chunk_queue.blocked_ns / 1e9:.3f}s")
+
+    def process_queue(self, chunk_queue):
+        """
+        Processing stage of the pipeline: runs until the queue is closed and empty. When processing
+        fails, the error is logged and kept in pipeline_error for the reader, and the queue is closed
+        so a reader waiting for room in put() is let go.
+        """
+        try:
+            self.process_chunks(chunk_queue)
+        except Exception as e:
+            self.pipeline_error = e
+            if self.device_logger:
+                self.device_logger.exception(f"Processing of {self.ip} output failed: {str(e) or type(e).__name__}")
+            chunk_queue.close()
+
+    def process_chunks(self, chunk_queue):
+        reported_chunks = reported_bytes = 0
+        last_report = time.monotonic()
+        while True:
+            item = chunk_queue.get(self.read_max_latency)
+            if item is None:
+                if chunk_queue.is_drained():
+                    break
+            else:
+                output, follows_gap = item
+                if follows_gap:
+                    # Reads were dropped: the partial line before the gap cannot be joined to what follows it
+                    self.flush_output()
+                self.process_output(output)
+            # Emit window summaries that are due even when no matching line arrives
+            self.tick()
+            dropped_chunks, dropped_bytes = chunk_queue.dropped_chunks, chunk_queue.dropped_bytes
+            if dropped_chunks != reported_chunks and time.monotonic() - last_report >= self.DROP_REPORT_INTERVAL:
+                if self.device_logger:
+                    self.device_logger.warning(f"Pipeline for {self.ip} dropped {dropped_chunks - reported_chunks} reads "
+                                               f"({dropped_bytes - reported_bytes} bytes) to keep up with the device")
+                if self.stats is not None:
+                    self.stats.count('dropped_reads', dropped_chunks - reported_chunks)
+                    self.stats.count('dropped_bytes', dropped_bytes - reported_bytes)
+                reported_chunks, reported_bytes = dropped_chunks, dropped_bytes
+                last_report = time.monotonic()
+        if self.stats is not None and chunk_queue.dropped_chunks != reported_chunks:
+            self.stats.count('dropped_reads', chunk_queue.dropped_chunks - reported_chunks)
+            self.stats.count('dropped_bytes', chunk_queue.dropped_bytes - reported_bytes)
+
+    def send_undebug(self, net_connect):
+        """
+        Sends 'u all' at shutdown on the live session when it is still healthy, and only opens a new
+        connection for it when the session is broken. Gives up once the shutdown deadline has passed.
+        """
+        ip = self.ip
+        self.debug_enabled = False
+        deadline = DeviceMonitor.shutdown_deadline(self.shutdown_timeout, self.shutdown_connections)
+        start = time.monotonic()
+        try:
+            if net_connect.is_alive():
+                # u all goes out before anything else so a flooding device stops. Its echo is mixed in with the
+                # debug output, so only the prompt that follows it is waited for (send_command's echo check would time out)
+                net_connect.write_channel('u all' + net_connect.RETURN)
+                self.read_until_prompt(net_connect, deadline)
+                # Whatever the device still sends goes through the tracker, until it is quiet or the deadline passes
+                while time.monotonic() < deadline:
+                    remaining_output = net_connect.read_channel()
+                    if not remaining_output:
+                        break
+                    self.process_output(remaining_output)
+                self.remove_device_filter(net_connect)
+                self.device_logger.warning(f"Undebug all sent to {ip} on the live session in {time.monotonic() - start:.2f}s")
+                DeviceMonitor.record_cleanup('live session')
+                return
+        except Exception as e:
+            self.device_logger.warning(f"Error sending undebug all to {ip} on the live session: {str(e) or type(e).__name__}")
+        self.send_undebug_reconnect(deadline, start)
+
+    def read_until_prompt(self, net_connect, deadline):
+        """
+        Reads the channel, passing everything through the tracker, until the device prompt arrives.
+        Raises TimeoutError when it has not by deadline (time.monotonic()).
+        """
+        prompt = re.compile(self.prompt_pattern(net_connect))
+        tail = ""
+        while True:
+            chunk = net_connect.read_channel()
+            if chunk:
+                self.process_output(chunk)
+                # Only the end of the output is searched, the prompt can be split across reads
+                tail = (tail + chunk)[-256:]
+                if prompt.search(tail):
+                    return
+            if time.monotonic() > deadline:
+                raise TimeoutError("No prompt after undebug all before the shutdown deadline")
+            if not chunk:
+                time.sleep(0.05)
+
+    def send_undebug_reconnect(self, deadline, start):
+        """ Sends 'u all' over a new connection, waiting for one of the shared reconnect slots. """
+        ip = self.ip
+        if not DeviceMonitor._reconnect_slots.acquire(timeout=max(deadline - time.monotonic(), 0)):
+            self.device_logger.warning(f"Shutdown deadline passed before undebug all could be sent to {ip}")
+            DeviceMonitor.record_cleanup('failed')
+            return
+        try:
+            self.log_netmiko = False
+            with self.setup_device_connection() as net_connect2:
+                net_connect2.enable()
+                net_connect2.send_command('u all')
+                self.remove_device_filter(net_connect2)
+            self.device_logger.warning(f"Undebug all sent to {ip} on a new connection in {time.monotonic() - start:.2f}s")
+            DeviceMonitor.record_cleanup('reconnected')
+        except Exception as e:
+            self.device_logger.warning(f"Error sending undebug all to {ip}: {str(e) or type(e).__name__}")
+            DeviceMonitor.record_cleanup('failed')
+        finally:
+            DeviceMonitor._reconnect_slots.release()
 
     def connect_and_monitor(self):
         ip = self.device['ip']
+        attempt = 0
         try:
             if 'password' not in self.device or self.device['password'] == "":
                 self.device['password'] = getpass(f"Enter password for {ip}: ")
             if 'secret' not in self.device or self.device['secret'] == "":
                 self.device['secret'] = getpass(f"Enter enable password for {ip}: ")
 
-            #with ConnectHandler(**self.device) as net_connect:
-            with self.setup_device_connection() as net_connect:
-                net_connect.enable()
-                output = net_connect.send_command('u all')
-                self.device_logger.warning(f"Connected to {ip} - Set undebug all as safety:{output}")
-                output = net_connect.send_command('terminal monitor')
-                self.device_logger.warning(f"{ip}:Terminal Monitor Set:{output}")
-                #Check if there are any debug commands to execute
-                if self.debug_list:
-                    for command in self.debug_list:
-                        output = net_connect.send_command(command)
-                        self.device_logger.warning(f"Debug set on {ip} - Command: {command}, Output: {output}")
+            while True:
+                try:
+                    self.monitor_session()
+                    break
+                except Exception as e:
+                    # Some connection errors (EOFError from paramiko) carry no message
+                    self.device_logger.warning(f"Error with device {ip}: {str(e) or type(e).__name__}")
+                    if self.bring_up and not self.brought_up:
+                        self.bring_up.device_failed()
+                        self.brought_up = True  # Counted once, as failed; reconnects do not count again
+                    if self.streaming:
+                        self.streaming = False
+                        self.start_gap(str(e) or type(e).__name__)
+                    if self.shutdown_event.is_set() or not self.reconnect:
+                        break
+                    if self.streamed_since_failure:
+                        # The last session worked, so the backoff starts over
+                        attempt = 0
+                        self.streamed_since_failure = False
+                    if self.reconnect_max_attempts and attempt >= self.reconnect_max_attempts:
+                        self.device_logger.warning(f"Giving up on {ip} after {attempt} reconnect attempts")
+                        break
+                    delay = self.reconnect_delay(attempt)
+                    attempt += 1
+                    if self.states:
+                        self.states.set(ip, 'reconnecting', str(e) or type(e).__name__)
+                    self.device_logger.warning(f"Reconnecting to {ip} in {delay:.1f}s (attempt {attempt})")
+                    if self.shutdown_event.wait(delay):
+                        break
+            if self.shutdown_event.is_set() and self.debug_enabled:
+                # Shutdown came while the session was broken or waiting to reconnect: the debugs of the last
+                # session are still on, and there is no live session to send undebug all on
+                self.debug_enabled = False
+                self.send_undebug_reconnect(DeviceMonitor.shutdown_deadline(self.shutdown_timeout, self.shutdown_connections),
+                                            time.monotonic())
+        except Exception as e:
+            self.device_logger.warning(f"Error with device {ip}: {str(e) or type(e).__name__}")
+        finally:
+            if self.tracker:
+                self.flush_output()
+                self.tracker.finish()
+
+    def reconnect_delay(self, attempt):
+        """
+        Exponential backoff with jitter: the delay doubles with every failed attempt up to
+        reconnect_max_delay, and a random half of it is taken off so devices that dropped together
+        do not all reconnect at the same moment.
+        """
+        delay = min(self.reconnect_max_delay, self.reconnect_base_delay * 2 ** attempt)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def start_gap(self, reason):
+        """ Marks the start of a gap in the device output in the device log, the metrics and stats. """
+        # A partial line from before the drop cannot be joined with the next session's output
+        self.flush_output()
+        self.gap_started = time.time()
+        if self.tracker:
+            self.tracker.gap_start(reason, self.gap_started)
+        elif self.device_logger:
+            self.device_logger.warning(f"GAP START {self.ip}: {reason}")
+        if self.stats is not None:
+            self.stats.count('gaps')
+
+    def end_gap(self):
+        """ Marks the end of the gap once a new session is monitoring again. """
+        if self.gap_started is None:
+            return
+        now = time.time()
+        if self.tracker:
+            self.tracker.gap_end("reconnected", now)
+        elif self.device_logger:
+            self.device_logger.warning(f"GAP END {self.ip}: reconnected, no output for {now - self.gap_started:.1f}s")
+        if self.stats is not None:
+            self.stats.count('reconnects')
+            self.stats.record('gap_ms', (now - self.gap_started) * 1000)
+        self.gap_started = None
+
+    def log_bytes_received(self, received, elapsed, filtered):
+        """ Logs how much the device sent during a session, to compare runs with and without device_filter. """
+        if self.device_logger:
+            self.device_logger.warning(f"Received {received} bytes from {self.ip} in {elapsed:.1f}s "
+                                       f"({received / max(elapsed, 0.001):.0f} bytes/s), device filter {'on' if filtered else 'off'}")
+
+    def monitor_session(self):
+        """
+        One session with the device: connect, set up terminal monitor and the debug_list, stream until
+        shutdown_event is set and send undebug all. Raises when the connection fails or drops.
+        """
+        ip = self.ip
+        # Only bring_up's limit of devices connect and run their setup at the same time
+        queued = time.monotonic()
+        with self.bring_up.connection_slot(self.shutdown_event) if self.bring_up else nullcontext(True) as slot:
+            if not slot:
+                # Shutdown started while waiting for a slot: nothing was connected, so there is nothing to undo
+                return
+            connecting = time.monotonic()
+            net_connect = self.setup_device_connection()
+            connected = time.monotonic()
+            try:
+                self.set_up_monitoring(net_connect)
+            except Exception:
+                net_connect.disconnect()
+                raise
+        monitoring = time.monotonic()
+        timings = f"slot wait {connecting - queued:.2f}s, connect {connected - connecting:.2f}s, setup {monitoring - connected:.2f}s"
+        if self.bring_up and not self.brought_up:
+            self.device_logger.warning(f"{ip} monitoring {self.bring_up.elapsed():.2f}s after start ({timings})")
+            self.bring_up.device_monitoring()
+            self.brought_up = True
+        else:
+            self.device_logger.warning(f"{ip} monitoring ({timings})")
+        self.streaming = True
+        self.streamed_since_failure = True
+        if self.states:
+            self.states.set(ip, 'streaming')
+        self.end_gap()
+        received = self.bytes_received
+        filtered = self.device_filter_applied
+        try:
+            with net_connect:
+                if self.reader_mode == 'select':
+                    reader = ChannelReader(net_connect.remote_conn, net_connect.read_channel, self.shutdown_event, self.read_max_latency)
                 else:
-                    self.device_logger.warning(f"No debug commands configured for {ip}")
-                # output = net_connect.send_command('debug wgb uplink event')
-                # logging.info(f"Debug set on {ip} - {output}")
+                    reader = None
+                if self.pipeline:
+                    self.monitor_pipelined(net_connect, reader)
                 while not self.shutdown_event.is_set():
-                    output = net_connect.read_channel()
+                    output = self.read_output(net_connect, reader)
                     self.process_output(output)
-                    time.sleep(1)
-                    # Manually flush the session log to ensure it's up-to-date
-                    if hasattr(net_connect, 'session_log') and self.log_netmiko:
-                        net_connect.session_log.flush()
+                    # Emit window summaries that are due even when no matching line arrives
+                    self.tick()
+                    self.check_device_filter(net_connect)
+                    self.wait_for_next_read(net_connect, reader)
+                self.streaming = False
                 # Send 'undebug all' command if the shutdown event is set
                 if self.shutdown_event.is_set():
-                    try:
-                        self.log_netmiko = False
-                        with self.setup_device_connection() as net_connect2:
-                            net_connect2.send_command('u all')
-                            self.device_logger.warning(f"Undebug all sent to {ip}")
-                        while True:
-                            remaining_output = net_connect.read_channel()
-                            if not remaining_output:
-                                break
-                            self.process_output(remaining_output)
-                    except Exception as e:
-                        self.device_logger.warning(f"Error sending undebug all to {ip}: {e}")
-
-        except Exception as e:
-            self.device_logger.warning(f"Error with device {ip}: {e}")
+                    self.send_undebug(net_connect)
         finally:
-            if self.tracker:
-                self.tracker.finish()
-
+            self.log_bytes_received(self.bytes_received - received, time.monotonic() - monitoring, filtered)
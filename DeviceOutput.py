@@ -0,0 +1,33 @@
+import time
+
+class DeviceOutput:
+    """
+    Output handling shared by DeviceMonitor and AsyncDeviceMonitor: reads are split into lines by
+    self.line_assembler and handed to self.tracker (None when nothing is tracked), with the time
+    spent recorded in self.stats (None unless instrumentation is enabled).
+    """
+
+    def process_output(self, output):
+        if output and self.tracker:
+            if self.stats is not None:
+                start = time.perf_counter_ns()
+            lines = 0
+            # Lines cut across reads are held back until the rest of the line arrives
+            for line in self.line_assembler.feed(output):
+                self.tracker.process_line(line)
+                lines += 1
+            if self.stats is not None:
+                self.stats.record('process_ns', time.perf_counter_ns() - start)
+                self.stats.record('lines_per_read', lines)
+                self.stats.count('lines', lines)
+
+    def flush_output(self):
+        """ Hands any partial line still held by the line assembler to the tracker. """
+        if self.tracker:
+            for line in self.line_assembler.flush():
+                self.tracker.process_line(line)
+
+    def tick(self):
+        """ Emits window summaries that are due, and switches to reloaded patterns, even when no line arrives. """
+        if self.tracker:
+            self.tracker.tick()
@@ -0,0 +1,56 @@
+import re
+
+# CSI sequences (colours, cursor moves) and the two character escapes some terminals emit
+ANSI_ESCAPE_REGEX = re.compile(r"\x1b(?:\[[0-9;?]*[ -/]*[@-~]|[@-Z\\-_])")
+# A line that is nothing but a device prompt, e.g. "APBC8D#" or "switch>"
+DEFAULT_PROMPT_REGEX = r"^[\w.\-]+[>#]\s*$"
+
+class LineAssembler:
+    # A partial line longer than this is handed on as is rather than buffered without limit
+    MAX_PARTIAL = 65536
+
+    def __init__(self, prompt_regex=DEFAULT_PROMPT_REGEX):
+        """
+        Turns the chunks returned by read_channel() into complete lines.
+
+        A line cut across two reads is carried forward and joined with the rest of it on the next read,
+        so the tracker never sees fragments. Carriage returns and ANSI escape sequences are removed once
+        per chunk (and only when the chunk contains them), and blank lines and bare prompts are dropped.
+
+        :param prompt_regex: Regex for lines that are only a device prompt, or None to keep them
+        """
+        self.partial = ""
+        self.prompt = re.compile(prompt_regex) if prompt_regex else None
+
+    def feed(self, chunk):
+        """
+        Adds a chunk of channel output and yields every line it completes.
+
+        :param chunk: Text as returned by read_channel()
+        """
+        if '\r' in chunk:
+            chunk = chunk.replace('\r', '')
+        if '\x1b' in chunk:
+            chunk = ANSI_ESCAPE_REGEX.sub('', chunk)
+        if self.partial:
+            chunk = self.partial + chunk
+        start = 0
+        end = chunk.find('\n')
+        while end != -1:
+            if end > start:
+                line = chunk[start:end]
+                if not line.isspace() and not (self.prompt and self.prompt.match(line)):
+                    yield line
+            start = end + 1
+            end = chunk.find('\n', start)
+        self.partial = chunk[start:] if start < len(chunk) else ""
+        if len(self.partial) > self.MAX_PARTIAL:
+            yield from self.flush()
+
+    def flush(self):
+        """
+        Yields whatever partial line is still buffered, e.g. when monitoring ends.
+        """
+        line, self.partial = self.partial, ""
+        if line and not line.isspace() and not (self.prompt and self.prompt.match(line)):
+            yield line
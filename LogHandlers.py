@@ -0,0 +1,303 @@
+import gzip, json, logging, os, queue, shutil, threading, time
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
+
+class InProcessQueueHandler(QueueHandler):
+
+    def prepare(self, record):
+        """
+        The queue never leaves the process and the logger has no other handler, so the record can
+        be queued as is. Merging args into the message and formatting are left to the writer thread
+        instead of being done (and the record copied) on the device thread.
+        """
+        return record
+
+class BufferedFileHandler(logging.FileHandler):
+    # Set to a LogIndexWriter to build the file's sidecar index while writing (log_index)
+    log_index = None
+
+    def __init__(self, filename, flush_interval=1.0, buffer_size=65536, **kwargs):
+        """
+        FileHandler that batches writes: records collect in a buffer of buffer_size bytes and the
+        file is flushed at most once per flush_interval seconds instead of after every record.
+        """
+        self.flush_interval = flush_interval
+        self.buffer_size = buffer_size
+        self.last_flush = time.monotonic()
+        super().__init__(filename, **kwargs)
+
+    def _open(self):
+        return open(self.baseFilename, self.mode, buffering=self.buffer_size, encoding=self.encoding, errors=self.errors)
+
+    def emit(self, record):
+        if self.log_index is None:
+            super().emit(record)
+            return
+        try:
+            msg = self.format(record) + self.terminator
+            if self.stream is None:
+                self.stream = self._open()
+            self.log_index.add(record, msg)
+            self.stream.write(msg)
+            self.flush()
+        except RecursionError:
+            raise
+        except Exception:
+            self.handleError(record)
+
+    def flush(self):
+        # StreamHandler.emit calls flush after every record; only pass it on once the interval is up
+        if time.monotonic() - self.last_flush >= self.flush_interval:
+            self.force_flush()
+
+    def force_flush(self):
+        """ Writes out everything buffered so far. """
+        self.acquire()
+        try:
+            if self.stream and hasattr(self.stream, "flush"):
+                self.stream.flush()
+            if self.log_index is not None:
+                self.log_index.flush()
+        finally:
+            self.release()
+        self.last_flush = time.monotonic()
+
+    def close(self):
+        self.acquire()
+        try:
+            if self.log_index is not None:
+                self.log_index.close()
+                self.log_index = None
+        finally:
+            self.release()
+        super().close()
+
+def compress_file(path, method='gzip'):
+    """
+    Compresses path with zstd (when the zstandard package is installed) or gzip and removes the original.
+
+    :return: Path of the compressed file
+    """
+    if method == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            method = 'gzip'
+    if method == 'zstd':
+        target = path + '.zst'
+        with open(path, 'rb') as source, open(target, 'wb') as destination:
+            zstandard.ZstdCompressor().copy_stream(source, destination)
+    else:
+        target = path + '.gz'
+        with open(path, 'rb') as source, gzip.open(target, 'wb') as destination:
+            shutil.copyfileobj(source, destination)
+    os.remove(path)
+    return target
+
+class SegmentCompressor:
+
+    def __init__(self, method='gzip'):
+        """
+        Compresses rotated log segments on a background thread so device threads never wait on it.
+        The thread is started when there is work and exits once the queue is empty; it is not a
+        daemon, so segments still waiting at exit are compressed before the process ends.
+        """
+        self.method = method
+        self.jobs = queue.SimpleQueue()
+        self.lock = threading.Lock()
+        self.worker = None
+
+    def submit(self, path, callback=None):
+        """ Queues path for compression; callback(compressed_path) runs on the worker when it is done. """
+        self.jobs.put((path, callback))
+        with self.lock:
+            if self.worker is None or not self.worker.is_alive():
+                self.worker = threading.Thread(target=self._run, name="log-compressor")
+                self.worker.start()
+
+    def _run(self):
+        while True:
+            try:
+                path, callback = self.jobs.get_nowait()
+            except queue.Empty:
+                with self.lock:
+                    if self.jobs.empty():
+                        self.worker = None
+                        return
+                continue
+            try:
+                compressed = compress_file(path, self.method)
+            except OSError as e:
+                logging.getLogger(__name__).warning(f"Could not compress {path}: {e}")
+                compressed = path
+            if callback:
+                callback(compressed)
+
+    def wait(self):
+        """ Blocks until every queued segment has been compressed. """
+        with self.lock:
+            worker = self.worker
+        if worker is not None:
+            worker.join()
+
+class RotatingDeviceFileHandler(BufferedFileHandler):
+
+    def __init__(self, filename, max_bytes=0, rotate_interval=0, compressor=None, flush_interval=0, buffer_size=8192, **kwargs):
+        """
+        Device log file that is rotated once it reaches max_bytes and/or at every rotate_interval seconds
+        of wall-clock time (0 disables either). Rotated segments are renamed to <name>.<n>.log and handed
+        to the compressor, and <name>.index.jsonl gets one line per segment with its time range so tools
+        can go straight to the segment they need.
+
+        :param compressor: SegmentCompressor for rotated segments, or None to leave them uncompressed
+        """
+        self.max_bytes = max_bytes
+        self.rotate_interval = rotate_interval
+        self.compressor = compressor
+        self.stem, self.extension = os.path.splitext(os.path.abspath(filename))
+        self.index_filename = f"{self.stem}.index.jsonl"
+        self.index_lock = threading.Lock()
+        self.sequence = 0
+        self.closed = False
+        self._start_segment()
+        super().__init__(filename, flush_interval, buffer_size, **kwargs)
+
+    def _start_segment(self):
+        self.segment_bytes = 0
+        self.segment_records = 0
+        self.segment_start = None
+        self.segment_end = None
+        self.next_rollover = None
+
+    def should_rotate(self, record):
+        if self.segment_records == 0:
+            return False
+        if self.max_bytes and self.segment_bytes >= self.max_bytes:
+            return True
+        return self.next_rollover is not None and record.created >= self.next_rollover
+
+    def rotate(self):
+        """ Closes the current segment, queues it for compression and starts a new file. """
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+        self.sequence += 1
+        segment = f"{self.stem}.{self.sequence:03d}{self.extension}"
+        os.rename(self.baseFilename, segment)
+        if self.log_index is not None:
+            # Offsets in a compressed segment mean nothing to the search tool, so its index is dropped
+            self.log_index.rotate(segment if self.compressor is None else None)
+        entry = self._index_entry(segment)
+        if self.compressor is not None:
+            self.compressor.submit(segment, lambda compressed: self.write_index(dict(entry, segment=os.path.basename(compressed))))
+        else:
+            self.write_index(entry)
+        self._start_segment()
+        self.stream = self._open()
+
+    def _index_entry(self, segment):
+        return {
+            "segment": os.path.basename(segment),
+            "sequence": self.sequence,
+            "start": datetime.fromtimestamp(self.segment_start).isoformat(),
+            "end": datetime.fromtimestamp(self.segment_end).isoformat(),
+            "records": self.segment_records,
+            "bytes": self.segment_bytes,
+        }
+
+    def write_index(self, entry):
+        with self.index_lock:
+            with open(self.index_filename, 'a') as index:
+                index.write(json.dumps(entry) + "\n")
+
+    def emit(self, record):
+        try:
+            msg = self.format(record)
+            if self.should_rotate(record):
+                self.rotate()
+            if self.stream is None:
+                self.stream = self._open()
+            text = msg + self.terminator
+            if self.log_index is not None:
+                self.log_index.add(record, text)
+            self.stream.write(text)
+            # max_bytes is a file size, so count the bytes the stream's encoding writes, not characters
+            self.segment_bytes += len(text.encode(self.stream.encoding, self.stream.errors))
+            self.segment_records += 1
+            if self.segment_start is None:
+                self.segment_start = record.created
+                if self.rotate_interval:
+                    self.next_rollover = (record.created // self.rotate_interval + 1) * self.rotate_interval
+            self.segment_end = record.created
+            self.flush()
+        except RecursionError:
+            raise
+        except Exception:
+            self.handleError(record)
+
+    def close(self):
+        # The segment still being written is listed in the index under its sequence number too
+        self.acquire()
+        try:
+            if not self.closed and self.segment_records:
+                self.write_index(self._index_entry(self.baseFilename) | {"sequence": self.sequence + 1})
+            self.closed = True
+        finally:
+            self.release()
+        super().close()
+
+class RoutingHandler(logging.Handler):
+
+    def __init__(self):
+        """
+        Single handler for the queue listener that hands each record to the handlers
+        registered for the logger that produced it.
+        """
+        super().__init__()
+        self.routes = {}
+
+    def add_route(self, logger_name, handler):
+        self.routes.setdefault(logger_name, []).append(handler)
+
+    def emit(self, record):
+        for handler in self.routes.get(record.name, ()):
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+    def force_flush(self):
+        for handlers in list(self.routes.values()):
+            for handler in handlers:
+                if isinstance(handler, BufferedFileHandler):
+                    handler.force_flush()
+                else:
+                    handler.flush()
+
+    def close(self):
+        for handlers in list(self.routes.values()):
+            for handler in handlers:
+                handler.close()
+        super().close()
+
+class BatchingQueueListener(QueueListener):
+
+    def __init__(self, log_queue, router, flush_interval=1.0, shutdown_event=None):
+        """
+        QueueListener whose writer thread also flushes the buffered files when the queue goes
+        quiet for flush_interval seconds, and after every record once shutdown_event is set.
+        """
+        super().__init__(log_queue, router, respect_handler_level=False)
+        self.router = router
+        self.flush_interval = flush_interval
+        self.shutdown_event = shutdown_event
+
+    def dequeue(self, block):
+        while True:
+            try:
+                return self.queue.get(block, self.flush_interval)
+            except queue.Empty:
+                self.router.force_flush()
+
+    def handle(self, record):
+        super().handle(record)
+        if self.shutdown_event is not None and self.shutdown_event.is_set():
+            self.router.force_flush()
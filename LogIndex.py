@@ -0,0 +1,151 @@
+import bisect, json, mmap, os
+
+def index_path(log_path):
+    """ The sidecar index of a device log file. """
+    return log_path + ".idx"
+
+class LogIndexWriter:
+
+    def __init__(self, log_path, interval=1.0, block_bytes=1048576):
+        """
+        Builds the sidecar index of a log file while it is written. Records are grouped into blocks
+        of at most interval seconds or block_bytes bytes; each block is appended to <log>.idx as one
+        JSON line with its time range, its byte range in the log and, per index term (pattern key or
+        alert string), the offset and time of every record logged with that term.
+
+        :param log_path: The log file the handler writes; offsets continue from its current size
+        :param interval: Seconds covered by one block, the precision of time only searches
+        :param block_bytes: Log bytes covered by one block at most
+        """
+        self.log_path = log_path
+        self.interval = interval
+        self.block_bytes = block_bytes
+        self.offset = os.path.getsize(log_path) if os.path.exists(log_path) else 0
+        self.file = open(index_path(log_path), 'a', encoding='utf-8')
+        self._start_block()
+
+    def _start_block(self):
+        self.block_start = None
+        self.block_end = None
+        self.block_offset = self.offset
+        self.block_records = 0
+        self.terms = {}
+
+    def add(self, record, text):
+        """
+        Accounts for one record about to be written as text at the current end of the log.
+        The terms come from the record's index_terms attribute (logger extra), if any.
+        """
+        created = record.created
+        if self.block_records and (created >= self.block_start + self.interval or self.offset - self.block_offset >= self.block_bytes):
+            self.write_block()
+        if self.block_start is None:
+            self.block_start = created
+        self.block_end = created
+        self.block_records += 1
+        terms = getattr(record, 'index_terms', None)
+        if terms:
+            entry = [self.offset, round(created, 3)]
+            for term in terms:
+                postings = self.terms.get(term)
+                if postings is None:
+                    self.terms[term] = [entry]
+                else:
+                    postings.append(entry)
+        self.offset += len(text.encode('utf-8', 'replace'))
+
+    def write_block(self):
+        if not self.block_records:
+            return
+        self.file.write(json.dumps({"start": round(self.block_start, 3), "end": round(self.block_end, 3), "offset": self.block_offset,
+                                    "end_offset": self.offset, "records": self.block_records, "terms": self.terms}) + "\n")
+        self._start_block()
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.write_block()
+        self.file.close()
+
+    def rotate(self, segment_path):
+        """
+        The log file was renamed to segment_path and a new, empty one is started: the index moves
+        with the segment (or is removed when segment_path is None, e.g. the segment is compressed)
+        and indexing continues from offset 0.
+        """
+        self.close()
+        if segment_path is None:
+            os.remove(index_path(self.log_path))
+        else:
+            os.replace(index_path(self.log_path), index_path(segment_path))
+        self.offset = 0
+        self.file = open(index_path(self.log_path), 'a', encoding='utf-8')
+        self._start_block()
+
+class LogIndex:
+
+    def __init__(self, log_path):
+        """
+        Reads the sidecar index of log_path. Searches memory map the log and read only the records
+        the index points at (term searches) or the blocks covering the time range (time searches).
+        """
+        self.log_path = log_path
+        self.blocks = []
+        with open(index_path(log_path), 'r', encoding='utf-8') as file:
+            for line in file:
+                try:
+                    self.blocks.append(json.loads(line))
+                except json.JSONDecodeError:
+                    break  # A block still being written when the index was read
+        self.block_ends = [block["end"] for block in self.blocks]
+
+    def terms(self):
+        """ Every indexed term with its number of records. """
+        counts = {}
+        for block in self.blocks:
+            for term, postings in block["terms"].items():
+                counts[term] = counts.get(term, 0) + len(postings)
+        return counts
+
+    def blocks_between(self, start=None, end=None):
+        """ The blocks whose time range overlaps start..end (epoch seconds, None for open ended). """
+        first = 0 if start is None else bisect.bisect_left(self.block_ends, start)
+        for block in self.blocks[first:]:
+            if end is not None and block["start"] > end:
+                return
+            yield block
+
+    def search(self, term=None, start=None, end=None, contains=None):
+        """
+        Yields the lines of the log recorded between start and end (epoch seconds, None for open
+        ended) that were indexed under term and, if given, contain the text contains. Without a term,
+        the blocks covering the time range are read, so the range is only as precise as the index
+        interval. Lines are returned as str without the line ending.
+        """
+        if not self.blocks or os.path.getsize(self.log_path) == 0:
+            return
+        needle = contains.encode('utf-8') if contains is not None else None
+        with open(self.log_path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as log:
+            for block in self.blocks_between(start, end):
+                if term is None:
+                    yield from self._scan(log, block["offset"], min(block["end_offset"], len(log)), needle)
+                    continue
+                for offset, created in block["terms"].get(term, ()):
+                    if (start is not None and created < start) or (end is not None and created > end):
+                        continue
+                    line = self._line_at(log, offset)
+                    if needle is None or needle in line:
+                        yield line.decode('utf-8', 'replace')
+
+    @staticmethod
+    def _line_at(log, offset):
+        # A record can span several lines (e.g. a traceback); the posting points at its first line
+        newline = log.find(b"\n", offset)
+        return log[offset:newline if newline != -1 else len(log)].rstrip(b"\r")
+
+    @staticmethod
+    def _scan(log, offset, end_offset, needle):
+        for line in log[offset:end_offset].splitlines():
+            if needle is None or needle in line:
+                yield line.decode('utf-8', 'replace')
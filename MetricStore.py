@@ -0,0 +1,114 @@
+import math, os, sys
+from array import array
+from datetime import datetime
+from PatternMatcher import capture_group_names
+
+class MetricStore:
+
+    def __init__(self, ip_address, output_dir='./output', export_format='csv', chunk_rows=10000):
+        """
+        Keeps the capture groups of every regex match as typed columns so they can be analysed
+        without re-parsing the text logs.
+
+        Each pattern key gets an append-only array('d') holding rows of
+        (timestamp, capture group 1, capture group 2, ...); a group that is not numeric is stored as NaN.
+        Every chunk_rows rows the buffer is written out as one chunk file:
+        metrics_<ip>_<key>_<start time>.<chunk>.csv, or .npy, a structured array numpy.load() reads
+        straight into named float64 columns.
+
+        :param ip_address: IP address of the device, used in the file names and the CSV ip column
+        :param output_dir: Directory for the chunk files
+        :param export_format: 'csv' or 'npy'
+        :param chunk_rows: Rows buffered per key before a chunk is written
+        """
+        if export_format not in ('csv', 'npy'):
+            raise ValueError(f"Unknown metrics_export format {export_format}, expected csv or npy")
+        self.ip = ip_address
+        self.output_dir = output_dir
+        self.export_format = export_format
+        self.chunk_rows = chunk_rows
+        self.started = datetime.now().strftime('%Y%m%d_%H%M%S')
+        self.columns = {}  # key -> column names
+        self.buffers = {}  # key -> array('d') of rows
+        self.chunks = {}  # key -> number of chunks written
+        os.makedirs(output_dir, exist_ok=True)
+
+    def append(self, key, timestamp, match):
+        """
+        Adds one row for a match of the pattern key.
+        """
+        buffer = self.buffers.get(key)
+        if buffer is None:
+            self.columns[key] = ('timestamp',) + capture_group_names(match.re)
+            buffer = self.buffers[key] = array('d')
+            self.chunks.setdefault(key, 0)
+        buffer.append(timestamp)
+        for value in match.groups():
+            try:
+                buffer.append(float(value))
+            except (TypeError, ValueError):
+                buffer.append(math.nan)
+        if len(buffer) >= self.chunk_rows * len(self.columns[key]):
+            self.flush(key)
+
+    def record_gap(self, start, end):
+        """
+        Adds a row (start, end, duration) to the 'gaps' series: a time range in which the device
+        sent nothing because the connection was down, so missing samples are not mistaken for quiet.
+        """
+        buffer = self.buffers.get('gaps')
+        if buffer is None:
+            self.columns['gaps'] = ('timestamp', 'end', 'duration')
+            buffer = self.buffers['gaps'] = array('d')
+            self.chunks['gaps'] = 0
+        buffer.extend((start, end, end - start))
+
+    def flush(self, key):
+        """
+        Writes the buffered rows of a key as a new chunk file and empties the buffer.
+        """
+        buffer = self.buffers[key]
+        if not buffer:
+            return
+        filename = f"{self.output_dir}/metrics_{self.ip}_{key}_{self.started}.{self.chunks[key]:05d}.{self.export_format}"
+        if self.export_format == 'npy':
+            self._write_npy(filename, self.columns[key], buffer)
+        else:
+            self._write_csv(filename, self.columns[key], buffer)
+        self.chunks[key] += 1
+        self.buffers[key] = array('d')
+
+    def reset(self, key):
+        """
+        Writes out a key's remaining rows and forgets its columns, for when its pattern (and so
+        possibly its capture groups) changed. Chunk numbering carries on so no file is overwritten.
+        """
+        if key in self.buffers:
+            self.flush(key)
+            del self.buffers[key]
+            del self.columns[key]
+
+    def _write_csv(self, filename, columns, buffer):
+        width = len(columns)
+        with open(filename, 'w') as file:
+            file.write("ip," + ",".join(columns) + "\n")
+            for start in range(0, len(buffer), width):
+                row = buffer[start:start + width]
+                file.write(f"{self.ip},{row[0]:.6f}," + ",".join("" if math.isnan(value) else f"{value:.15g}" for value in row[1:]) + "\n")
+
+    def _write_npy(self, filename, columns, buffer):
+        # NPY format 1.0 written by hand so numpy is only needed to read the chunks
+        byte_order = '<' if sys.byteorder == 'little' else '>'
+        descr = ", ".join(f"('{name}', '{byte_order}f8')" for name in columns)
+        header = f"{{'descr': [{descr}], 'fortran_order': False, 'shape': ({len(buffer) // len(columns)},), }}"
+        header += " " * (63 - (len(header) + 10) % 64) + "\n"
+        with open(filename, 'wb') as file:
+            file.write(b"\x93NUMPY\x01\x00" + len(header).to_bytes(2, 'little') + header.encode('latin1'))
+            file.write(buffer.tobytes())
+
+    def close(self):
+        """
+        Writes out every key's remaining rows.
+        """
+        for key in list(self.buffers):
+            self.flush(key)
@@ -0,0 +1,116 @@
+import threading, time
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+class DeviceStates:
+    # The states a device moves through; 'stopped' once its monitor has ended
+    STATES = ('connecting', 'streaming', 'reconnecting', 'stopped')
+
+    def __init__(self):
+        """
+        Live table of every device's state, when it entered it and how often its monitor was
+        restarted. Device threads update it, Stats serves it and the supervisor logs from it.
+        """
+        self.lock = threading.Lock()
+        self.devices = {}
+
+    def set(self, ip, state, error=None):
+        with self.lock:
+            entry = self.devices.setdefault(ip, {"state": None, "since": None, "restarts": 0, "error": None})
+            entry["state"] = state
+            entry["since"] = time.time()
+            if error is not None:
+                entry["error"] = error
+
+    def restarted(self, ip):
+        with self.lock:
+            self.devices[ip]["restarts"] += 1
+
+    def snapshot(self):
+        with self.lock:
+            return {ip: dict(entry) for ip, entry in self.devices.items()}
+
+    def counts(self):
+        """ Number of devices in each state. """
+        counts = dict.fromkeys(self.STATES, 0)
+        with self.lock:
+            for entry in self.devices.values():
+                counts[entry["state"]] = counts.get(entry["state"], 0) + 1
+        return counts
+
+    def summary(self):
+        return ", ".join(f"{count} {state}" for state, count in self.counts().items())
+
+class MonitorSupervisor:
+
+    def __init__(self, devices, shutdown_event, monitor_factory, states, logger=None,
+                 restart_policy='on-failure', max_restarts=3, restart_delay=30):
+        """
+        Runs one monitor per device on a thread pool and waits on their futures and on shutdown,
+        so it sleeps until something actually happens instead of polling every device.
+
+        A monitor that ends before shutdown (it gave up reconnecting, or raised) is restarted after
+        restart_delay seconds when restart_policy is 'on-failure', at most max_restarts times per
+        device (0 for no limit). 'never' leaves it stopped.
+
+        :param monitor_factory: Callable (device, restart) returning an object with connect_and_monitor()
+        :param states: DeviceStates the monitors report to
+        """
+        self.devices = devices
+        self.shutdown_event = shutdown_event
+        self.monitor_factory = monitor_factory
+        self.states = states
+        self.logger = logger
+        self.restart_policy = restart_policy
+        self.max_restarts = max_restarts
+        self.restart_delay = restart_delay
+        self.restarts = {}
+
+    def log(self, message):
+        if self.logger is not None:
+            self.logger.warning(message)
+
+    def run(self):
+        """ Returns once every monitor has ended, which after shutdown_event is set means cleanly shut down. """
+        shutdown = Future()
+        # The only thread that waits on shutdown_event; it turns the event into a future wait() can watch
+        def watch_shutdown():
+            self.shutdown_event.wait()
+            shutdown.set_result(True)
+        threading.Thread(target=watch_shutdown, name="shutdown-watcher", daemon=True).start()
+
+        with ThreadPoolExecutor(max_workers=max(1, len(self.devices)), thread_name_prefix="device") as executor:
+            running = {}
+            for device in self.devices:
+                self.states.set(device['ip'], 'connecting')
+                running[executor.submit(self.monitor_factory(device, False).connect_and_monitor)] = device
+            while running:
+                waiting = set(running) if shutdown.done() else set(running) | {shutdown}
+                done, _ = wait(waiting, return_when=FIRST_COMPLETED)
+                if shutdown in done:
+                    self.log(f"Shutdown requested, waiting for {len(running)} devices to clean up")
+                for future in done - {shutdown}:
+                    device = running.pop(future)
+                    self.device_ended(executor, running, device, future)
+
+    def device_ended(self, executor, running, device, future):
+        ip = device['ip']
+        error = future.exception()
+        if error is not None:
+            self.log(f"Monitor for {ip} failed: {error}")
+        self.states.set(ip, 'stopped', str(error) if error is not None else None)
+        if self.shutdown_event.is_set() or self.restart_policy == 'never':
+            return
+        restarts = self.restarts.get(ip, 0)
+        if self.max_restarts and restarts >= self.max_restarts:
+            self.log(f"Monitor for {ip} stopped after {restarts} restarts, not restarting it again")
+            return
+        self.restarts[ip] = restarts + 1
+        self.states.restarted(ip)
+        self.log(f"Monitor for {ip} stopped, restarting it in {self.restart_delay}s (restart {restarts + 1})")
+        running[executor.submit(self.restart, device)] = device
+
+    def restart(self, device):
+        if self.shutdown_event.wait(self.restart_delay):
+            return
+        self.states.set(device['ip'], 'connecting')
+        self.monitor_factory(device, True).connect_and_monitor()
@@ -0,0 +1,299 @@
+import hashlib, json, os, re, sys, threading, weakref
+from functools import lru_cache
+try:
+    from re import _parser as sre_parse, _constants as sre_constants
+except ImportError:  # Python < 3.11
+    import sre_parse, sre_constants
+
+# Repeats whose body is matched at least once still contribute required literals
+_REPEATS = tuple(getattr(sre_constants, name) for name in ('MAX_REPEAT', 'MIN_REPEAT', 'POSSESSIVE_REPEAT') if hasattr(sre_constants, name))
+
+@lru_cache(maxsize=None)
+def capture_group_names(pattern):
+    """
+    Returns a name for every capture group of a compiled pattern, in group order:
+    the group's own name when it has one, otherwise group1, group2, ...
+    """
+    names = {index: name for name, index in pattern.groupindex.items()}
+    return tuple(names.get(index, f"group{index}") for index in range(1, pattern.groups + 1))
+
+def _literal_runs(parsed):
+    """ Returns the runs of literal characters that every match of a parsed sequence must contain. """
+    runs = []
+    current = []
+    for op, value in parsed:
+        if op is sre_constants.LITERAL:
+            current.append(chr(value))
+            continue
+        if current:
+            runs.append("".join(current))
+            current = []
+        if op is sre_constants.SUBPATTERN:
+            group, add_flags, del_flags, body = value
+            if not add_flags & re.IGNORECASE:
+                runs.extend(_literal_runs(body))
+        elif op in _REPEATS and value[0] >= 1:
+            runs.extend(_literal_runs(value[2]))
+    if current:
+        runs.append("".join(current))
+    return runs
+
+def required_literal(pattern, min_length=3):
+    """
+    Returns the longest literal string every match of a compiled pattern must contain, e.g.
+    'DOT11_UPLINK_EV: parent_rssi: ' for the sample dot11_uplink_ev_regex, or None when the pattern
+    has no such literal of at least min_length characters (or matches case-insensitively).
+    """
+    try:
+        parsed = sre_parse.parse(pattern.pattern, pattern.flags)
+    except (re.error, TypeError):
+        return None
+    if parsed.state.flags & re.IGNORECASE:
+        return None
+    runs = _literal_runs(parsed)
+    longest = max(runs, key=len, default="")
+    return longest if len(longest) >= min_length else None
+
+# Matchers built by shared_matcher(), by rules hash; each lives as long as a tracker still uses it
+_shared = weakref.WeakValueDictionary()
+_shared_lock = threading.Lock()
+
+def rules_hash(regex_patterns, alert_strings):
+    """
+    Identifies one version of the rules. Pattern order is part of it (matches are reported in that
+    order), and so is the Python version, whose regex parser the cached anchors come from.
+    """
+    text = json.dumps([list(regex_patterns.items()), list(alert_strings), sys.version_info[:2]])
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]
+
+def _load_anchors(cache_dir, digest):
+    try:
+        with open(os.path.join(cache_dir, f"patterns_{digest}.json"), 'r') as file:
+            return json.load(file)["anchors"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+def _save_anchors(cache_dir, digest, anchors):
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        path = os.path.join(cache_dir, f"patterns_{digest}.json")
+        with open(f"{path}.{os.getpid()}.tmp", 'w') as file:
+            json.dump({"anchors": anchors}, file)
+        os.replace(f"{path}.{os.getpid()}.tmp", path)
+    except OSError:
+        pass  # The cache only saves time; without it the next start computes the anchors again
+
+def shared_matcher(regex_patterns, alert_strings, cache_dir=None, prefilter=False):
+    """
+    Returns the PatternMatcher for these rules, building it only for the first caller: every tracker
+    on the same config version shares one compiled matcher (patterns, combined alternation, anchor
+    index and alert matcher). Only its cache of reduced alternations grows after it is built, under
+    the matcher's own lock (see PatternMatcher._combined_without). With cache_dir the anchors, the
+    part of the build that needs the regex parser, are kept on disk under the rules hash so warm
+    starts skip that analysis. Compiled regexes cannot be stored, re compiles them on load anyway.
+    """
+    digest = rules_hash(regex_patterns, alert_strings)
+    with _shared_lock:
+        matcher = _shared.get((digest, prefilter))
+        if matcher is None:
+            anchors = _load_anchors(cache_dir, digest) if cache_dir else None
+            matcher = PatternMatcher(regex_patterns, alert_strings, anchors, prefilter)
+            if cache_dir and anchors is None:
+                _save_anchors(cache_dir, digest, matcher.anchors)
+            _shared[(digest, prefilter)] = matcher
+    return matcher
+
+class PatternMatcher:
+    # Above this many alert strings a single escaped alternation beats testing each string with 'in'
+    ALERT_REGEX_THRESHOLD = 16
+    # Upper bound on the alternations built for lines that match more than one pattern
+    MAX_REMAINING_ALTERNATIONS = 64
+
+    def __init__(self, regex_patterns, alert_strings, anchors=None, prefilter=False):
+        """
+        Compiles regex_patterns and alert_strings once so a line can be classified in a single pass.
+
+        All patterns are folded into one alternation with a marker group per key. Most lines match
+        none of the patterns, so one search of the combined regex is enough to reject them. When the
+        combined regex does hit, the alternative that hit is exact for its key and the search carries
+        on over the remaining keys, which keeps the per-key results identical to searching every
+        pattern on its own.
+
+        Each pattern also gets its longest required literal (anchor) extracted at load. With prefilter,
+        when every pattern has one, a single search for any anchor rejects the line instead, and only
+        the patterns whose anchor the line contains are searched. It is not the default: measured on
+        the sample capture it is no faster than the combined alternation at 10 patterns and slower at
+        1 and 100 (python benchmark.py prefilter).
+
+        :param regex_patterns: Dictionary of regex patterns as named strings
+        :param alert_strings: List of strings that, when found in a line, mark it as an alert
+        :param anchors: Anchor of every key computed earlier for the same patterns (see shared_matcher), or None
+        :param prefilter: Use the anchor index instead of the combined alternation when every pattern has an anchor
+        """
+        self.regex_patterns = dict(regex_patterns)
+        self.alert_strings = tuple(alert_strings)
+        self.keys = list(self.regex_patterns)
+        self.patterns = {key: re.compile(pattern) for key, pattern in self.regex_patterns.items()}
+        self._remaining = {}
+        self._remaining_lock = threading.Lock()
+        self.combined = self._compile_combined()
+        # Literal each pattern cannot match without, or None; see match_prefiltered()
+        if anchors is None or anchors.keys() != self.patterns.keys():
+            anchors = {key: required_literal(pattern) for key, pattern in self.patterns.items()}
+        self.anchors = {key: anchors[key] for key in self.keys}
+        self.unanchored = [key for key, anchor in self.anchors.items() if anchor is None]
+        anchors = sorted(set(anchor for anchor in self.anchors.values() if anchor is not None), key=len, reverse=True)
+        self._anchor_search = re.compile('|'.join(re.escape(anchor) for anchor in anchors)).search if anchors else None
+        # A pattern without an anchor would have to be searched on every line, which the combined
+        # alternation does better; a single pattern is cheapest searched on its own
+        self.prefilter = prefilter and len(self.keys) > 1 and not self.unanchored
+        if len(self.alert_strings) > self.ALERT_REGEX_THRESHOLD:
+            alternation = '|'.join(re.escape(alert) for alert in sorted(self.alert_strings, key=len, reverse=True))
+            self._alert_search = re.compile(alternation).search
+        else:
+            self._alert_search = None
+
+    def _compile_combined(self, keys=None):
+        """
+        Builds the combined alternation over keys (all patterns by default). Each pattern is followed
+        by an empty marker group so the index of the last group to match identifies the pattern that
+        hit, without wrapping the patterns in groups of their own (which stops re from using its first
+        character fast path). Returns None when the patterns cannot be safely combined (for example a
+        pattern that uses backreferences or global inline flags), in which case every line falls back
+        to searching each pattern on its own.
+
+        :return: Tuple of (compiled alternation, dictionary of marker group index to key) or None
+        """
+        keys = self.keys if keys is None else keys
+        if len(keys) < 2:
+            return None
+        marker_keys = {}
+        branches = []
+        group_count = 0
+        group_names = set()
+        for key in keys:
+            pattern = self.patterns[key]
+            if group_names & pattern.groupindex.keys() or re.search(r'\\\d|\(\?P=|\(\?\(\d', pattern.pattern):
+                # Group names must be unique once combined, and numbered backreferences and conditionals would shift
+                return None
+            group_names.update(pattern.groupindex)
+            group_count += pattern.groups + 1
+            marker_keys[group_count] = key
+            branches.append(f"(?:{pattern.pattern})()")
+        try:
+            return re.compile('|'.join(branches)), marker_keys
+        except re.error:
+            return None
+
+    def _combined_without(self, found):
+        """
+        Returns the combined alternation over the keys not in found, compiling it on first use.
+        Lines rarely match more than one or two patterns so only a handful of these are ever built.
+        The matcher is shared by every device thread, so they are built under a lock; lookups of
+        ones already built do not take it.
+        """
+        if found in self._remaining:
+            return self._remaining[found]
+        with self._remaining_lock:
+            if found not in self._remaining:
+                if len(self._remaining) >= self.MAX_REMAINING_ALTERNATIONS:
+                    return None
+                self._remaining[found] = self._compile_combined([key for key in self.keys if key not in found])
+            return self._remaining[found]
+
+    def match(self, line):
+        """
+        Classifies a line against every pattern and alert string.
+
+        :param line: The line of text to classify
+        :return: Tuple of (list of (key, match) in pattern order, True if the line contains an alert string)
+        """
+        return self.match_patterns(line), self.is_alert(line)
+
+    def match_patterns(self, line):
+        """
+        Returns the (key, match) pairs for every pattern found in the line, in pattern order.
+
+        The anchor index is used when prefilter was asked for and every pattern has an anchor,
+        otherwise the combined alternation.
+        """
+        if self.prefilter:
+            return self.match_prefiltered(line)
+        return self.match_combined(line)
+
+    def match_combined(self, line):
+        """
+        Returns the same (key, match) pairs as match_patterns(), using the combined alternation.
+
+        Each combined search finds the leftmost position any remaining pattern matches at, and the
+        first of them in pattern order. That pattern is exact, so it is removed and the search is
+        repeated over the rest from the same position until nothing else matches.
+        """
+        if self.combined is None:
+            return self.match_each(line)
+        combined, marker_keys = self.combined
+        hit = combined.search(line)
+        if hit is None:
+            return []
+        found = {}
+        while hit is not None:
+            key = marker_keys[hit.lastindex]
+            position = hit.start()
+            match = self.patterns[key].match(line, position)
+            if match is None:
+                # The pattern behaves differently inside the alternation than on its own; trust it on its own
+                return self.match_each(line)
+            found[key] = match
+            if len(found) == len(self.keys):
+                break
+            remaining = self._combined_without(frozenset(found))
+            if remaining is None:
+                # One pattern left, or too many combinations seen: search the rest one by one
+                for key in self.keys:
+                    if key not in found:
+                        match = self.patterns[key].search(line, position)
+                        if match:
+                            found[key] = match
+                break
+            combined, marker_keys = remaining
+            hit = combined.search(line, position)
+        return [(key, found[key]) for key in self.keys if key in found]
+
+    def match_prefiltered(self, line):
+        """
+        Returns the same (key, match) pairs as match_patterns(), using the anchor index instead of
+        the combined alternation: one search for any anchor rejects most lines, and otherwise only
+        the patterns whose anchor is in the line (plus those without an anchor) are searched.
+        """
+        if self._anchor_search is None or self._anchor_search(line) is None:
+            candidates = self.unanchored
+        else:
+            candidates = [key for key, anchor in self.anchors.items() if anchor is None or anchor in line]
+        matches = []
+        for key in candidates:
+            match = self.patterns[key].search(line)
+            if match:
+                matches.append((key, match))
+        return matches
+
+    def match_each(self, line):
+        """
+        Reference path: searches every pattern separately, exactly as the tracker always has.
+        """
+        matches = []
+        for key, pattern in self.patterns.items():
+            match = pattern.search(line)
+            if match:
+                matches.append((key, match))
+        return matches
+
+    def is_alert(self, line):
+        """
+        Returns True when the line contains any of the alert strings.
+        """
+        if self._alert_search is not None:
+            return self._alert_search(line) is not None
+        for alert in self.alert_strings:
+            if alert in line:
+                return True
+        return False
@@ -0,0 +1,91 @@
+import threading, time
+from collections import deque
+
+class BoundedChunkQueue:
+    POLICIES = ('block', 'drop_oldest', 'sample')
+
+    def __init__(self, max_chunks=1000, policy='block', sample_every=10):
+        """
+        Queue of channel reads between the reader and the processing thread of a device.
+
+        When the queue is full, 'block' makes the reader wait for room (nothing is lost, but the device
+        side buffer fills instead), 'drop_oldest' discards the oldest queued read to make room, and
+        'sample' keeps only one in sample_every of the reads that arrive while it is full (each kept
+        read replaces the oldest). Dropped reads are counted, and the read following a drop is flagged
+        so the processing side does not join the lines on either side of the gap.
+
+        :param max_chunks: Number of reads the queue holds
+        :param policy: 'block', 'drop_oldest' or 'sample'
+        :param sample_every: With 'sample', one in this many reads is kept while the queue is full
+        """
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown pipeline policy {policy!r}, expected one of {', '.join(self.POLICIES)}")
+        self.max_chunks = max_chunks
+        self.policy = policy
+        self.sample_every = max(1, sample_every)
+        self.chunks = deque()
+        self.condition = threading.Condition()
+        self.closed = False
+        self.gap = False
+        self.full_arrivals = 0
+        self.dropped_chunks = 0
+        self.dropped_bytes = 0
+        self.blocked_ns = 0
+        self.high_water = 0
+
+    def put(self, chunk):
+        """ Queues a read, applying the policy when the queue is full. """
+        with self.condition:
+            if len(self.chunks) >= self.max_chunks:
+                if self.policy == 'block':
+                    start = time.perf_counter_ns()
+                    while len(self.chunks) >= self.max_chunks and not self.closed:
+                        self.condition.wait()
+                    self.blocked_ns += time.perf_counter_ns() - start
+                elif self.policy == 'sample' and self.full_arrivals % self.sample_every:
+                    self.full_arrivals += 1
+                    self._drop(chunk)
+                    self.gap = True
+                    return
+                else:
+                    self.full_arrivals += 1
+                    self._drop(self.chunks.popleft()[0])
+                    if self.chunks:
+                        self.chunks[0][1] = True
+                    else:
+                        self.gap = True
+            else:
+                self.full_arrivals = 0
+            self.chunks.append([chunk, self.gap])
+            self.gap = False
+            if len(self.chunks) > self.high_water:
+                self.high_water = len(self.chunks)
+            self.condition.notify_all()
+
+    def _drop(self, chunk):
+        self.dropped_chunks += 1
+        self.dropped_bytes += len(chunk)
+
+    def get(self, timeout):
+        """
+        Returns the next (read, follows_gap) pair, or None when nothing arrives within timeout
+        seconds or the queue is closed and empty.
+        """
+        with self.condition:
+            if not self.chunks and not self.closed:
+                self.condition.wait(timeout)
+            if not self.chunks:
+                return None
+            chunk, follows_gap = self.chunks.popleft()
+            self.condition.notify_all()
+            return chunk, follows_gap
+
+    def close(self):
+        """ No more reads will be put; get() returns what is left, then None. """
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def is_drained(self):
+        with self.condition:
+            return self.closed and not self.chunks
@@ -1,8 +1,85 @@
-import re, json
+import threading, time, weakref
+from collections import OrderedDict
 import logging
+from datetime import datetime
 from DeviceLogger import DeviceLogger
 from ConfigurationLoader import ConfigLoader
+from PatternMatcher import capture_group_names, shared_matcher
+from MetricStore import MetricStore
+from Stats import Stats
+from RoamCorrelator import RoamCorrelator
+from SamplingGovernor import SamplingGovernor
+from BinaryLog import RECORD_LINE, RECORD_PATTERN
+
+class WindowSummary:
+
+    def __init__(self, start, end):
+        """
+        Accumulates the matches of one pattern key over one window: count, first/last time,
+        the first matching line and min/max/mean of every numeric capture group.
+        """
+        self.start = start
+        self.end = end
+        self.count = 0
+        self.first_time = None
+        self.last_time = None
+        self.first_message = None
+        self.group_stats = {}  # group name -> [min, max, total, samples]
+
+    def add(self, timestamp, match, line):
+        if self.count == 0:
+            self.first_time = timestamp
+            self.first_message = line
+        self.count += 1
+        self.last_time = timestamp
+        for name, value in zip(capture_group_names(match.re), match.groups()):
+            try:
+                number = float(value)
+            except (TypeError, ValueError):
+                continue  # Only numeric capture groups are summarised
+            stats = self.group_stats.get(name)
+            if stats is None:
+                self.group_stats[name] = [number, number, number, 1]
+            else:
+                if number < stats[0]:
+                    stats[0] = number
+                if number > stats[1]:
+                    stats[1] = number
+                stats[2] += number
+                stats[3] += 1
+
+    def describe(self):
+        """ Returns the one line summary of the window. """
+        first = datetime.fromtimestamp(self.first_time).strftime('%H:%M:%S.%f')[:-3]
+        last = datetime.fromtimestamp(self.last_time).strftime('%H:%M:%S.%f')[:-3]
+        groups = " ".join(f"{name} min={stats[0]:g} max={stats[1]:g} mean={stats[2] / stats[3]:.2f}"
+                          for name, stats in self.group_stats.items())
+        return f"(Count: {self.count}) first={first} last={last} {groups} | {self.first_message}"
+
 class RegexMessageTracker:
+    # Every live tracker, so a config reload can hand all of them the new matcher
+    _trackers = weakref.WeakSet()
+    _trackers_lock = threading.Lock()
+    # With instrumentation on, one line in this many is also searched pattern by pattern to time each pattern
+    PATTERN_TIMING_EVERY = 100
+
+    @staticmethod
+    def reload_all(regex_patterns, alert_strings, cache_dir=None, prefilter=False):
+        """
+        Compiles the new patterns and alert strings once and hands the matcher to every tracker.
+        Each tracker switches to it on its own thread before the next line it processes.
+
+        :return: Number of trackers that were given the new matcher
+        """
+        matcher = shared_matcher(regex_patterns, alert_strings, cache_dir, prefilter)
+        requested = time.monotonic()
+        # Handed over under the lock apply_matcher() takes it under, so a reload landing while a tracker switches is not lost
+        with RegexMessageTracker._trackers_lock:
+            trackers = list(RegexMessageTracker._trackers)
+            for tracker in trackers:
+                tracker.next_matcher = (matcher, requested)
+        return len(trackers)
+
     def __init__(self, ip_address, output_dir='./output'):
         """
         Initializes the RegexMessageTracker with a dictionary of regex patterns and sets up device-specific logging.
@@ -18,12 +95,40 @@ class RegexMessageTracker:
         self.regex_patterns = config['regex_patterns']  # Assume regex patterns are provided in config
         self.alert_strings = config['alert_strings']  # Strings for console alerts
         self.ip = ip_address
-        self.patterns = {key: re.compile(pattern) for key, pattern in self.regex_patterns.items()}
+        # Patterns and alert strings are compiled into a single pass matcher once, shared by every tracker
+        self.matcher = shared_matcher(self.regex_patterns, self.alert_strings, config.get('pattern_cache_dir'), config.get('pattern_prefilter', False))
+        self.patterns = self.matcher.patterns
+        # Set by reload_all(): (matcher, time requested) to switch to before the next line
+        self.next_matcher = None
         self.last_matched = {}
         self.match_counts = {}
         self.first_matched_message = {}
         self.last_full_match = {}
+        # 'change' logs a pattern when its matched text changes, 'recent' keeps counting the last dedup_capacity
+        # distinct texts of each key (so interleaved repeats collapse too), 'window' logs one summary per key every window_seconds
+        self.dedup_mode = config.get('dedup_mode', 'change')
+        self.dedup_capacity = max(1, config.get('dedup_capacity', 32))
+        self.recent = {}
+        self.window_seconds = config.get('window_seconds', 60)
+        self.windows = {}
+        self.next_window_end = None
+        # Optionally keep the numeric capture groups of every match as columns ('csv' or 'npy' chunks)
+        metrics_export = config.get('metrics_export', None)
+        self.metrics = MetricStore(ip_address, output_dir, metrics_export, config.get('metrics_chunk_rows', 10000)) if metrics_export else None
         self.logger = DeviceLogger.get_logger(ip_address, output_dir, console_level=logging.WARNING)
+        # Per pattern hits, evaluations and time; None (and skipped) unless instrumentation is enabled
+        self.stats = Stats.for_device(ip_address)
+        # Lines until the next one whose patterns are timed one by one; the first line is
+        self.pattern_timing_countdown = 1
+        # Time the current gap in the device output started (see gap_start), None while output flows
+        self.gap_started = None
+        # Roam start / end strings to publish to the cross device RoamCorrelator, None when it is not running
+        self.roam_events = RoamCorrelator.tracked_events(config)
+        # Above sample_threshold lines per second only 1 in N unmatched lines are written (alerts and patterns always are), None when off
+        sample_threshold = config.get('sample_threshold', 0)
+        self.governor = SamplingGovernor(sample_threshold, config.get('sample_window', 1.0), self.log_sampling) if sample_threshold > 0 else None
+        with RegexMessageTracker._trackers_lock:
+            RegexMessageTracker._trackers.add(self)
 
     def process_line(self, line):
         """
@@ -33,46 +138,173 @@ class RegexMessageTracker:
         
         :param line: The line of text to be processed
         """
-        matched_any = False  # Flag to check if any pattern matches the current line
-        for key, pattern in self.patterns.items():  # Iterate over all compiled regex patterns
-            match = pattern.search(line)  # Search for the pattern in the current line
-            if match:
-                matched_any = True  # Set flag to True if a match is found
-                # Get the full matched string
-                matched_text = match.group(0)
+        if self.next_matcher is not None:
+            self.apply_matcher()
+        if self.stats is not None:
+            matches, is_alert = self.match_with_stats(line)
+        else:
+            matches, is_alert = self.matcher.match(line)  # Classify the line against all patterns and alerts at once
+        if self.governor is not None:
+            self.governor.count_line(time.monotonic())
+        if self.dedup_mode == 'window' or self.metrics:
+            now = time.time()
+        if self.dedup_mode == 'window':
+            self.tick(now)
+        for key, match in matches:  # Only the patterns found in the line are returned
+            if self.metrics:
+                self.metrics.append(key, now, match)
+            if self.dedup_mode == 'window':
+                self.add_to_window(key, match, line, now)
+                continue
+            if self.dedup_mode == 'recent':
+                self.add_to_recent(key, match.group(0), line)
+                continue
+            # Get the full matched string
+            matched_text = match.group(0)
+            
+            # Check if the current match is different from the last match stored for this regex key
+            if self.last_matched.get(key) != matched_text:
+                # If there was a previous match (i.e., not None), log it along with its count
+                if self.last_matched.get(key) is not None:
+                    # Log the previous message that initiated the current count and its count
+                    self.log_message(key, self.first_matched_message[key], self.match_counts[key])
                 
-                # Check if the current match is different from the last match stored for this regex key
-                if self.last_matched.get(key) != matched_text:
-                    # If there was a previous match (i.e., not None), log it along with its count
-                    if self.last_matched.get(key) is not None:
-                        # Log the previous message that initiated the current count and its count
-                        self.log_message(key, self.first_matched_message[key], self.match_counts[key])
-                    
-                    # Update the last matched message to the current one and reset the count
-                    self.last_matched[key] = matched_text
-                    self.match_counts[key] = 1
-                    self.first_matched_message[key] = line  # Store the current line as the first match for this pattern
-                    # Log that a new match sequence has started - if desired uncomment if needed
-                    #self.log_direct(f"New match for {key}: {line}, count reset")
-                else:
-                    # If the current match is the same as the last, increment the count
-                    self.match_counts[key] += 1
-                    # Update the last fully matched line to the current one for reference
-                    self.last_full_match = line
-                    # Log continuation is commented out to avoid excessive logs; uncomment if needed
-                    #self.log_direct(f"Match for {key} continues: {matched_text}, count incremented to {self.match_counts[key]}")
+                # Update the last matched message to the current one and reset the count
+                self.last_matched[key] = matched_text
+                self.match_counts[key] = 1
+                self.first_matched_message[key] = line  # Store the current line as the first match for this pattern
+                # Log that a new match sequence has started - if desired uncomment if needed
+                #self.log_direct(f"New match for {key}: {line}, count reset")
             else:
-                # If no pattern is matched, optionally log this information; commented out to avoid noise
-                #self.log_direct(f"No match for {key} in line: {line}")
-                pass
+                # If the current match is the same as the last, increment the count
+                self.match_counts[key] += 1
+                # Update the last fully matched line to the current one for reference
+                self.last_full_match = line
+                # Log continuation is commented out to avoid excessive logs; uncomment if needed
+                #self.log_direct(f"Match for {key} continues: {matched_text}, count incremented to {self.match_counts[key]}")
+        if self.roam_events is not None:
+            for event in self.roam_events:
+                if event in line:
+                    RoamCorrelator.publish(time.time(), self.ip, event, line)
         # Check for alert string matches
-        if any(alert in line for alert in self.alert_strings):
+        if is_alert:
             self.log_to_console(line)
-        elif not matched_any:
-            # If the line did not match any pattern AND it wasn't set for alert, log it immediately
-            self.log_direct(line)
+        elif not matches:
+            # If the line did not match any pattern AND it wasn't set for alert, log it immediately (or a sample of them under load)
+            if self.governor is None or self.governor.admit():
+                self.log_direct(line)
+            elif self.stats is not None:
+                self.stats.count('sampled_out')
             #pass
 
+    def match_with_stats(self, line):
+        """
+        Same as self.matcher.match, with the production matcher timed as a whole (match_ns). The
+        combined search has no cost of its own per pattern, so one line in PATTERN_TIMING_EVERY is
+        also searched with each pattern on its own, as match_each does, and only those searches make
+        the per-pattern time, evaluations and hits: the busiest pattern is the slowest regex.
+        """
+        start = time.perf_counter_ns()
+        matches = self.matcher.match_patterns(line)
+        self.stats.count('match_ns', time.perf_counter_ns() - start)
+        self.pattern_timing_countdown -= 1
+        if self.pattern_timing_countdown <= 0:
+            self.pattern_timing_countdown = self.PATTERN_TIMING_EVERY
+            for key, pattern in self.matcher.patterns.items():
+                start = time.perf_counter_ns()
+                match = pattern.search(line)
+                pattern_stats = self.stats.pattern(key)
+                pattern_stats.ns += time.perf_counter_ns() - start
+                pattern_stats.evaluations += 1
+                if match:
+                    pattern_stats.hits += 1
+        start = time.perf_counter_ns()
+        is_alert = self.matcher.is_alert(line)
+        self.stats.count('alert_ns', time.perf_counter_ns() - start)
+        return matches, is_alert
+
+    def _log(self, log_function, message, *args, terms=None, fields=None):
+        """
+        Hands a message to the device logger, timing the call when instrumentation is enabled.
+        The message is only formatted with args by the handlers that write text.
+
+        :param terms: Pattern keys / alert strings the record is indexed under when log_index is on
+        :param fields: (kind, device, key, count, line) the binary log format stores instead of the text
+        """
+        extra = None
+        if terms or fields:
+            extra = {'index_terms': terms, 'record_fields': fields}
+        if self.stats is None:
+            log_function(message, *args, extra=extra)
+            return
+        start = time.perf_counter_ns()
+        log_function(message, *args, extra=extra)
+        self.stats.count('log_ns', time.perf_counter_ns() - start)
+        self.stats.count('log_records')
+
+    def add_to_window(self, key, match, line, now):
+        """
+        Adds a match to the current window of its pattern key, opening a window if there is none.
+        """
+        window = self.windows.get(key)
+        if window is None:
+            window = WindowSummary(now, now + self.window_seconds)
+            self.windows[key] = window
+            if self.next_window_end is None or window.end < self.next_window_end:
+                self.next_window_end = window.end
+        window.add(now, match, line)
+
+    def add_to_recent(self, key, matched_text, line):
+        """
+        Counts a match in the LRU of recent distinct matched texts of its pattern key. A text not
+        seen recently starts a new entry; once the key holds more than dedup_capacity texts the least
+        recently seen one is logged with its count and dropped, so memory stays bounded however many
+        distinct values (e.g. changing IPs) arrive.
+        """
+        recent = self.recent.get(key)
+        if recent is None:
+            recent = self.recent[key] = OrderedDict()
+        entry = recent.get(matched_text)
+        if entry is not None:
+            entry[0] += 1
+            recent.move_to_end(matched_text)
+            return
+        recent[matched_text] = [1, line]
+        if len(recent) > self.dedup_capacity:
+            _, (count, message) = recent.popitem(last=False)
+            self.log_message(key, message, count)
+            if self.stats is not None:
+                self.stats.count('dedup_evictions')
+
+    def flush_recent(self, key):
+        """ Logs every entry of a key's LRU, least recently seen first, and drops them. """
+        for count, message in self.recent.pop(key, {}).values():
+            self.log_message(key, message, count)
+
+    def tick(self, now=None):
+        """
+        Logs the summary of every window that has ended. Cheap to call often: it returns at once
+        until the earliest open window is due.
+        """
+        if self.next_matcher is not None:
+            self.apply_matcher()
+        if self.next_window_end is None:
+            return
+        now = time.time() if now is None else now
+        if now < self.next_window_end:
+            return
+        for key, window in list(self.windows.items()):
+            if window.end <= now:
+                self.log_window(key, window)
+                del self.windows[key]
+        self.next_window_end = min((window.end for window in self.windows.values()), default=None)
+
+    def log_window(self, key, window):
+        """
+        Logs the summary of one window for a pattern key using the device-specific logger.
+        """
+        self._log(self.logger.info, f"From~{self.ip}:Pattern [{key}] window {self.window_seconds}s: {window.describe()}", terms=(key,))
+
     def log_message(self, key, message, count):
         """
         Logs the message that has been tracked and has now changed using the device-specific logger.
@@ -81,7 +313,8 @@ class RegexMessageTracker:
         :param message: The message to log
         :param count: Number of times this message was seen before it changed
         """
-        self.logger.info(f"From~{self.ip}:Pattern [{key}]: {message} (Count: {count})")
+        self._log(self.logger.info, "From~%s:Pattern [%s]: %s (Count: %s)", self.ip, key, message, count,
+                  terms=(key,), fields=(RECORD_PATTERN, self.ip, key, count, message))
 
     def log_direct(self, line):
         """
@@ -89,18 +322,105 @@ class RegexMessageTracker:
         
         :param line: The line of text to log
         """
-        self.logger.info(f"From~{self.ip}:{line}")
+        self._log(self.logger.info, "From~%s:%s", self.ip, line, fields=(RECORD_LINE, self.ip, None, 0, line))
 
     def log_to_console(self, message):
         """
         Logs the message to the console specifically for alert strings.
         """
-        self.logger.warning(f"From~{self.ip}:{message}")
+        self._log(self.logger.warning, "From~%s:%s", self.ip, message, terms=[alert for alert in self.alert_strings if alert in message],
+                  fields=(RECORD_LINE, self.ip, None, 0, message))
 
-    def finish(self):
+    def log_sampling(self, message):
         """
-        Ensures all remaining messages are logged when monitoring is completed.
+        Logs a sampling transition of the governor to the device log and the console.
+        """
+        self._log(self.logger.warning, "SAMPLING %s %s", self.ip, message, terms=("SAMPLING",))
+
+    def apply_matcher(self):
+        """
+        Switches to the matcher handed over by reload_all(). Keys that were removed, or whose regex
+        changed, have their pending count, window and metrics written out first, since what has been
+        accumulated for them no longer matches the new pattern.
+        """
+        with RegexMessageTracker._trackers_lock:
+            pending, self.next_matcher = self.next_matcher, None
+        if pending is None:
+            return
+        matcher, requested = pending
+        old_patterns = self.matcher.regex_patterns
+        new_patterns = matcher.regex_patterns
+        ended = [key for key in old_patterns if new_patterns.get(key) != old_patterns[key]]
+        added = [key for key in new_patterns if old_patterns.get(key) != new_patterns[key]]
+        for key in ended:
+            if self.first_matched_message.get(key):
+                self.log_message(key, self.first_matched_message[key], self.match_counts[key])
+            self.last_matched.pop(key, None)
+            self.match_counts.pop(key, None)
+            self.first_matched_message.pop(key, None)
+            self.flush_recent(key)
+            window = self.windows.pop(key, None)
+            if window is not None:
+                self.log_window(key, window)
+            if self.metrics:
+                self.metrics.reset(key)
+        self.next_window_end = min((window.end for window in self.windows.values()), default=None)
+        self.matcher = matcher
+        self.patterns = matcher.patterns
+        self.regex_patterns = matcher.regex_patterns
+        self.alert_strings = matcher.alert_strings
+        self._log(self.logger.warning, f"Patterns reloaded for {self.ip} {(time.monotonic() - requested) * 1000:.1f}ms after the change was seen: "
+                                       f"{len(self.patterns)} patterns, {len(self.alert_strings)} alert strings, "
+                                       f"removed or changed {ended or 'none'}, added {added or 'none'}")
+
+    def flush_pending(self):
+        """
+        Logs every count and window still being accumulated and starts them over.
         """
         for pattern, message in self.first_matched_message.items():
             if message:
                 self.log_message(pattern, message, self.match_counts[pattern])
+        self.last_matched = {}
+        self.match_counts = {}
+        self.first_matched_message = {}
+        for key in list(self.recent):
+            self.flush_recent(key)
+        for key, window in self.windows.items():
+            self.log_window(key, window)
+        self.windows = {}
+        self.next_window_end = None
+
+    def gap_start(self, reason, now=None):
+        """
+        Marks the start of a gap in the device output (the connection dropped). Pending counts are
+        logged first so none of them spans the gap.
+        """
+        if self.gap_started is not None:
+            return
+        self.flush_pending()
+        self.gap_started = now if now is not None else time.time()
+        self._log(self.logger.warning, f"GAP START {self.ip}: {reason}", terms=("GAP START",))
+
+    def gap_end(self, reason="reconnected", now=None):
+        """
+        Marks the end of the current gap in the log and, with metrics_export, in the 'gaps' metrics.
+        """
+        if self.gap_started is None:
+            return
+        end = now if now is not None else time.time()
+        started = datetime.fromtimestamp(self.gap_started).strftime('%H:%M:%S.%f')[:-3]
+        self._log(self.logger.warning, f"GAP END {self.ip}: {reason}, no output for {end - self.gap_started:.1f}s since {started}", terms=("GAP END",))
+        if self.metrics:
+            self.metrics.record_gap(self.gap_started, end)
+        self.gap_started = None
+
+    def finish(self):
+        """
+        Ensures all remaining messages are logged when monitoring is completed.
+        """
+        self.flush_pending()
+        self.gap_end("monitoring stopped")
+        if self.governor is not None and self.governor.sampling:
+            self.log_sampling("still on when monitoring stopped, " + self.governor.describe())
+        if self.metrics:
+            self.metrics.close()
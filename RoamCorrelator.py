@@ -0,0 +1,200 @@
+import heapq, itertools, queue, threading, time
+from collections import deque
+
+class RoamEpisode:
+    __slots__ = ('ip', 'start', 'line', 'steps', 'done')
+
+    def __init__(self, ip, start, line):
+        """
+        One roam in progress: the device and time of its start event and, per end event, the
+        (time, device) it was seen at. done is set once it has been reported.
+        """
+        self.ip = ip
+        self.start = start
+        self.line = line
+        self.steps = {}
+        self.done = False
+
+    def describe(self):
+        steps = ", ".join(f"{event} on {ip} +{(seen - self.start) * 1000:.1f}ms"
+                          for event, (seen, ip) in sorted(self.steps.items(), key=lambda item: item[1][0]))
+        description = f"{self.ip}: {steps or 'no end events'}"
+        return f"{description} | {self.line}" if self.line else description
+
+class RoamCorrelator:
+    # Set by start() (or set_queue() in a worker process): trackers put their roam events here
+    _queue = None
+    _instance = None
+    _thread = None
+
+    @staticmethod
+    def tracked_events(config):
+        """ The strings a tracker looks for in each line: roam_start first, then the roam_end events. """
+        if not config.get('roam_start') or RoamCorrelator._queue is None:
+            return None
+        return [config['roam_start']] + list(config.get('roam_end', []))
+
+    @staticmethod
+    def set_queue(event_queue):
+        """ Trackers created from now on send their roam events to event_queue (a multiprocessing queue in a worker). """
+        RoamCorrelator._queue = event_queue
+
+    @staticmethod
+    def event_queue():
+        """ The queue trackers publish to, None when the correlator is not running. """
+        return RoamCorrelator._queue
+
+    @staticmethod
+    def publish(timestamp, ip, event, line):
+        RoamCorrelator._queue.put((timestamp, ip, event, line))
+
+    @staticmethod
+    def start(config, logger, event_queue=None):
+        """
+        Starts the correlation thread reading from event_queue (a new queue when None) and makes
+        trackers created from now on publish to it. Call stop() at exit to report the open roams.
+        """
+        RoamCorrelator._queue = event_queue if event_queue is not None else queue.SimpleQueue()
+        RoamCorrelator._instance = RoamCorrelator(config['roam_start'], config.get('roam_end', []), config.get('roam_window', 10), logger)
+        RoamCorrelator._thread = threading.Thread(target=RoamCorrelator._instance.run, args=(RoamCorrelator._queue,), name="roam-correlator", daemon=True)
+        RoamCorrelator._thread.start()
+
+    @staticmethod
+    def stop():
+        """ Processes every queued event, reports the roams still open and logs the totals. """
+        if RoamCorrelator._thread is None:
+            return
+        RoamCorrelator._queue.put(None)
+        RoamCorrelator._thread.join()
+        RoamCorrelator._instance.finish()
+        RoamCorrelator._thread = None
+
+    def __init__(self, start_event, end_events, window=10, logger=None):
+        """
+        Pairs roam start events with the end events that follow them, on the same device or any
+        other, into roam episodes. Each end event is matched to the oldest open roam still waiting
+        for it within window seconds, preferring one started on the same device; a roam is reported
+        once every end event has been seen, or as incomplete when window runs out.
+
+        Open roams are kept in heaps ordered by start time: one for expiry and, per end event, one of
+        the roams still waiting for it (plus one per device). Stale heap entries are dropped when they
+        reach the top, so every event costs O(log n) in the number of open roams.
+
+        :param start_event: Event (alert string) that starts a roam, e.g. "to [DOT11_UPLINK_FT_AUTHENTICATING]"
+        :param end_events: Events that all have to follow for the roam to be complete
+        :param window: Seconds a roam may take before it is reported as incomplete
+        :param logger: Logger the episodes are written to, or None to only count them
+        """
+        self.start_event = start_event
+        self.end_events = list(end_events)
+        self.window = window
+        self.logger = logger
+        self.sequence = itertools.count()
+        self.open = []
+        self.waiting = {event: [] for event in self.end_events}
+        self.waiting_by_device = {}
+        # The open roam of each device, so a new start on the same device closes the previous one
+        self.current = {}
+        self.completed = 0
+        self.incomplete = 0
+        self.unmatched = 0
+        # Durations of the latest completed roams, for the summary
+        self.durations = deque(maxlen=10000)
+
+    def run(self, event_queue):
+        """ Correlates events from event_queue until it yields None. """
+        while True:
+            try:
+                event = event_queue.get(timeout=1)
+            except queue.Empty:
+                # Quiet period: roams that ran out of window are still reported
+                self.expire(time.time())
+                continue
+            if event is None:
+                return
+            self.add(*event)
+
+    def add(self, timestamp, ip, event, line=None):
+        self.expire(timestamp)
+        if event == self.start_event:
+            self.start_roam(timestamp, ip, line)
+        elif event in self.waiting:
+            self.end_event(timestamp, ip, event)
+
+    def start_roam(self, timestamp, ip, line):
+        previous = self.current.get(ip)
+        if previous is not None and not previous.done:
+            self.report(previous, "restarted")
+        episode = RoamEpisode(ip, timestamp, line)
+        entry = (timestamp, next(self.sequence), episode)
+        heapq.heappush(self.open, entry)
+        for event in self.end_events:
+            heapq.heappush(self.waiting[event], entry)
+            heapq.heappush(self.waiting_by_device.setdefault((event, ip), []), entry)
+        self.current[ip] = episode
+
+    def end_event(self, timestamp, ip, event):
+        episode = self.oldest_waiting(self.waiting_by_device.get((event, ip)), event)
+        if episode is None:
+            episode = self.oldest_waiting(self.waiting[event], event)
+        if episode is None:
+            # An end event with no roam open, e.g. the peer side of a roam that started before monitoring
+            self.unmatched += 1
+            return
+        episode.steps[event] = (timestamp, ip)
+        if len(episode.steps) == len(self.end_events):
+            self.report(episode, "complete")
+
+    def oldest_waiting(self, heap, event):
+        """ Pops finished roams and ones that already have event off heap and returns the oldest left, or None. """
+        while heap:
+            episode = heap[0][2]
+            if not episode.done and event not in episode.steps:
+                return episode
+            heapq.heappop(heap)
+        return None
+
+    def expire(self, now):
+        """ Reports every roam that started more than window seconds before now as incomplete. """
+        while self.open and self.open[0][0] < now - self.window:
+            _, _, episode = heapq.heappop(self.open)
+            if not episode.done:
+                self.report(episode, "incomplete")
+            # It is the oldest entry of its waiting heaps, so they can be trimmed here and stay bounded
+            for event in self.end_events:
+                self.oldest_waiting(self.waiting[event], event)
+                key = (event, episode.ip)
+                heap = self.waiting_by_device.get(key)
+                if heap is not None and self.oldest_waiting(heap, event) is None:
+                    del self.waiting_by_device[key]
+            if self.current.get(episode.ip) is episode:
+                del self.current[episode.ip]
+
+    def report(self, episode, outcome):
+        episode.done = True
+        if outcome == "complete":
+            self.completed += 1
+            duration = max(seen for seen, _ in episode.steps.values()) - episode.start
+            self.durations.append(duration)
+            message = f"Roam complete in {duration * 1000:.1f}ms: {episode.describe()}"
+        else:
+            self.incomplete += 1
+            missing = [event for event in self.end_events if event not in episode.steps]
+            message = f"Roam {outcome}, missing {missing}: {episode.describe()}"
+        if self.logger is not None:
+            self.logger.warning(message)
+
+    def finish(self):
+        """ Reports the roams still open and the totals. """
+        for _, _, episode in sorted(self.open):
+            if not episode.done:
+                self.report(episode, "incomplete at shutdown")
+        self.open = []
+        if self.logger is None:
+            return
+        durations = sorted(self.durations)
+        summary = f"Roams: {self.completed} complete, {self.incomplete} incomplete, {self.unmatched} end events without a roam"
+        if durations:
+            summary += (f", duration median {durations[len(durations) // 2] * 1000:.1f}ms"
+                        f" p95 {durations[int(len(durations) * 0.95)] * 1000:.1f}ms max {durations[-1] * 1000:.1f}ms")
+        self.logger.warning(summary)
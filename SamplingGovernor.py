@@ -0,0 +1,88 @@
+import math
+
+class SamplingGovernor:
+    # Sampling stops once the line rate is back under this fraction of the threshold, so it does not flap
+    RESUME_FRACTION = 0.8
+
+    def __init__(self, threshold, window=1.0, log=None):
+        """
+        Watches a device's line rate and, while it is above threshold lines per second, lets only
+        one in N of the unmatched lines be written, N chosen so about threshold lines per second
+        still are. Pattern matches and alert lines are not affected; they never ask admit().
+        Every unmatched line is counted, written or not.
+
+        :param threshold: Lines per second above which unmatched lines are sampled
+        :param window: Seconds over which the rate is measured
+        :param log: Callable taking the message of each transition, or None
+        """
+        self.threshold = threshold
+        self.window = window
+        self.log = log
+        self.window_start = None
+        self.window_lines = 0
+        # 1 while every unmatched line is written
+        self.every = 1
+        self.position = 0
+        self.unmatched = 0
+        self.written = 0
+        # Counts since sampling last started, for the transition messages
+        self.sampling_unmatched = 0
+        self.sampling_written = 0
+        self.peak_every = 1
+
+    @property
+    def sampling(self):
+        return self.every > 1
+
+    def count_line(self, now):
+        """ Counts one line of the device (matched or not) at monotonic time now. """
+        if self.window_start is None:
+            self.window_start = now
+        self.window_lines += 1
+        elapsed = now - self.window_start
+        # A flood is caught as soon as the window has more lines than it may, not only when it ends.
+        # The rate is still taken over the whole window: a second of lines can arrive in one read,
+        # microseconds apart, and dividing by that would make the rate look thousands of times higher
+        if elapsed >= self.window or (self.every == 1 and self.window_lines > self.threshold * self.window):
+            self.adjust(self.window_lines / max(elapsed, self.window))
+            self.window_start = now
+            self.window_lines = 0
+
+    def adjust(self, rate):
+        if rate > self.threshold:
+            every = math.ceil(rate / self.threshold)
+            if not self.sampling:
+                self.sampling_unmatched = 0
+                self.sampling_written = 0
+                self.peak_every = every
+                self._log(f"on: {rate:.0f} lines/s is over {self.threshold} lines/s, writing 1 in {every} unmatched lines")
+            self.every = every
+            self.peak_every = max(self.peak_every, every)
+        elif self.sampling and rate <= self.threshold * self.RESUME_FRACTION:
+            self.every = 1
+            self.position = 0
+            self._log(f"off: {rate:.0f} lines/s, " + self.describe())
+
+    def admit(self):
+        """ Returns True when the unmatched line being processed should be written. """
+        self.unmatched += 1
+        if self.every == 1:
+            self.written += 1
+            return True
+        self.sampling_unmatched += 1
+        self.position += 1
+        if self.position < self.every:
+            return False
+        self.position = 0
+        self.written += 1
+        self.sampling_written += 1
+        return True
+
+    def describe(self):
+        """ What sampling has left out since it last started. """
+        return (f"{self.sampling_unmatched - self.sampling_written} of {self.sampling_unmatched} unmatched lines "
+                f"were not written while sampling (at most 1 in {self.peak_every} written)")
+
+    def _log(self, message):
+        if self.log is not None:
+            self.log(message)
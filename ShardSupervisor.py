@@ -0,0 +1,133 @@
+import logging, multiprocessing, multiprocessing.connection, queue, signal, threading
+from logging.handlers import QueueListener
+from ConfigurationLoader import ConfigLoader
+from BringUp import BringUpScheduler, collect_credentials
+from DeviceLogger import DeviceLogger
+from Stats import Stats
+from MonitorSupervisor import MonitorSupervisor, DeviceStates
+from RoamCorrelator import RoamCorrelator
+
+# How often a worker sends its device stats to the supervisor
+STATS_PUBLISH_INTERVAL = 1.0
+
+def shard_devices(devices, count):
+    """ Splits devices round robin into at most count non-empty lists. """
+    shards = [devices[index::count] for index in range(count)]
+    return [shard for shard in shards if shard]
+
+def needs_credentials(config):
+    """ Simulated devices are the only ones that do not need a password. """
+    return not (config.get('engine', 'threads') == 'asyncio' and config.get('transport', 'asyncssh') == 'simulated')
+
+def run_worker(index, devices, config_file, overrides, shutdown_event, console_queue, stats_queue, roam_queue=None):
+    """
+    Entry point of a worker process: monitors its share of the devices with the configured engine
+    until the supervisor sets shutdown_event, then runs the usual undebug all cleanup.
+
+    :param overrides: Settings applied on top of config_file, e.g. a different output_dir
+    :param console_queue: multiprocessing queue the console output is sent to
+    :param stats_queue: multiprocessing queue for device stats, or None when instrumentation is off
+    :param roam_queue: multiprocessing queue of the supervisor's RoamCorrelator, or None when it is not running
+    """
+    # Ctrl-C reaches every process in the group; only the supervisor acts on it and tells the workers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    config = ConfigLoader(config_file).get_configuration()
+    config.update(overrides)
+    DeviceLogger.set_console_queue(console_queue)
+    DeviceLogger.configure(config, shutdown_event)
+    if roam_queue is not None:
+        RoamCorrelator.set_queue(roam_queue)
+
+    if config.get('config_reload_interval'):
+        # Each worker watches the file itself and swaps the patterns into its own trackers
+        from ConfigWatcher import ConfigWatcher
+        ConfigWatcher(config['config_reload_interval'], shutdown_event).start()
+
+    publisher = None
+    if stats_queue is not None:
+        Stats.enable()
+        def publish():
+            while not shutdown_event.wait(STATS_PUBLISH_INTERVAL):
+                stats_queue.put(Stats.snapshot())
+        publisher = threading.Thread(target=publish, name=f"worker-{index}-stats", daemon=True)
+        publisher.start()
+
+    if config.get('engine', 'threads') == 'asyncio':
+        import AsyncDeviceMonitor
+        AsyncDeviceMonitor.run(devices, shutdown_event)
+    else:
+        from DeviceMonitor import DeviceMonitor
+        bring_up = BringUpScheduler(len(devices), config.get('connect_concurrency', 20))
+        states = DeviceStates()
+        Stats.device_states = states
+        monitor_factory = lambda device, restart: DeviceMonitor(device, shutdown_event, None if restart else bring_up, states)
+        MonitorSupervisor(devices, shutdown_event, monitor_factory, states, None, config.get('restart_policy', 'on-failure'),
+                          config.get('max_restarts', 3), config.get('restart_delay', 30)).run()
+
+    DeviceLogger.stop_queue()
+    if stats_queue is not None:
+        # Final figures, including everything counted during shutdown
+        stats_queue.put(Stats.snapshot())
+
+def drain_stats(stats_queue):
+    """ Merges every device stats snapshot already sent by the workers into Stats. """
+    while True:
+        try:
+            Stats.merge(stats_queue.get_nowait())
+        except queue.Empty:
+            return
+
+def run(devices, shutdown_event, processes, config_file='config.json', overrides=None):
+    """
+    Supervisor: partitions devices across processes worker processes and waits for them.
+
+    Passwords are asked for here, since workers have no terminal. Setting shutdown_event (the
+    SIGINT handler does) is passed on to every worker so each device still gets its undebug all.
+    Console output of every worker is printed by this process, and with Stats enabled the workers'
+    device stats are merged into Stats here so the reporter and the stats server see every device.
+    Roam events of every worker go to the RoamCorrelator of this process when it is running.
+
+    :param shutdown_event: threading.Event of the supervisor
+    :param overrides: Settings applied on top of config_file in every worker
+    """
+    overrides = overrides or {}
+    config = dict(ConfigLoader(config_file).get_configuration(), **overrides)
+    if needs_credentials(config):
+        collect_credentials(devices)
+
+    # spawn rather than fork: workers must not inherit the supervisor's logging threads and queues
+    context = multiprocessing.get_context('spawn')
+    worker_shutdown = context.Event()
+    console_queue = context.Queue()
+    stats_queue = context.Queue() if Stats.enabled else None
+    console = QueueListener(console_queue, logging.StreamHandler())
+    console.start()
+
+    shards = shard_devices(devices, processes)
+    # The connection limit is for the whole run, so each worker gets its share of it
+    worker_overrides = dict(overrides, connect_concurrency=max(1, config.get('connect_concurrency', 20) // max(1, len(shards))))
+    workers = [context.Process(target=run_worker, name=f"monitor-worker-{index}",
+                               args=(index, shard, config_file, worker_overrides, worker_shutdown, console_queue, stats_queue,
+                                     RoamCorrelator.event_queue()))
+               for index, shard in enumerate(shards)]
+    for worker in workers:
+        worker.start()
+    # Shutdown is passed on to the workers from its own thread, so the loop below only wakes when a worker exits or sends stats
+    threading.Thread(target=lambda: shutdown_event.wait() and worker_shutdown.set(), name="shutdown-relay", daemon=True).start()
+    try:
+        pending = {worker.sentinel for worker in workers}
+        # Queues have to be drained while the workers run or they cannot exit
+        stats_reader = stats_queue._reader if stats_queue is not None else None
+        while pending:
+            ready = multiprocessing.connection.wait(list(pending) + ([stats_reader] if stats_reader is not None else []))
+            pending.difference_update(ready)
+            if stats_reader is not None and stats_reader in ready:
+                drain_stats(stats_queue)
+        if stats_queue is not None:
+            # The final snapshots are flushed to the pipe before each worker exits
+            drain_stats(stats_queue)
+        for worker in workers:
+            worker.join()
+    finally:
+        worker_shutdown.set()
+        console.stop()
@@ -0,0 +1,210 @@
+import json, threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock
+
+class Histogram:
+
+    def __init__(self):
+        """
+        Power-of-two bucket histogram: recording is one bit_length() and one list increment,
+        and percentiles are reported as the upper bound of the bucket they fall in.
+        """
+        self.buckets = [0] * 64
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def record(self, value):
+        value = int(value)
+        self.buckets[min(value.bit_length(), 63)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, fraction):
+        if not self.count:
+            return 0
+        target = self.count * fraction
+        seen = 0
+        for index, bucket in enumerate(self.buckets):
+            seen += bucket
+            if seen >= target:
+                return min(1 << index, self.max)
+        return self.max
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0,
+            "p50": self.percentile(0.50),
+            "p99": self.percentile(0.99),
+            "max": self.max,
+        }
+
+class PatternStats:
+    __slots__ = ("hits", "evaluations", "ns")
+
+    def __init__(self):
+        self.hits = 0
+        self.evaluations = 0
+        self.ns = 0
+
+class DeviceStats:
+
+    def __init__(self, name):
+        """
+        Counters and histograms for one device. Only the device's own thread updates them.
+        """
+        self.name = name
+        self.counters = {}
+        self.histograms = {}
+        self.patterns = {}
+
+    def count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def record(self, name, value):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram()
+        histogram.record(value)
+
+    def pattern(self, key):
+        stats = self.patterns.get(key)
+        if stats is None:
+            stats = self.patterns[key] = PatternStats()
+        return stats
+
+    def snapshot(self):
+        return {
+            "counters": dict(self.counters),
+            "histograms": {name: histogram.snapshot() for name, histogram in list(self.histograms.items())},
+            "patterns": {key: {"hits": stats.hits, "evaluations": stats.evaluations, "ns": stats.ns}
+                         for key, stats in list(self.patterns.items())},
+        }
+
+class Stats:
+    # Instrumentation is off unless enable() is called; monitors and trackers then skip it entirely
+    enabled = False
+    _devices = {}
+    # Snapshots of devices monitored by worker processes, see merge()
+    _remote = {}
+    _remote_states = {}
+    # DeviceStates table of the running supervisor, included in snapshots when set
+    device_states = None
+    _lock = Lock()
+    _server = None
+
+    @staticmethod
+    def enable():
+        Stats.enabled = True
+
+    @staticmethod
+    def for_device(name):
+        """
+        Returns the DeviceStats for a device, or None while instrumentation is disabled.
+        """
+        if not Stats.enabled:
+            return None
+        with Stats._lock:
+            if name not in Stats._devices:
+                Stats._devices[name] = DeviceStats(name)
+            return Stats._devices[name]
+
+    @staticmethod
+    def merge(snapshot):
+        """ Adds a snapshot published by a worker process, replacing older figures of the same devices. """
+        with Stats._lock:
+            Stats._remote.update(snapshot["devices"])
+            Stats._remote_states.update(snapshot.get("device_states", {}))
+
+    @staticmethod
+    def reset():
+        """ Forgets every device, local and remote. """
+        with Stats._lock:
+            Stats._devices = {}
+            Stats._remote = {}
+            Stats._remote_states = {}
+
+    @staticmethod
+    def snapshot():
+        """ Returns every device's stats plus the depth of the log queue as a plain dictionary. """
+        from DeviceLogger import DeviceLogger
+        with Stats._lock:
+            devices = list(Stats._devices.values())
+            remote = dict(Stats._remote)
+            remote_states = dict(Stats._remote_states)
+        log_queue = DeviceLogger._queue
+        snapshot = {
+            "devices": remote | {device.name: device.snapshot() for device in devices},
+            "log_queue_depth": log_queue.qsize() if log_queue is not None else 0,
+        }
+        if Stats.device_states is not None or remote_states:
+            local_states = Stats.device_states.snapshot() if Stats.device_states is not None else {}
+            snapshot["device_states"] = remote_states | local_states
+        return snapshot
+
+    @staticmethod
+    def summary_lines():
+        """ One line per device for the periodic dump: the busiest pattern and the read and process times. """
+        snapshot = Stats.snapshot()
+        lines = [f"Stats: log queue depth {snapshot['log_queue_depth']}"]
+        if "device_states" in snapshot:
+            counts = {}
+            for entry in snapshot["device_states"].values():
+                counts[entry["state"]] = counts.get(entry["state"], 0) + 1
+            lines.append("Stats: devices " + ", ".join(f"{count} {state}" for state, count in counts.items()))
+        for name, device in snapshot["devices"].items():
+            counters = device["counters"]
+            histograms = device["histograms"]
+            busiest = max(device["patterns"].items(), key=lambda item: item[1]["ns"], default=None)
+            busiest_text = f"{busiest[0]} {busiest[1]['ns'] / 1e6:.1f}ms/{busiest[1]['evaluations']} evals" if busiest else "none"
+            read = histograms.get("read_ns", {})
+            process = histograms.get("process_ns", {})
+            lines.append(f"Stats {name}: reads {counters.get('reads', 0)} bytes {counters.get('bytes', 0)} lines {counters.get('lines', 0)} "
+                         f"read p50 {read.get('p50', 0) / 1e6:.1f}ms process p99 {process.get('p99', 0) / 1e6:.2f}ms "
+                         f"log {counters.get('log_ns', 0) / 1e6:.1f}ms sampled out {counters.get('sampled_out', 0)} busiest pattern {busiest_text}")
+        return lines
+
+    @staticmethod
+    def start_reporter(logger, interval, shutdown_event):
+        """ Logs the summary every interval seconds until shutdown_event is set. """
+        def report():
+            while not shutdown_event.wait(interval):
+                for line in Stats.summary_lines():
+                    logger.info(line)
+        threading.Thread(target=report, name="stats-reporter", daemon=True).start()
+
+    @staticmethod
+    def start_server(port, host='127.0.0.1'):
+        """ Serves Stats.snapshot() as JSON over HTTP on host:port (GET /stats), and the device state table on GET /devices. """
+        class StatsRequestHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.rstrip('/')
+                if path == '/devices':
+                    body = json.dumps(Stats.snapshot().get("device_states", {}), indent=2).encode()
+                elif path in ('', '/stats'):
+                    body = json.dumps(Stats.snapshot(), indent=2).encode()
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # Keep request logging off the console
+
+        Stats._server = ThreadingHTTPServer((host, port), StatsRequestHandler)
+        threading.Thread(target=Stats._server.serve_forever, name="stats-server", daemon=True).start()
+        return Stats._server
+
+    @staticmethod
+    def stop_server():
+        if Stats._server is not None:
+            Stats._server.shutdown()
+            Stats._server.server_close()
+            Stats._server = None
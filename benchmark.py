@@ -0,0 +1,822 @@
+import argparse, json, multiprocessing, os, random, re, resource, shutil, sys, tempfile, time
+from datetime import datetime
+from PatternMatcher import PatternMatcher
+from LineAssembler import LineAssembler
+
+# Extra patterns in the style of config.json regex_patterns, used to grow the pattern set to a realistic size
+EXTRA_PATTERNS = {
+    "ip_tableid_regex": "IP: tableid=0, s=(\\d+\\.\\d+\\.\\d+\\.\\d+) \\(local\\), d=(\\d+\\.\\d+\\.\\d+\\.\\d+) \\(Vlan\\d+\\), routed via FIB",
+}
+
+def load_configuration(config_file):
+    """ Load the configuration section without going through the ConfigLoader singleton. """
+    with open(config_file, 'r') as file:
+        return json.load(file).get('configuration', {})
+
+def load_lines(capture_file):
+    """ Read a capture file into a list of non-empty lines. """
+    with open(capture_file, 'r', errors='replace') as file:
+        return [line.rstrip('\n') for line in file if line.strip()]
+
+def build_patterns(config, count):
+    """ Return the configured regex_patterns padded with synthetic patterns up to count entries. """
+    patterns = dict(config['regex_patterns'])
+    patterns.update(EXTRA_PATTERNS)
+    index = 0
+    while len(patterns) < count:
+        patterns[f"synthetic_{index}_regex"] = f"WGB_SYNTH_{index}: value (-?\\d+) state (\\w+)"
+        index += 1
+    return patterns
+
+def report(name, lines, elapsed):
+    print(f"{name:<28} {len(lines) / elapsed:>14,.0f} lines/sec  ({elapsed:.3f}s)")
+
+def bench_matcher(args):
+    """
+    Replays a capture file through the original per-pattern loop and through PatternMatcher,
+    checks that both classify every line the same way and reports lines/sec for each.
+    """
+    config = load_configuration(args.config)
+    lines = load_lines(args.capture) * args.repeat
+    patterns = build_patterns(config, args.patterns)
+    alert_strings = config['alert_strings']
+    matcher = PatternMatcher(patterns, alert_strings)
+
+    for line in lines:
+        expected = [(key, match.group(0)) for key, match in matcher.match_each(line)]
+        actual = [(key, match.group(0)) for key, match in matcher.match_patterns(line)]
+        if expected != actual or matcher.is_alert(line) != any(alert in line for alert in alert_strings):
+            raise SystemExit(f"Mismatch on line: {line}")
+
+    compiled = list(matcher.patterns.items())
+    start = time.perf_counter()
+    for line in lines:
+        matched_any = False
+        for key, pattern in compiled:
+            if pattern.search(line):
+                matched_any = True
+        any(alert in line for alert in alert_strings)
+    report("per-pattern search", lines, time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for line in lines:
+        matcher.match(line)
+    report("PatternMatcher", lines, time.perf_counter() - start)
+
+def bench_prefilter(args):
+    """
+    Compares the per-pattern loop, the combined alternation and the anchor index prefilter for
+    each pattern set size, after checking that the prefilter finds exactly what the per-pattern
+    loop finds on every line.
+    """
+    config = load_configuration(args.config)
+    lines = load_lines(args.capture) * args.repeat
+    for count in args.patterns:
+        patterns = dict(list(build_patterns(config, count).items())[:count])
+        matcher = PatternMatcher(patterns, config['alert_strings'])
+        for line in lines:
+            expected = [(key, match.span()) for key, match in matcher.match_each(line)]
+            if [(key, match.span()) for key, match in matcher.match_prefiltered(line)] != expected:
+                raise SystemExit(f"Prefilter mismatch on line: {line}")
+        anchored = len(matcher.keys) - len(matcher.unanchored)
+        print(f"{len(matcher.keys)} patterns, {anchored} with an anchor")
+        for name, function in (("per-pattern search", matcher.match_each), ("combined alternation", matcher.match_combined),
+                               ("anchor prefilter", matcher.match_prefiltered)):
+            start = time.perf_counter()
+            for line in lines:
+                function(line)
+            report(f"  {name}", lines, time.perf_counter() - start)
+
+def split_chunks(text, min_size, max_size, seed=1):
+    """ Cut text into randomly sized chunks the way read_channel() hands output back. """
+    rng = random.Random(seed)
+    chunks = []
+    position = 0
+    while position < len(text):
+        size = rng.randint(min_size, max_size)
+        chunks.append(text[position:position + size])
+        position += size
+    return chunks
+
+def bench_lines(args):
+    """
+    Feeds a capture file, cut into random read sized chunks, through the original split('\\n')
+    path and through LineAssembler. Reports lines that came out fragmented, the peak number of
+    extra memory blocks held while a chunk is being consumed, and lines/sec.
+    """
+    with open(args.capture, 'r', errors='replace') as file:
+        text = file.read().replace('\n', '\r\n') * args.repeat
+    whole_lines = set(line for line in text.replace('\r', '').split('\n') if line.strip())
+    chunks = split_chunks(text, args.min_chunk, args.max_chunk)
+
+    def split_path(chunk, consume):
+        lines = chunk.split('\n')
+        for line in lines:
+            if line.strip():
+                consume(line)
+
+    assembler = LineAssembler(prompt_regex=None)
+    def assembler_path(chunk, consume):
+        for line in assembler.feed(chunk):
+            consume(line)
+
+    for name, path in (("split('\\n')", split_path), ("LineAssembler", assembler_path)):
+        state = {'lines': 0, 'fragments': 0, 'peak': 0, 'blocks': 0}
+        def consume(line):
+            state['lines'] += 1
+            if line.rstrip('\r') not in whole_lines:
+                state['fragments'] += 1
+            state['peak'] = max(state['peak'], sys.getallocatedblocks() - state['blocks'])
+        for chunk in chunks:
+            state['blocks'] = sys.getallocatedblocks()
+            path(chunk, consume)
+        start = time.perf_counter()
+        for chunk in chunks:
+            path(chunk, lambda line: None)
+        elapsed = time.perf_counter() - start
+        print(f"{name:<16} {state['lines']:>9} lines {state['fragments']:>7} fragments "
+              f"{state['peak']:>6} peak blocks/chunk {state['lines'] / elapsed:>12,.0f} lines/sec")
+
+def bench_pipeline(args):
+    """
+    Simulates a device producing reads at a fixed rate while processing stalls now and then
+    (slow disk). Reports, for processing inline on the reader and for each pipeline policy, how
+    long the reader was kept from the channel, how far it fell behind the device and what was dropped.
+    """
+    import threading
+    from ReadPipeline import BoundedChunkQueue
+    config = load_configuration(args.config)
+    with open(args.capture, 'r', errors='replace') as file:
+        chunks = split_chunks(file.read() * args.repeat, args.min_chunk, args.max_chunk)
+    matcher = PatternMatcher(config['regex_patterns'], config['alert_strings'])
+    interval = 1 / args.rate
+
+    def process(chunk, assembler, processed):
+        for line in assembler.feed(chunk):
+            matcher.match(line)
+        processed[0] += 1
+        if processed[0] % args.stall_every == 0:
+            time.sleep(args.stall_ms / 1000)
+
+    def produce(put):
+        """ Hands out each chunk once it is due; returns the longest put and how late the last read was. """
+        start = time.perf_counter()
+        longest = 0
+        for index, chunk in enumerate(chunks):
+            delay = start + index * interval - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            put_start = time.perf_counter()
+            put(chunk)
+            longest = max(longest, time.perf_counter() - put_start)
+        return longest, time.perf_counter() - (start + (len(chunks) - 1) * interval)
+
+    print(f"{'mode':<12} {'longest stall ms':>17} {'behind at end ms':>17} {'dropped reads':>14}")
+    processed = [0]
+    assembler = LineAssembler(prompt_regex=None)
+    longest, behind = produce(lambda chunk: process(chunk, assembler, processed))
+    print(f"{'inline':<12} {longest * 1000:>17.1f} {behind * 1000:>17.1f} {0:>14}")
+    for policy in BoundedChunkQueue.POLICIES:
+        chunk_queue = BoundedChunkQueue(args.queue_size, policy)
+        processed = [0]
+        assembler = LineAssembler(prompt_regex=None)
+        def consume():
+            while True:
+                item = chunk_queue.get(0.1)
+                if item is None:
+                    if chunk_queue.is_drained():
+                        return
+                    continue
+                process(item[0], assembler, processed)
+        consumer = threading.Thread(target=consume)
+        consumer.start()
+        longest, behind = produce(chunk_queue.put)
+        chunk_queue.close()
+        consumer.join()
+        print(f"{policy:<12} {longest * 1000:>17.1f} {behind * 1000:>17.1f} {chunk_queue.dropped_chunks:>14}")
+
+def run_logger_load(queued, device_count, line_count, capture_file, results):
+    """ Logs line_count capture lines from each of device_count threads, in this (child) process. """
+    import threading
+    from DeviceLogger import DeviceLogger
+    output_dir = tempfile.mkdtemp(prefix='logger_')
+    if queued:
+        DeviceLogger.start_queue()
+    lines = load_lines(capture_file)
+    loggers = [DeviceLogger.get_logger(f"10.0.{index // 250}.{index % 250 + 1}", output_dir) for index in range(device_count)]
+    def device(logger):
+        for index in range(line_count):
+            logger.info(f"From~{logger.name}:{lines[index % len(lines)]}")
+    threads = [threading.Thread(target=device, args=(logger,)) for logger in loggers]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    produced = time.perf_counter() - start
+    DeviceLogger.stop_queue()
+    for logger in loggers:
+        for handler in logger.handlers:
+            handler.close()
+    results.put((produced, time.perf_counter() - start))
+
+def bench_logger(args):
+    """
+    Load test for DeviceLogger: N simulated device threads logging as fast as they can, with
+    handlers on the device threads and with the queued writer. 'device side' is how long the
+    device threads spent logging, 'written' includes draining the queue to disk.
+    """
+    total = args.devices * args.lines
+    for name, queued in (("FileHandler", False), ("QueueHandler", True)):
+        results = multiprocessing.Queue()
+        process = multiprocessing.Process(target=run_logger_load, args=(queued, args.devices, args.lines, args.capture, results))
+        process.start()
+        produced, written = results.get()
+        process.join()
+        print(f"{name:<14} device side {total / produced:>10,.0f} lines/sec   written {total / written:>10,.0f} lines/sec")
+
+def current_rss_kb():
+    """ Resident set size of this process in kB, read from /proc where available. """
+    try:
+        with open('/proc/self/status', 'r') as file:
+            for line in file:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def run_fleet(config_file, capture_file, device_count, seconds, lines_per_second, results):
+    """ Runs device_count simulated devices on the asyncio engine in this (child) process. """
+    import asyncio, threading
+    import AsyncDeviceMonitor
+    from ConfigurationLoader import ConfigLoader
+    config = ConfigLoader(config_file).get_configuration()
+    config['output_dir'] = tempfile.mkdtemp(prefix='fleet_')
+    config['console_level'] = None
+    lines = load_lines(capture_file)
+    session_factory = lambda device: AsyncDeviceMonitor.SimulatedSession(device, lines, lines_per_second)
+    devices = [{'ip': f"10.0.{index // 250}.{index % 250 + 1}"} for index in range(device_count)]
+    shutdown_event = threading.Event()
+    baseline_rss = current_rss_kb()
+    threading.Timer(seconds, shutdown_event.set).start()
+    cpu_start = time.process_time()
+    asyncio.run(AsyncDeviceMonitor.monitor_devices(devices, shutdown_event, session_factory))
+    cpu = time.process_time() - cpu_start
+    results.put((device_count, current_rss_kb() - baseline_rss, cpu))
+
+def bench_fleet(args):
+    """
+    Runs the asyncio engine against simulated devices, one child process per fleet size,
+    and reports memory and CPU per monitored device.
+    """
+    print(f"{'devices':>8} {'RSS kB/device':>14} {'CPU ms/device/s':>16}")
+    for device_count in args.devices:
+        results = multiprocessing.Queue()
+        process = multiprocessing.Process(target=run_fleet, args=(args.config, args.capture, device_count, args.seconds, args.rate, results))
+        process.start()
+        count, rss_kb, cpu = results.get()
+        process.join()
+        print(f"{count:>8} {rss_kb / count:>14.1f} {cpu * 1000 / count / args.seconds:>16.2f}")
+
+def run_rules(variant, patterns, alert_strings, device_count, cache_dir, results):
+    """ Builds the matchers of device_count trackers in this (child) process the way variant says. """
+    from PatternMatcher import shared_matcher
+    baseline_rss = current_rss_kb()
+    start = time.perf_counter()
+    if variant == "per device":
+        # What every tracker did before: its own PatternMatcher
+        matchers = [PatternMatcher(patterns, alert_strings) for _ in range(device_count)]
+    else:
+        matchers = [shared_matcher(patterns, alert_strings, cache_dir if "disk" in variant else None) for _ in range(device_count)]
+    results.put((time.perf_counter() - start, current_rss_kb() - baseline_rss, len({id(matcher) for matcher in matchers})))
+
+def bench_rules(args):
+    """
+    Startup time and RSS of the pattern matchers of a fleet of trackers: one PatternMatcher per
+    device against the shared matcher, and the shared matcher with a cold and a warm on-disk cache.
+    Each run is a fresh child process so nothing is reused from the one before.
+    """
+    config = load_configuration(args.config)
+    patterns = build_patterns(config, args.patterns)
+    cache_dir = tempfile.mkdtemp(prefix='rules_')
+    print(f"{args.devices} devices, {len(patterns)} patterns")
+    print(f"{'variant':<20} {'startup':>10} {'RSS':>10} {'matchers':>9}")
+    for variant in ("per device", "shared", "shared, disk (cold)", "shared, disk (warm)"):
+        results = multiprocessing.Queue()
+        process = multiprocessing.Process(target=run_rules, args=(variant, patterns, config['alert_strings'], args.devices, cache_dir, results))
+        process.start()
+        elapsed, rss_kb, matchers = results.get()
+        process.join()
+        print(f"{variant:<20} {elapsed * 1000:>8.1f}ms {rss_kb / 1024:>7.1f} MB {matchers:>9}")
+    shutil.rmtree(cache_dir)
+
+def bench_shard(args):
+    """
+    Runs simulated devices on the asyncio engine split across 1..N worker processes by the shard
+    supervisor and reports the lines/sec processed with each process count. Devices stream faster
+    than one core can keep up with, so the figure is the processing capacity.
+    """
+    import threading
+    import ShardSupervisor
+    from Stats import Stats
+    Stats.enable()
+    devices = [{'ip': f"10.0.{index // 250}.{index % 250 + 1}"} for index in range(args.devices)]
+    print(f"{'processes':>9} {'lines/sec':>12}")
+    for processes in args.processes:
+        Stats.reset()
+        overrides = {'engine': 'asyncio', 'transport': 'simulated', 'simulated_capture': args.capture,
+                     'simulated_lines_per_second': args.rate, 'output_dir': tempfile.mkdtemp(prefix='shard_'),
+                     'console_level': None, 'worker_processes': processes}
+        shutdown_event = threading.Event()
+        threading.Timer(args.seconds, shutdown_event.set).start()
+        ShardSupervisor.run([dict(device) for device in devices], shutdown_event, processes, args.config, overrides)
+        lines = sum(device["counters"].get("lines", 0) for device in Stats.snapshot()["devices"].values())
+        print(f"{processes:>9} {lines / args.seconds:>12,.0f}")
+
+def adversarial_lines(count, interleave, seed=1):
+    """
+    IP: tableid= lines whose addresses change on every line (high cardinality) or, with interleave,
+    cycle through that many fixed address pairs (A, B, A, B ... repeats).
+    """
+    random_addresses = random.Random(seed)
+    lines = []
+    for index in range(count):
+        if interleave:
+            source = index % interleave
+            destination = source
+        else:
+            source = random_addresses.getrandbits(24)
+            destination = random_addresses.getrandbits(24)
+        lines.append(f"IP: tableid=0, s=10.{source >> 16 & 255}.{source >> 8 & 255}.{source & 255} (local), "
+                     f"d=172.{destination >> 16 & 255}.{destination >> 8 & 255}.{destination & 255} (Vlan20), routed via FIB")
+    return lines
+
+def bench_dedup(args):
+    """
+    Feeds RegexMessageTracker adversarial IP: tableid= lines in the 'change' and 'recent' dedup modes
+    and reports the traced memory growth (tracemalloc) and the records logged: changing addresses
+    must leave memory flat, interleaved repeats must collapse in 'recent'.
+    """
+    import tracemalloc
+    from ConfigurationLoader import ConfigLoader
+    from RegexMessageTracker import RegexMessageTracker
+    config = ConfigLoader(args.config).get_configuration()
+    config['regex_patterns'] = dict(config['regex_patterns'], **EXTRA_PATTERNS)
+    config['output_dir'] = tempfile.mkdtemp(prefix='dedup_')
+    config['dedup_capacity'] = args.capacity
+    config['metrics_export'] = None
+    print(f"{'mode':<8} {'input':<14} {'lines':>9} {'records':>9} {'memory growth':>14}")
+    for mode in ('change', 'recent'):
+        config['dedup_mode'] = mode
+        for interleave in (0, 2, args.capacity):
+            label = "distinct IPs" if not interleave else f"{interleave} interleaved"
+            for count in args.lines:
+                lines = adversarial_lines(count, interleave)
+                tracker = RegexMessageTracker(f"dedup-{mode}-{interleave}-{count}", config['output_dir'])
+                records = [0]
+                def count_record(log_function, message, *args, terms=None, fields=None, records=records):
+                    records[0] += 1
+                tracker._log = count_record
+                # Warm the tracker up so the first entries and the logger's own setup are not counted as growth
+                for line in lines[:args.capacity * 2]:
+                    tracker.process_line(line)
+                tracemalloc.start()
+                baseline = tracemalloc.get_traced_memory()[0]
+                for line in lines[args.capacity * 2:]:
+                    tracker.process_line(line)
+                growth = tracemalloc.get_traced_memory()[0] - baseline
+                tracemalloc.stop()
+                tracker.flush_pending()
+                print(f"{mode:<8} {label:<14} {count:>9,} {records[0]:>9,} {growth / 1024:>11,.1f} kB")
+
+def bench_sampling(args):
+    """
+    Floods a RegexMessageTracker with the capture as fast as it can process it for --seconds, then
+    feeds it --quiet-rate lines per second, with and without sample_threshold. Reports the records
+    written per second while flooding, that every alert line was still logged and that the
+    governor's counters add up to the unmatched lines fed.
+    """
+    from ConfigurationLoader import ConfigLoader
+    from RegexMessageTracker import RegexMessageTracker
+    config = ConfigLoader(args.config).get_configuration()
+    config['output_dir'] = tempfile.mkdtemp(prefix='sampling_')
+    config['metrics_export'] = None
+    config['sample_window'] = args.window
+    lines = load_lines(args.capture)
+    matcher = PatternMatcher(config['regex_patterns'], config['alert_strings'])
+    classes = [matcher.match(line) for line in lines]
+    print(f"{'threshold':>9} {'lines':>9} {'lines/s':>9} {'unmatched':>9} {'written':>9} {'records/s':>9} {'alerts':>13} {'transitions':>11}")
+    for threshold in (0, args.threshold):
+        config['sample_threshold'] = threshold
+        tracker = RegexMessageTracker(f"sampling-{threshold}", config['output_dir'])
+        records = {'direct': 0, 'alert': 0, 'other': 0}
+        transitions = []
+        def count_record(log_function, message, *log_args, terms=None, fields=None, records=records, transitions=transitions):
+            if terms == ("SAMPLING",):
+                transitions.append(log_args[1])
+            elif log_function == tracker.logger.warning and fields is not None:
+                records['alert'] += 1
+            elif fields is not None and fields[2] is None:
+                records['direct'] += 1
+            else:
+                records['other'] += 1
+        tracker._log = count_record
+        fed = unmatched = alerts = 0
+        def feed(index):
+            tracker.process_line(lines[index])
+            matches, is_alert = classes[index]
+            return (not matches and not is_alert), is_alert
+        start = time.perf_counter()
+        while time.perf_counter() - start < args.seconds:
+            for index in range(len(lines)):
+                was_unmatched, was_alert = feed(index)
+                unmatched += was_unmatched
+                alerts += was_alert
+            fed += len(lines)
+        flood_elapsed = time.perf_counter() - start
+        flood_written = records['direct']
+        # A quiet spell of a few windows, so sampling turns off again
+        quiet_lines = int(args.quiet_rate * args.window * 3)
+        for count in range(quiet_lines):
+            was_unmatched, was_alert = feed(count % len(lines))
+            unmatched += was_unmatched
+            alerts += was_alert
+            time.sleep(1 / args.quiet_rate)
+        fed += quiet_lines
+        tracker.finish()
+        governor = tracker.governor
+        if governor is not None and (governor.unmatched != unmatched or governor.written != records['direct']):
+            print(f"  counter mismatch: governor saw {governor.unmatched} unmatched / {governor.written} written, "
+                  f"fed {unmatched} unmatched / {records['direct']} written")
+        print(f"{threshold or 'off':>9} {fed:>9,} {fed / flood_elapsed:>9,.0f} {unmatched:>9,} {records['direct']:>9,} "
+              f"{flood_written / flood_elapsed:>9,.0f} {records['alert']:>6,}/{alerts:<6,} {len(transitions):>11}")
+        for message in transitions:
+            print(f"  {message}")
+
+def bench_devicefilter(args):
+    """
+    Builds the logging discriminator device_filter would put on the device for the configured
+    patterns, alert strings and roam events, and applies it (as the Python regex it also is) to the
+    capture: reports the bytes and lines the device would send with and without it, and checks that
+    no line a pattern, alert string or roam event matches is filtered out.
+    """
+    from DeviceFilter import filter_regex
+    from RoamCorrelator import RoamCorrelator
+    config = load_configuration(args.config)
+    matcher = PatternMatcher(config['regex_patterns'], config['alert_strings'])
+    roam_events = RoamCorrelator.tracked_events(config) or ()
+    lines = load_lines(args.capture)
+    for max_length in args.max_length:
+        regex, reason = filter_regex(matcher, roam_events, max_length)
+        if regex is None:
+            print(f"max length {max_length}: no device filter ({reason})")
+            continue
+        discriminator = re.compile(regex)
+        total_bytes = sent_bytes = sent_lines = lost = 0
+        for line in lines:
+            size = len(line) + 2  # terminal monitor lines end in \r\n
+            total_bytes += size
+            if discriminator.search(line):
+                sent_bytes += size
+                sent_lines += 1
+                continue
+            matches, is_alert = matcher.match(line)
+            if matches or is_alert or any(event in line for event in roam_events):
+                lost += 1
+        print(f"max length {max_length}: {len(regex)} character regex {regex}")
+        print(f"  without filter {len(lines):>8,} lines {total_bytes:>10,} bytes")
+        print(f"  with filter    {sent_lines:>8,} lines {sent_bytes:>10,} bytes ({sent_bytes / total_bytes:.1%}), "
+              f"matched lines filtered out: {lost}")
+
+def write_synthetic_log(path, target_bytes, lines, alert_strings, interval):
+    """
+    Writes a device log of about target_bytes in the default log_format, one record per capture line
+    every millisecond, with its sidecar index built by LogIndexWriter the way the file handler does.
+
+    :return: (records written, epoch time of the first record, of the last record)
+    """
+    import logging
+    from LogIndex import LogIndexWriter
+    index = LogIndexWriter(path, interval)
+    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+    first = time.time() - 86400
+    records = 0
+    written = 0
+    with open(path, 'w', encoding='utf-8', buffering=1048576) as log:
+        while written < target_bytes:
+            for line in lines:
+                alerts = [alert for alert in alert_strings if alert in line]
+                record = logging.LogRecord("device_10.0.0.1", logging.WARNING if alerts else logging.INFO, __file__, 0,
+                                           f"From~10.0.0.1:{line}", None, None)
+                record.created = first + records / 1000
+                record.msecs = (record.created - int(record.created)) * 1000
+                record.index_terms = alerts
+                text = formatter.format(record) + "\n"
+                index.add(record, text)
+                log.write(text)
+                written += len(text)
+                records += 1
+    index.close()
+    return records, first, first + (records - 1) / 1000
+
+def bench_search(args):
+    """
+    Writes a multi-GB synthetic device log with its sidecar index, then finds every record of an
+    alert string inside a time range and over the whole file, once through LogIndex (mmap, seeking
+    to the indexed records) and once by scanning every line, checks both return the same lines and
+    reports the times.
+    """
+    from LogIndex import LogIndex, index_path
+    config = load_configuration(args.config)
+    directory = args.directory or tempfile.mkdtemp(prefix='search_')
+    path = f"{directory}/device_monitor_debug_10.0.0.1_synthetic.log"
+    start = time.perf_counter()
+    records, first, last = write_synthetic_log(path, args.gigabytes * 1024 ** 3, load_lines(args.capture), config['alert_strings'], args.interval)
+    print(f"wrote {records:,} records, {os.path.getsize(path) / 1024 ** 3:.2f} GB log and {os.path.getsize(index_path(path)) / 1024 ** 2:.1f} MB index "
+          f"in {time.perf_counter() - start:.1f}s")
+    # The middle tenth of the log, then the whole of it
+    span = last - first
+    for label, range_start, range_end in (("10% time range", first + span * 0.45, first + span * 0.55), ("whole file", None, None)):
+        start = time.perf_counter()
+        indexed = list(LogIndex(path).search(args.term, range_start, range_end))
+        index_elapsed = time.perf_counter() - start
+
+        start = time.perf_counter()
+        scanned = []
+        needle = args.term.encode('utf-8')
+        with open(path, 'rb') as log:
+            for line in log:
+                if needle in line:
+                    # The record time is only read for the lines containing the term, as grep plus a date filter would
+                    created = datetime.strptime(line[:23].decode(), '%Y-%m-%d %H:%M:%S,%f').timestamp()
+                    if (range_start is None or created >= range_start) and (range_end is None or created <= range_end):
+                        scanned.append(line.rstrip(b"\r\n").decode('utf-8', 'replace'))
+        scan_elapsed = time.perf_counter() - start
+        if indexed != scanned:
+            raise SystemExit(f"{label}: index returned {len(indexed)} lines, the scan {len(scanned)}")
+        print(f"{label:<16} {len(indexed):>8,} lines  index {index_elapsed:>8.3f}s  linear scan {scan_elapsed:>8.3f}s")
+    if not args.directory:
+        shutil.rmtree(directory)
+
+def bench_logformat(args):
+    """
+    Writes the same tracker records (device lines and pattern counts) through the text file handler
+    and the binary one, checks that log_convert's output equals the text log byte for byte, and
+    reports CPU per record, size on disk and the time to parse each file back into fields.
+    """
+    import logging, mmap
+    from BinaryLog import BinaryFileHandler, RECORD_LINE, RECORD_PATTERN, iter_records, read_records, to_text
+    from LogHandlers import BufferedFileHandler
+    config = load_configuration(args.config)
+    matcher = PatternMatcher(config['regex_patterns'], config['alert_strings'])
+    lines = load_lines(args.capture) * args.repeat
+    records = []
+    for line in lines:
+        matches = matcher.match_patterns(line)
+        if matches:
+            key = matches[0][0]
+            record = logging.LogRecord("device_10.0.0.1", logging.INFO, __file__, 0, "From~%s:Pattern [%s]: %s (Count: %s)",
+                                       ("10.0.0.1", key, line, 3), None)
+            record.record_fields = (RECORD_PATTERN, "10.0.0.1", key, 3, line)
+        else:
+            record = logging.LogRecord("device_10.0.0.1", logging.INFO, __file__, 0, "From~%s:%s", ("10.0.0.1", line), None)
+            record.record_fields = (RECORD_LINE, "10.0.0.1", None, 0, line)
+        records.append(record)
+
+    directory = tempfile.mkdtemp(prefix='logformat_')
+    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+    text_path, binary_path = f"{directory}/device.log", f"{directory}/device.bin"
+    text_handler = BufferedFileHandler(text_path, 1.0, 65536, encoding='utf-8')
+    binary_handler = BinaryFileHandler(binary_path, 1.0, 65536)
+    for name, handler in (("text", text_handler), ("binary", binary_handler)):
+        handler.setFormatter(formatter)
+        start = time.process_time()
+        for record in records:
+            handler.handle(record)
+        handler.close()
+        elapsed = time.process_time() - start
+        path = text_path if handler is text_handler else binary_path
+        print(f"{name:<8} write {elapsed / len(records) * 1e9:>7,.0f} ns CPU/record  {os.path.getsize(path) / 1024 ** 2:>8.1f} MB")
+
+    with open(binary_path, 'rb') as file:
+        converted = "".join(to_text(record, formatter) + "\n" for record in read_records(file))
+    with open(text_path, 'r', encoding='utf-8') as file:
+        if converted != file.read():
+            raise SystemExit("Converted binary log differs from the text log")
+    print("log_convert output identical to the text log")
+
+    # Parsing back: splitting the text lines with a regex, and getting the time, pattern key and count out of
+    # them as the binary records already hold them, against the binary records decoded in place
+    text_regex = re.compile(r"^(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d),(\d{3}) - (\w+) - From~([^:]*):(?:Pattern \[([^\]]*)\]: (.*) \(Count: (\d+)\)|(.*))$")
+    start = time.perf_counter()
+    with open(text_path, 'r', encoding='utf-8') as file:
+        parsed = sum(1 for line in file if text_regex.match(line))
+    print(f"{'text':<8} parse {(time.perf_counter() - start) / parsed * 1e9:>7,.0f} ns/record (regex split only)")
+    start = time.perf_counter()
+    with open(text_path, 'r', encoding='utf-8') as file:
+        for line in file:
+            match = text_regex.match(line)
+            created = datetime.strptime(match.group(1), '%Y-%m-%d %H:%M:%S').timestamp() + int(match.group(2)) / 1000
+            count = int(match.group(7)) if match.group(7) else 0
+    print(f"{'text':<8} parse {(time.perf_counter() - start) / parsed * 1e9:>7,.0f} ns/record (to time, key, count fields)")
+    start = time.perf_counter()
+    with open(binary_path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as log:
+        parsed = sum(1 for _ in iter_records(log, decode=False))
+    print(f"{'binary':<8} parse {(time.perf_counter() - start) / parsed * 1e9:>7,.0f} ns/record (mmap, lines left as memoryviews)")
+    shutil.rmtree(directory)
+
+# Roam events used by the roams benchmark when the config does not set roam_start / roam_end
+ROAM_START = "to [DOT11_UPLINK_FT_AUTHENTICATING]"
+ROAM_END = ["Peer assoc event received from driver", "to [DOT11_UPLINK_CONNECTED]"]
+DEVICE_TIMESTAMP = re.compile(r"\[\*(\d\d/\d\d/\d{4} \d\d:\d\d:\d\d\.\d+)\]")
+
+def build_roam_replay(lines, start_event, end_events, pairs, repeat, loss=0.0, seed=1):
+    """
+    Roam events of a fleet of pairs WGB / root AP device pairs, as (timestamp, ip, event, line) in
+    time order. Each pair replays the capture's roam events repeat times from a random offset, the
+    AP getting the first end event (Peer assoc) and the WGB the others, so the two halves of every
+    roam come from different devices. A loss fraction of the end events is left out, leaving those
+    roams open until they run out of window.
+    """
+    events = [start_event] + end_events
+    timeline = []
+    for line in lines:
+        found = [event for event in events if event in line]
+        stamp = DEVICE_TIMESTAMP.search(line)
+        if found and stamp:
+            timeline.append((datetime.strptime(stamp.group(1), '%m/%d/%Y %H:%M:%S.%f').timestamp(), found[0], line))
+    span = timeline[-1][0] - timeline[0][0] + 1
+    random_offsets = random.Random(seed)
+    replay = []
+    for pair in range(pairs):
+        wgb, ap = f"10.{pair // 250}.{pair % 250}.2", f"10.{pair // 250}.{pair % 250}.3"
+        offset = random_offsets.uniform(0, span)
+        for iteration in range(repeat):
+            for timestamp, event, line in timeline:
+                if event != start_event and random_offsets.random() < loss:
+                    continue
+                replay.append((timestamp + offset + iteration * span, ap if event == end_events[0] else wgb, event, line))
+    replay.sort(key=lambda event: event[0])
+    return replay
+
+class LinearRoamCorrelator:
+    """ The same pairing as RoamCorrelator with a scan of every open roam per event, to check it and compare. """
+
+    def __init__(self, start_event, end_events, window):
+        self.start_event, self.end_events, self.window = start_event, end_events, window
+        self.open = []
+        self.completed = self.incomplete = self.unmatched = 0
+
+    def expire(self, now):
+        for episode in [episode for episode in self.open if episode[1] < now - self.window]:
+            self.close(episode, complete=False)
+
+    def add(self, timestamp, ip, event, line=None):
+        self.expire(timestamp)
+        if event == self.start_event:
+            for episode in [episode for episode in self.open if episode[0] == ip]:
+                self.close(episode, complete=False)
+            self.open.append((ip, timestamp, {}))
+            return
+        candidates = [episode for episode in self.open if event not in episode[2]]
+        episode = next((episode for episode in candidates if episode[0] == ip), None) or next(iter(candidates), None)
+        if episode is None:
+            self.unmatched += 1
+            return
+        episode[2][event] = timestamp
+        if len(episode[2]) == len(self.end_events):
+            self.close(episode, complete=True)
+
+    def close(self, episode, complete):
+        self.open.remove(episode)
+        if complete:
+            self.completed += 1
+        else:
+            self.incomplete += 1
+
+def bench_roams(args):
+    """
+    Replays the capture's roam events for growing fleets of device pairs through RoamCorrelator
+    and through a linear scan of the open roams, checks both find the same episodes and reports
+    events/sec and the cost per event.
+    """
+    from RoamCorrelator import RoamCorrelator
+    config = load_configuration(args.config)
+    start_event = config.get('roam_start') or ROAM_START
+    end_events = config.get('roam_end') or ROAM_END
+    window = config.get('roam_window', 10)
+    lines = load_lines(args.capture)
+    print(f"{'devices':>8} {'events':>9} {'complete':>9} {'incomplete':>10} {'correlator':>18} {'linear scan':>18}")
+    for devices in args.devices:
+        replay = build_roam_replay(lines, start_event, end_events, max(1, devices // 2), args.repeat, args.loss)
+        correlator = RoamCorrelator(start_event, end_events, window)
+        start = time.perf_counter()
+        for event in replay:
+            correlator.add(*event)
+        correlator.expire(float('inf'))
+        elapsed = time.perf_counter() - start
+        linear_column = "skipped"
+        if devices <= args.linear_max:
+            linear = LinearRoamCorrelator(start_event, end_events, window)
+            start = time.perf_counter()
+            for event in replay:
+                linear.add(*event)
+            linear.expire(float('inf'))
+            linear_elapsed = time.perf_counter() - start
+            if (linear.completed, linear.incomplete, linear.unmatched) != (correlator.completed, correlator.incomplete, correlator.unmatched):
+                raise SystemExit(f"Mismatch at {devices} devices: linear scan {linear.completed}/{linear.incomplete}/{linear.unmatched}, "
+                                 f"correlator {correlator.completed}/{correlator.incomplete}/{correlator.unmatched}")
+            linear_column = f"{linear_elapsed / len(replay) * 1e9:,.0f} ns/event"
+        print(f"{devices:>8} {len(replay):>9,} {correlator.completed:>9,} {correlator.incomplete:>10,} "
+              f"{elapsed / len(replay) * 1e9:>10,.0f} ns/event {linear_column:>18}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks for the monitor_terminal_4 processing pipeline.")
+    parser.add_argument('--config', default='config.json.sample', help="config file providing regex_patterns and alert_strings")
+    parser.add_argument('--capture', default='debug.log', help="capture file to replay")
+    parser.add_argument('--repeat', type=int, default=20, help="number of times to replay the capture")
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    matcher_parser = subparsers.add_parser('matcher', help="single pass matcher against the per-pattern loop")
+    matcher_parser.add_argument('--patterns', type=int, default=40, help="size of the pattern set")
+    matcher_parser.set_defaults(func=bench_matcher)
+
+    prefilter_parser = subparsers.add_parser('prefilter', help="anchor index prefilter against the combined alternation and the per-pattern loop")
+    prefilter_parser.add_argument('--patterns', type=int, nargs='+', default=[1, 10, 100], help="pattern set sizes to run")
+    prefilter_parser.set_defaults(func=bench_prefilter)
+
+    lines_parser = subparsers.add_parser('lines', help="LineAssembler against splitting each read on newlines")
+    lines_parser.add_argument('--min-chunk', type=int, default=256, help="smallest simulated read in characters")
+    lines_parser.add_argument('--max-chunk', type=int, default=4096, help="largest simulated read in characters")
+    lines_parser.set_defaults(func=bench_lines)
+
+    pipeline_parser = subparsers.add_parser('pipeline', help="reader stalls with processing inline against the bounded read pipeline")
+    pipeline_parser.add_argument('--rate', type=float, default=500, help="reads per second produced by the simulated device")
+    pipeline_parser.add_argument('--min-chunk', type=int, default=256, help="smallest simulated read in characters")
+    pipeline_parser.add_argument('--max-chunk', type=int, default=4096, help="largest simulated read in characters")
+    pipeline_parser.add_argument('--stall-every', type=int, default=200, help="processing stalls after every this many reads")
+    pipeline_parser.add_argument('--stall-ms', type=float, default=250, help="length of each processing stall in milliseconds")
+    pipeline_parser.add_argument('--queue-size', type=int, default=64, help="reads held by the pipeline queue")
+    pipeline_parser.set_defaults(func=bench_pipeline)
+
+    logger_parser = subparsers.add_parser('logger', help="DeviceLogger load test with and without the queued writer")
+    logger_parser.add_argument('--devices', type=int, default=50, help="number of simulated device threads")
+    logger_parser.add_argument('--lines', type=int, default=4000, help="lines logged by each device")
+    logger_parser.set_defaults(func=bench_logger)
+
+    fleet_parser = subparsers.add_parser('fleet', help="memory and CPU per device for the asyncio engine on simulated devices")
+    fleet_parser.add_argument('--devices', type=int, nargs='+', default=[10, 100, 1000], help="fleet sizes to run")
+    fleet_parser.add_argument('--seconds', type=float, default=10, help="how long each fleet streams")
+    fleet_parser.add_argument('--rate', type=float, default=10, help="lines per second sent by each simulated device")
+    fleet_parser.set_defaults(func=bench_fleet)
+
+    shard_parser = subparsers.add_parser('shard', help="throughput of simulated devices split across worker processes")
+    shard_parser.add_argument('--processes', type=int, nargs='+', default=[1, 2, 4], help="worker process counts to run")
+    shard_parser.add_argument('--devices', type=int, default=16, help="number of simulated devices")
+    shard_parser.add_argument('--seconds', type=float, default=10, help="how long each run streams")
+    shard_parser.add_argument('--rate', type=float, default=5000, help="lines per second sent by each simulated device")
+    shard_parser.set_defaults(func=bench_shard)
+
+    dedup_parser = subparsers.add_parser('dedup', help="dedup state memory and records logged under high cardinality and interleaved input")
+    dedup_parser.add_argument('--lines', type=int, nargs='+', default=[10000, 100000], help="numbers of lines to feed")
+    dedup_parser.add_argument('--capacity', type=int, default=32, help="dedup_capacity for the 'recent' mode")
+    dedup_parser.set_defaults(func=bench_dedup)
+
+    sampling_parser = subparsers.add_parser('sampling', help="records written per second by a flooding device with and without sample_threshold")
+    sampling_parser.add_argument('--threshold', type=int, default=2000, help="sample_threshold in lines per second")
+    sampling_parser.add_argument('--window', type=float, default=1.0, help="sample_window in seconds")
+    sampling_parser.add_argument('--seconds', type=float, default=5, help="how long the device floods")
+    sampling_parser.add_argument('--quiet-rate', type=float, default=200, help="lines per second after the flood")
+    sampling_parser.set_defaults(func=bench_sampling)
+
+    devicefilter_parser = subparsers.add_parser('devicefilter', help="bytes a device sends with and without the device_filter discriminator")
+    devicefilter_parser.add_argument('--max-length', type=int, nargs='+', default=[240, 60], help="discriminator regex lengths to try")
+    devicefilter_parser.set_defaults(func=bench_devicefilter)
+
+    search_parser = subparsers.add_parser('search', help="indexed log search against a linear scan on a multi-GB synthetic device log")
+    search_parser.add_argument('--gigabytes', type=float, default=2, help="size of the synthetic log")
+    search_parser.add_argument('--term', default="Peer assoc event received from driver", help="alert string to search for")
+    search_parser.add_argument('--interval', type=float, default=1.0, help="log_index_interval of the index")
+    search_parser.add_argument('--directory', default=None, help="where to write (and keep) the log, default a temporary directory removed afterwards")
+    search_parser.set_defaults(func=bench_search)
+
+    logformat_parser = subparsers.add_parser('logformat', help="binary record log format against formatted text lines")
+    logformat_parser.set_defaults(func=bench_logformat)
+
+    rules_parser = subparsers.add_parser('rules', help="startup time and RSS of per-device pattern matchers against the shared one")
+    rules_parser.add_argument('--devices', type=int, default=500, help="number of trackers")
+    rules_parser.add_argument('--patterns', type=int, default=200, help="size of the pattern set")
+    rules_parser.set_defaults(func=bench_rules)
+
+    roams_parser = subparsers.add_parser('roams', help="cross device roam correlation replayed for growing fleets against a linear scan")
+    roams_parser.add_argument('--devices', type=int, nargs='+', default=[10, 100, 500], help="fleet sizes to run (half WGBs, half their root APs)")
+    roams_parser.add_argument('--loss', type=float, default=0.0, help="fraction of end events left out, so roams stay open")
+    roams_parser.add_argument('--linear-max', type=int, default=100, help="largest fleet to also run the linear scan for")
+    roams_parser.set_defaults(func=bench_roams)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+import argparse, random, re, socket, threading, time
+import paramiko
+
+class FakeDeviceServer(paramiko.ServerInterface):
+    """ Accepts any username and password and a single interactive shell per connection. """
+
+    def __init__(self):
+        self.shell_requested = threading.Event()
+
+    def check_auth_password(self, username, password):
+        return paramiko.AUTH_SUCCESSFUL
+
+    def get_allowed_auths(self, username):
+        return "password"
+
+    def check_channel_request(self, kind, chanid):
+        return paramiko.OPEN_SUCCEEDED if kind == "session" else paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_pty_request(self, channel, term, width, height, pixelwidth, pixelheight, modes):
+        return True
+
+    def check_channel_shell_request(self, channel):
+        self.shell_requested.set()
+        return True
+
+class FakeDeviceSession:
+
+    def __init__(self, channel, args, lines):
+        """
+        Cisco IOS style shell on one connection: enable, terminal monitor, debug and undebug commands,
+        and while terminal monitor and a debug are on, capture lines streamed at args.rate lines per second.
+        The connection is dropped args.drop_after seconds (plus jitter) after monitoring starts.
+        In configure terminal, logging discriminator / logging monitor discriminator set a msg-body
+        filter on the streamed lines (unless args.no_discriminator) for every connection.
+        """
+        self.channel = channel
+        self.args = args
+        self.lines = lines
+        self.enabled = False
+        self.configuring = False
+        self.bytes_sent = 0
+        self.monitoring = threading.Event()
+        self.send_lock = threading.Lock()
+
+    def send(self, text):
+        with self.send_lock:
+            data = text.replace('\n', '\r\n').encode()
+            self.channel.sendall(data)
+            self.bytes_sent += len(data)
+
+    def prompt(self):
+        if self.configuring:
+            return f"{self.args.hostname}(config)#"
+        return f"{self.args.hostname}{'#' if self.enabled else '>'}"
+
+    def run(self):
+        threading.Thread(target=self.stream, daemon=True).start()
+        self.send(f"\n{self.prompt()}")
+        buffer = ""
+        try:
+            while not self.channel.closed:
+                data = self.channel.recv(1024)
+                if not data:
+                    break
+                for character in data.decode(errors='replace'):
+                    if character == '\n':
+                        self.send("\n")
+                        self.execute(buffer.strip())
+                        buffer = ""
+                    elif character not in '\r\x00':
+                        self.send(character)
+                        buffer += character
+        except OSError:
+            pass
+        finally:
+            self.monitoring.clear()
+            self.channel.close()
+            print(f"Sent {self.bytes_sent} bytes on a connection, discriminator {FakeDevice.monitor_discriminator or 'none'}")
+
+    def configure(self, command):
+        """ A configuration mode command; returns its output. """
+        discriminator = re.match(r"(no )?logging discriminator (\S+)(?: msg-body includes (.+))?$", command)
+        monitor = re.match(r"(no )?logging monitor discriminator (\S+)$", command)
+        if self.args.no_discriminator and (discriminator or monitor):
+            return "% Invalid input detected at '^' marker.\n"
+        if discriminator and discriminator.group(1):
+            FakeDevice.discriminators.pop(discriminator.group(2), None)
+        elif discriminator and discriminator.group(3):
+            FakeDevice.discriminators[discriminator.group(2)] = re.compile(discriminator.group(3))
+        elif monitor:
+            FakeDevice.monitor_discriminator = None if monitor.group(1) else monitor.group(2)
+        elif command.startswith("logging monitor"):
+            FakeDevice.monitor_logging = command
+        else:
+            return "% Invalid input detected at '^' marker.\n"
+        return ""
+
+    def execute(self, command):
+        output = ""
+        if self.configuring and command in ("end", "exit"):
+            self.configuring = False
+        elif self.configuring:
+            output = self.configure(command)
+        elif command in ("configure terminal", "conf t"):
+            output = "Enter configuration commands, one per line.  End with CNTL/Z.\n"
+            self.configuring = True
+        elif command == "enable":
+            self.send("Password: ")
+            while not self.channel.recv(1024).rstrip(b'\x00').strip(b'\r\n') and not self.channel.closed:
+                pass
+            self.send("\n")
+            self.enabled = True
+        elif command in ("u all", "undebug all"):
+            output = "All possible debugging has been turned off\n"
+            FakeDevice.debugging = False
+        elif command == "terminal monitor":
+            if not self.monitoring.is_set():
+                self.monitoring.set()
+                if self.args.drop_after:
+                    delay = self.args.drop_after * random.uniform(1, 1 + self.args.drop_jitter)
+                    threading.Timer(delay, self.drop).start()
+        elif command.startswith("debug "):
+            output = f"{command[6:]} debugging is on\n"
+            FakeDevice.debugging = True
+        elif command == "show running-config | include ^logging monitor":
+            output = "".join(f"{line}\n" for line in (FakeDevice.monitor_logging,
+                             FakeDevice.monitor_discriminator and f"logging monitor discriminator {FakeDevice.monitor_discriminator}") if line)
+        elif command == "exit":
+            self.channel.close()
+            return
+        elif command and not command.startswith(("terminal ", "show ")):
+            output = "% Invalid input detected at '^' marker.\n"
+        self.send(f"{output}{self.prompt()}")
+
+    def stream(self):
+        position = 0
+        while not self.channel.closed:
+            if not self.monitoring.wait(0.5):
+                continue
+            time.sleep(1 / self.args.rate)
+            if not FakeDevice.debugging:
+                continue
+            line = self.lines[position % len(self.lines)]
+            position += 1
+            discriminator = FakeDevice.discriminators.get(FakeDevice.monitor_discriminator)
+            if discriminator is not None and not discriminator.search(line):
+                continue
+            try:
+                self.send(line + "\n")
+            except (OSError, EOFError):
+                return
+
+    def drop(self):
+        print(f"Dropping connection from {self.channel.getpeername()[0]}")
+        self.channel.get_transport().close()
+        if self.args.down_for:
+            FakeDevice.down_until = time.monotonic() + self.args.down_for
+
+class FakeDevice:
+    # While time.monotonic() is before this, new connections are closed at once, as if the device were unreachable
+    down_until = 0
+    # Debugs are on for the device, not the connection: undebug all on any connection stops every stream
+    debugging = False
+    # Logging discriminators by name and the one applied to terminal monitor output: device configuration, so shared by every connection
+    discriminators = {}
+    monitor_discriminator = None
+    # The terminal monitor logging level line, as show running-config has it
+    monitor_logging = "logging monitor informational"
+
+def handle_connection(client, host_key, args, lines):
+    if time.monotonic() < FakeDevice.down_until:
+        client.close()
+        return
+    transport = paramiko.Transport(client)
+    transport.add_server_key(host_key)
+    server = FakeDeviceServer()
+    try:
+        transport.start_server(server=server)
+    except (paramiko.SSHException, EOFError):
+        return
+    channel = transport.accept(20)
+    if channel is None or not server.shell_requested.wait(10):
+        transport.close()
+        return
+    FakeDeviceSession(channel, args, lines).run()
+    transport.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Local fake Cisco device over SSH for exercising DeviceMonitor, including dropped connections. "
+                                                 "Point several devices at it with different 127.0.0.x addresses and \"port\".")
+    parser.add_argument('--port', type=int, default=2222, help="port to listen on")
+    parser.add_argument('--capture', default='debug.log', help="capture whose lines are streamed as terminal monitor output")
+    parser.add_argument('--rate', type=float, default=20, help="lines per second streamed to each connection")
+    parser.add_argument('--hostname', default='AP0001', help="hostname shown in the prompt")
+    parser.add_argument('--drop-after', type=float, default=0, help="drop each connection this many seconds after terminal monitor (0 never drops)")
+    parser.add_argument('--drop-jitter', type=float, default=0.5, help="drop up to this fraction later than --drop-after")
+    parser.add_argument('--no-discriminator', action='store_true', help="reject logging discriminator commands, like a platform without them")
+    parser.add_argument('--down-for', type=float, default=0, help="refuse connections for this many seconds after a drop")
+    args = parser.parse_args()
+
+    with open(args.capture, 'r', errors='replace') as file:
+        lines = [line.rstrip('\n') for line in file if line.strip()]
+    host_key = paramiko.RSAKey.generate(2048)
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind(('0.0.0.0', args.port))
+    listener.listen(100)
+    print(f"Fake device listening on port {args.port}")
+    try:
+        while True:
+            client, _ = listener.accept()
+            threading.Thread(target=handle_connection, args=(client, host_key, args, lines), daemon=True).start()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        listener.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+import argparse, logging, os, sys
+from BinaryLog import read_records, to_text
+
+def convert(path, output, formatter):
+    """ Writes the text log lines of the binary log at path to output. Returns the number of records. """
+    records = 0
+    with open(path, 'rb') as file:
+        for record in read_records(file):
+            output.write(to_text(record, formatter) + "\n")
+            records += 1
+    return records
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert binary device logs (log_record_format \"binary\") back to the text log format.")
+    parser.add_argument('logs', nargs='+', help="binary device logs (.bin)")
+    parser.add_argument('--format', default='%(asctime)s - %(levelname)s - %(message)s', help="logging format of the text lines (the device log default)")
+    parser.add_argument('--write', action='store_true', help="write each log next to it as .log instead of printing to stdout")
+    args = parser.parse_args()
+
+    formatter = logging.Formatter(args.format)
+    for path in args.logs:
+        if not args.write:
+            convert(path, sys.stdout, formatter)
+            continue
+        target = os.path.splitext(path)[0] + ".log"
+        with open(target, 'w', encoding='utf-8') as output:
+            records = convert(path, output, formatter)
+        print(f"{path}: {records} records written to {target}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+import argparse, glob, os, sys
+from datetime import datetime
+from LogIndex import LogIndex, index_path
+
+def parse_time(text):
+    """ Accepts '2024-04-18 13:50:00' / '2024-04-18T13:50:00' (local time) and returns epoch seconds. """
+    return datetime.fromisoformat(text).timestamp() if text else None
+
+def log_files(output_dir, device=None):
+    """ The device logs (and rotated segments) of output_dir, oldest segment first, for one device or all. """
+    name = f"device_monitor_debug_{device}_*.log" if device else "device_monitor_debug_*.log"
+    return sorted(glob.glob(os.path.join(output_dir, name)))
+
+def main():
+    parser = argparse.ArgumentParser(description="Search device logs through the sidecar index written with log_index, "
+                                                 "reading only the records the index points at instead of scanning the files.")
+    parser.add_argument('--output-dir', default='./output', help="directory holding the device logs")
+    parser.add_argument('--device', default=None, help="ip of the device to search (default every device)")
+    parser.add_argument('--term', default=None, help="pattern key or alert string the records were indexed under")
+    parser.add_argument('--contains', default=None, help="only lines containing this text")
+    parser.add_argument('--start', default=None, help="earliest record time, e.g. 2024-04-18T13:50:00")
+    parser.add_argument('--end', default=None, help="latest record time")
+    parser.add_argument('--count', action='store_true', help="print the number of matching lines per file instead of the lines")
+    parser.add_argument('--list-terms', action='store_true', help="print the indexed terms and their record counts")
+    args = parser.parse_args()
+
+    start, end = parse_time(args.start), parse_time(args.end)
+    files = log_files(args.output_dir, args.device)
+    if not files:
+        sys.exit(f"No device logs found in {args.output_dir}")
+    for path in files:
+        if not os.path.exists(index_path(path)):
+            print(f"{path}: no index (log_index was off), skipped", file=sys.stderr)
+            continue
+        index = LogIndex(path)
+        if args.list_terms:
+            for term, count in sorted(index.terms().items()):
+                print(f"{os.path.basename(path)}: {count:>8} {term}")
+            continue
+        lines = index.search(args.term, start, end, args.contains)
+        if args.count:
+            print(f"{os.path.basename(path)}: {sum(1 for _ in lines)}")
+            continue
+        for line in lines:
+            print(f"{os.path.basename(path)}: {line}" if len(files) > 1 else line)
+
+if __name__ == "__main__":
+    main()
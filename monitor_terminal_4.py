@@ -1,42 +1,92 @@
 from threading import Event
-from concurrent.futures import ThreadPoolExecutor
 from DeviceMonitor import DeviceMonitor
-import json, time, logging, signal
+import time, multiprocessing, signal
 from ConfigurationLoader import ConfigLoader
 from DeviceLogger import DeviceLogger
+from Stats import Stats
+from BringUp import BringUpScheduler, collect_credentials
+from MonitorSupervisor import MonitorSupervisor, DeviceStates
+from ConfigWatcher import ConfigWatcher
+from RoamCorrelator import RoamCorrelator
 
 shutdown_event = Event()
 shutdown_initiated = False
+shutdown_started = None
 
 def handle_interrupt(logger):
-    global shutdown_initiated
+    global shutdown_initiated, shutdown_started
     if not shutdown_initiated:
+        # Set first: a second signal arriving inside shutdown_event.set() would otherwise set it again
+        # from the handler and deadlock on the Event's own lock
+        shutdown_initiated = True
         logger.warning("Received keyboard interrupt, initiating shutdown.")
+        shutdown_started = time.monotonic()
         shutdown_event.set()
-        shutdown_initiated = True
 
 def signal_handler(logger):
     def handle_signal(signum, frame):
         handle_interrupt(logger)
     return handle_signal
 
+def configure_logging(config):
+    DeviceLogger.configure(config, shutdown_event)
+
+def supervise(devices, shutdown_event, bring_up, logger):
+    """ Runs a DeviceMonitor per device under the event driven supervisor until they have all ended. """
+    states = DeviceStates()
+    Stats.device_states = states
+    # A restarted monitor is not part of the initial bring up any more
+    monitor_factory = lambda device, restart: DeviceMonitor(device, shutdown_event, None if restart else bring_up, states)
+    MonitorSupervisor(devices, shutdown_event, monitor_factory, states, logger, config.get('restart_policy', 'on-failure'),
+                      config.get('max_restarts', 3), config.get('restart_delay', 30)).run()
+    logger.warning(f"Devices: {states.summary()}")
+
 def main(wkst_logger):
     wkst_logger.warning("Entering device monitor loop.")
-    with ThreadPoolExecutor(max_workers=len(devices)) as executor:
-        futures = [executor.submit(DeviceMonitor(device, shutdown_event).connect_and_monitor) for device in devices]
-        
-        while not all(future.done() for future in futures):
-            time.sleep(0.1)  # Adjust as necessary to reduce busy waiting
-        
-        if shutdown_event.is_set():
-            wkst_logger.warning("Shutdown event is set. Breaking loop.")
-
+    if config.get('worker_processes', 1) > 1:
+        # Devices are split across worker processes so matching and formatting run on several cores
+        import ShardSupervisor
+        ShardSupervisor.run(devices, shutdown_event, config['worker_processes'], config_loader.filepath)
+        wkst_logger.warning("All worker processes have been cleanly shutdown.")
+        return
+    if config.get('engine', 'threads') == 'asyncio':
+        # One event loop for every device instead of one thread per device
+        import AsyncDeviceMonitor
+        AsyncDeviceMonitor.run(devices, shutdown_event)
+        wkst_logger.warning("All devices have been cleanly shutdown.")
+        return
+    # Passwords are asked for once up front (once per device group), then at most connect_concurrency devices connect at a time
+    collect_credentials(devices)
+    bring_up = BringUpScheduler(len(devices), config.get('connect_concurrency', 20), wkst_logger)
+    supervise(devices, shutdown_event, bring_up, wkst_logger)
     wkst_logger.warning("All threads have been cleanly shutdown.")
+    if shutdown_started is not None:
+        results = ", ".join(f"{count} {result}" for result, count in DeviceMonitor.cleanup_results.items())
+        wkst_logger.warning(f"Clean shutdown took {time.monotonic() - shutdown_started:.2f}s (undebug all: {results})")
 
 if __name__ == "__main__":
     config_loader = ConfigLoader()
     devices = config_loader.get_devices()
     config = config_loader.get_configuration()
-    wkst_logger = DeviceLogger.get_logger("workstation", config['output_dir'], config.get('console_level', None), format = config['log_format'])
+    configure_logging(config)
+    wkst_logger = DeviceLogger.get_logger("workstation", config['output_dir'], config.get('console_level', None), format = config['log_format'], binary = False)
+    # Hot path instrumentation: periodic dump to the workstation log and/or JSON on http://127.0.0.1:<stats_port>/stats
+    if config.get('stats_interval') or config.get('stats_port'):
+        Stats.enable()
+        if config.get('stats_interval'):
+            Stats.start_reporter(wkst_logger, config['stats_interval'], shutdown_event)
+        if config.get('stats_port'):
+            Stats.start_server(config['stats_port'])
+    # Hot reload of regex_patterns and alert_strings: the config file is checked every config_reload_interval seconds
+    if config.get('config_reload_interval'):
+        ConfigWatcher(config['config_reload_interval'], shutdown_event, wkst_logger).start()
+    # Roam episodes across devices: roam_start events paired with the roam_end events that follow, in their own log
+    if config.get('roam_start'):
+        roam_logger = DeviceLogger.get_logger("roams", config['output_dir'], config.get('console_level', None), format = config['log_format'], binary = False)
+        # Worker processes publish through a multiprocessing queue to the correlator in this process
+        roam_queue = multiprocessing.get_context('spawn').Queue() if config.get('worker_processes', 1) > 1 else None
+        RoamCorrelator.start(config, roam_logger, roam_queue)
     signal.signal(signal.SIGINT, signal_handler(wkst_logger))
     main(wkst_logger)
+    RoamCorrelator.stop()
+    DeviceLogger.stop_queue()
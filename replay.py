@@ -0,0 +1,135 @@
+import argparse, re, resource, tempfile, threading, time
+from datetime import datetime
+from ConfigurationLoader import ConfigLoader
+from DeviceLogger import DeviceLogger
+from Stats import Stats
+
+# Timestamps found in captures: the logging format of debug.log and the AP kernel stamp
+LOG_TIMESTAMP_REGEX = re.compile(r"^(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d,\d{3})")
+KERNEL_TIMESTAMP_REGEX = re.compile(r"\[\*(\d\d/\d\d/\d{4} \d\d:\d\d:\d\d\.\d+)\]")
+
+def line_timestamp(line):
+    """ Returns the recorded time of a capture line in seconds, or None if it has no timestamp. """
+    match = LOG_TIMESTAMP_REGEX.match(line)
+    if match:
+        return datetime.strptime(match.group(1), '%Y-%m-%d %H:%M:%S,%f').timestamp()
+    match = KERNEL_TIMESTAMP_REGEX.search(line)
+    if match:
+        return datetime.strptime(match.group(1), '%m/%d/%Y %H:%M:%S.%f').timestamp()
+    return None
+
+def load_reads(capture_file):
+    """
+    Splits a capture file (debug.log or a netmiko session log) into the reads a device would
+    have produced: consecutive lines with the same recorded timestamp form one read.
+
+    :return: List of (recorded time or None, text of the read)
+    """
+    reads = []
+    current_time, current_lines = None, []
+    with open(capture_file, 'r', errors='replace') as file:
+        for line in file:
+            timestamp = line_timestamp(line)
+            if timestamp is not None and timestamp != current_time and current_lines:
+                reads.append((current_time, "".join(current_lines)))
+                current_lines = []
+            if timestamp is not None:
+                current_time = timestamp
+            current_lines.append(line)
+    if current_lines:
+        reads.append((current_time, "".join(current_lines)))
+    return reads
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+class ReplayDevice:
+
+    def __init__(self, ip, reads, shutdown_event, realtime=False, speed=1.0):
+        """
+        Fake device that pushes recorded reads through DeviceMonitor.process_output, either at
+        the recorded pace (scaled by speed) or as fast as possible, timing every tracker line.
+        """
+        # DeviceMonitor is imported here so that --help works without netmiko installed
+        from DeviceMonitor import DeviceMonitor
+        self.monitor = DeviceMonitor({'ip': ip}, shutdown_event)
+        self.reads = reads
+        self.realtime = realtime
+        self.speed = speed
+        self.latencies = []
+        tracker = self.monitor.tracker
+        process_line = tracker.process_line
+        latencies = self.latencies
+        def timed_process_line(line):
+            start = time.perf_counter_ns()
+            process_line(line)
+            latencies.append(time.perf_counter_ns() - start)
+        tracker.process_line = timed_process_line
+
+    def run(self):
+        first_recorded = next((recorded for recorded, _ in self.reads if recorded is not None), None)
+        start = time.monotonic()
+        for recorded, text in self.reads:
+            if self.realtime and recorded is not None and first_recorded is not None:
+                delay = (recorded - first_recorded) / self.speed - (time.monotonic() - start)
+                if delay > 0:
+                    time.sleep(delay)
+            self.monitor.process_output(text)
+            self.monitor.tick()
+        self.monitor.flush_output()
+        self.monitor.tracker.finish()
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay captured device output through DeviceMonitor, RegexMessageTracker and DeviceLogger.")
+    parser.add_argument('captures', nargs='+', help="capture files (debug.log, netmiko session logs)")
+    parser.add_argument('--config', default='config.json', help="config file providing the tracker and logging settings")
+    parser.add_argument('--devices', type=int, default=None, help="number of fake devices, captures are shared round robin (default one per capture)")
+    parser.add_argument('--realtime', action='store_true', help="replay at the recorded timestamps instead of as fast as possible")
+    parser.add_argument('--speed', type=float, default=1.0, help="speed up factor for --realtime")
+    parser.add_argument('--stats', action='store_true', help="enable hot path instrumentation and print the per device summary")
+    parser.add_argument('--output-dir', default=None, help="where device logs go (default a new temporary directory)")
+    args = parser.parse_args()
+
+    config = ConfigLoader(args.config).get_configuration()
+    config['output_dir'] = args.output_dir or tempfile.mkdtemp(prefix='replay_')
+    config['console_level'] = None
+    config['log_netmiko'] = False
+    config['debug_netmiko'] = False
+    # Logging is set up exactly as monitor_terminal_4 does it so the logger settings are part of the benchmark
+    import monitor_terminal_4
+    monitor_terminal_4.configure_logging(config)
+
+    if args.stats:
+        Stats.enable()
+    captures = [load_reads(capture) for capture in args.captures]
+    device_count = args.devices or len(captures)
+    shutdown_event = threading.Event()
+    devices = [ReplayDevice(f"10.0.{index // 250}.{index % 250 + 1}", captures[index % len(captures)], shutdown_event, args.realtime, args.speed)
+               for index in range(device_count)]
+    threads = [threading.Thread(target=device.run) for device in devices]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    DeviceLogger.stop_queue()
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(latency for device in devices for latency in device.latencies)
+    peak_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f"devices:          {device_count}")
+    print(f"lines:            {len(latencies)}")
+    print(f"elapsed:          {elapsed:.3f}s")
+    print(f"throughput:       {len(latencies) / elapsed:,.0f} lines/sec")
+    print(f"latency p50:      {percentile(latencies, 0.50) / 1000:.1f} us")
+    print(f"latency p99:      {percentile(latencies, 0.99) / 1000:.1f} us")
+    print(f"peak RSS:         {peak_rss_kb / 1024:.1f} MB")
+    print(f"device logs:      {config['output_dir']}")
+    if args.stats:
+        for line in Stats.summary_lines():
+            print(line)
+
+if __name__ == "__main__":
+    main()